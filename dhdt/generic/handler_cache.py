@@ -0,0 +1,309 @@
+# generic libraries
+import functools
+import inspect
+import os
+import tempfile
+from collections import OrderedDict
+
+import numpy as np
+
+class ArrayCache(object):
+    """ bounded store of arrays, where the arrays that were used the longest
+    time ago are dropped, or moved towards memory-mapped files on disk
+
+    Parameters
+    ----------
+    max_bytes : integer, default=2**28
+        amount of memory the arrays are allowed to occupy
+    directory : string, optional
+        location of the memory-mapped files, when given, arrays that do not
+        fit in memory are spilled to disk instead of dropped. When an empty
+        string is given, a temporary directory is used
+    slots : integer, default=1024
+        amount of arrays per memory-mapped file
+
+    Attributes
+    ----------
+    hits : integer
+        amount of look-ups that were found in memory
+    disk_hits : integer
+        amount of look-ups that were found on disk
+    misses : integer
+        amount of look-ups that were not found
+
+    Notes
+    -----
+    The keys can be any hashable object, though a tuple with a description of
+    the array is intended, for example: (scene id, post index, template size,
+    preprocessing). The arrays are stored read-only, thus should not be
+    changed by the caller.
+
+    Example
+    -------
+    >>> import numpy as np
+    >>> cache = ArrayCache(max_bytes=2**20)
+    >>> cache.put(('S2A_T05VMG', 0, 16, 'perdecomp'), np.ones((16, 16)))
+    >>> A = cache.get(('S2A_T05VMG', 0, 16, 'perdecomp'))
+    >>> cache.stats()
+    {'hits': 1, 'disk_hits': 0, 'misses': 0, 'memory': 1, 'disk': 0}
+    """
+    def __init__(self, max_bytes=2**28, directory=None, slots=1024):
+        self.max_bytes = max_bytes
+        self.slots = slots
+        if directory == '':
+            directory = tempfile.mkdtemp(prefix='dhdt_cache_')
+        self.directory = directory
+
+        self.memory = OrderedDict()
+        self.memory_bytes = 0
+        self.disk = {}        # key -> (store, slot)
+        self.stores = {}      # (shape, dtype) -> list of memory-mapped files
+        self.store_counts = {}
+        self.hits, self.disk_hits, self.misses = 0, 0, 0
+
+    def __contains__(self, key):
+        return (key in self.memory) or (key in self.disk)
+
+    def __len__(self):
+        return len(set(self.memory) | set(self.disk))
+
+    def get(self, key, default=None):
+        """ look up an array
+
+        Parameters
+        ----------
+        key : hashable
+            description of the array
+        default : optional
+            what to return, when the array is not present
+
+        Returns
+        -------
+        A : numpy.array
+            read-only array
+        """
+        if key in self.memory:
+            self.memory.move_to_end(key)
+            self.hits += 1
+            return self.memory[key]
+        if key in self.disk:
+            self.disk_hits += 1
+            store, slot = self.disk[key]
+            A = np.array(self.stores[store][slot // self.slots]
+                         [slot % self.slots])
+            self._put_in_memory(key, A)
+            return self.memory[key]
+        self.misses += 1
+        return default
+
+    def put(self, key, A):
+        """ store an array
+
+        Parameters
+        ----------
+        key : hashable
+            description of the array
+        A : numpy.array
+            data array, which is copied
+
+        Returns
+        -------
+        A : numpy.array
+            read-only copy of the array, as stored
+        """
+        assert isinstance(A, np.ndarray), ('please provide an array')
+        self.disk.pop(key, None)  # a spilled version would be outdated
+        A = np.array(A)
+        self._put_in_memory(key, A)
+        return A
+
+    def get_stack(self, keys, func):
+        """ look up a collection of arrays with the same shape, while the
+        missing arrays are calculated and stored
+
+        Parameters
+        ----------
+        keys : list
+            descriptions of the arrays
+        func : function
+            calculates the missing arrays, its argument is an array with the
+            positions of the missing keys within "keys", and it returns a
+            stack of arrays for these positions
+
+        Returns
+        -------
+        A : numpy.array, size=(k,m,n)
+            stack of arrays
+        """
+        arrays = [self.get(key) for key in keys]
+        missing = np.array([A is None for A in arrays], dtype=bool)
+        if np.any(missing):
+            idx = np.flatnonzero(missing)
+            A_new = func(idx)
+            for count, pos in enumerate(idx):
+                self.put(keys[pos], A_new[count])
+                arrays[pos] = A_new[count]
+        return np.stack(arrays)
+
+    def stats(self):
+        """ get the statistics of the cache
+
+        Returns
+        -------
+        stats : dictionary
+            amount of hits in memory and on disk, misses, and the amount of
+            arrays in memory and on disk
+        """
+        return {'hits': self.hits, 'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'memory': len(self.memory), 'disk': len(self.disk)}
+
+    def clear(self):
+        """ remove all arrays, including the memory-mapped files
+        """
+        self.memory.clear()
+        self.memory_bytes = 0
+        paths = [mm.filename for files in self.stores.values()
+                 for mm in files]
+        self.disk, self.stores, self.store_counts = {}, {}, {}
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _put_in_memory(self, key, A):
+        A.setflags(write=False)
+        if key in self.memory:
+            self.memory_bytes -= self.memory.pop(key).nbytes
+        self.memory[key] = A
+        self.memory_bytes += A.nbytes
+
+        while (self.memory_bytes > self.max_bytes) and \
+                (len(self.memory) > 1):
+            key_old, A_old = self.memory.popitem(last=False)
+            self.memory_bytes -= A_old.nbytes
+            if (self.directory is not None) and (key_old not in self.disk):
+                self._put_on_disk(key_old, A_old)
+
+    def _put_on_disk(self, key, A):
+        store = (A.shape, A.dtype.str)
+        files = self.stores.setdefault(store, [])
+        slot = self.store_counts.get(store, 0)
+        if slot // self.slots == len(files):  # open a new file
+            os.makedirs(self.directory, exist_ok=True)
+            shape_str = 'x'.join([str(s) for s in A.shape])
+            path = os.path.join(self.directory,
+                                f'cache_{shape_str}_{A.dtype.name}_'
+                                f'{len(files):04d}_{id(self)}.dat')
+            files.append(np.memmap(path, dtype=A.dtype, mode='w+',
+                                   shape=(self.slots,) + A.shape))
+        files[slot // self.slots][slot % self.slots] = A
+        self.store_counts[store] = slot + 1
+        self.disk[key] = (store, slot)
+
+# auxiliary arrays, like windows and grids, that only depend upon the shape
+# of the data and some parameters
+MEMO_CACHE = ArrayCache(max_bytes=2**26)
+MEMO_TUPLES = set()
+
+def describe_argument(value):
+    """ describe an argument of a memoized function, where arrays are
+    described by their shape and data type, and not by their content
+
+    Parameters
+    ----------
+    value : any
+        argument of the function
+
+    Returns
+    -------
+    description : hashable
+    """
+    if isinstance(value, np.ndarray):
+        return ('array', value.shape, value.dtype.str)
+    return value
+
+def memoize_arrays(func):
+    """ decorator for functions that create auxiliary arrays, that only
+    depend upon the shape and data type of their array arguments, and on
+    their other parameters. The outcome is calculated once, and afterwards
+    taken from a bounded cache
+
+    Parameters
+    ----------
+    func : function
+        creates an array, or a tuple of arrays with equal shape
+
+    Returns
+    -------
+    memoized : function
+        the same function, though with read-only output
+
+    See Also
+    --------
+    get_memo_stats, clear_memo
+
+    Notes
+    -----
+    The content of array arguments is not looked at, thus only functions that
+    use an array for its dimensions can be memoized. The output can not be
+    changed in place by the caller, hence a copy is needed for this.
+
+    Example
+    -------
+    >>> import numpy as np
+    >>> @memoize_arrays
+    ... def ones_like(I, scale=1.):
+    ...     return scale*np.ones_like(I, dtype=float)
+    >>> W = ones_like(np.zeros((2**4, 2**4)))
+    >>> W = ones_like(np.zeros((2**4, 2**4)))
+    >>> get_memo_stats()['hits']
+    1
+    """
+    signature = inspect.signature(func)
+    name = (func.__module__, func.__qualname__)
+
+    @functools.wraps(func)
+    def memoized(*args, **kwargs):
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        key = name + tuple((arg, describe_argument(value))
+                           for arg, value in bound.arguments.items())
+        try:
+            A = MEMO_CACHE.get(key)
+        except TypeError:  # unhashable parameters, thus not memoized
+            return func(*args, **kwargs)
+
+        if A is None:
+            A = func(*args, **kwargs)
+            if isinstance(A, tuple):
+                MEMO_TUPLES.add(name)
+                A = np.stack(A)
+            A = MEMO_CACHE.put(key, A)
+        if name in MEMO_TUPLES:
+            return tuple(A)
+        return A
+    return memoized
+
+def get_memo_stats():
+    """ get the statistics of the cache with auxiliary arrays
+
+    Returns
+    -------
+    stats : dictionary
+        amount of hits, misses and stored arrays, see "ArrayCache.stats"
+
+    See Also
+    --------
+    memoize_arrays, clear_memo
+    """
+    return MEMO_CACHE.stats()
+
+def clear_memo():
+    """ remove all auxiliary arrays from the cache, and reset its statistics
+
+    See Also
+    --------
+    memoize_arrays, get_memo_stats
+    """
+    MEMO_CACHE.clear()
+    MEMO_CACHE.hits, MEMO_CACHE.disk_hits, MEMO_CACHE.misses = 0, 0, 0
@@ -0,0 +1,171 @@
+# generic libraries
+import json
+import os
+
+import numpy as np
+
+class CheckpointStore(object):
+    """ on-disk store for a grid of results that is filled block by block,
+    with a manifest of the finished blocks, so an interrupted run can resume
+
+    Parameters
+    ----------
+    directory : string
+        location of the store, it is created when it does not exist
+    shape : tuple, size=(2,)
+        dimension of the grid
+    block_rows : integer
+        amount of grid rows within a block
+    settings : dictionary, optional
+        description of the run, which needs to be the same when resuming, so
+        a store is not continued with other parameters
+
+    Attributes
+    ----------
+    layers : dictionary
+        memory-mapped arrays of the results, stored as .npy files
+    done : list
+        indices of the finished blocks
+
+    See Also
+    --------
+    ..processing.coupling_tools.match_pair_streaming
+
+    Notes
+    -----
+    A block is only registered in the manifest after its results are flushed
+    to disk, and the manifest itself is replaced at once, hence a crash can
+    at most lose the block that was being processed.
+
+    Example
+    -------
+    >>> import numpy as np
+    >>> store = CheckpointStore('/tmp/run', (100, 80), block_rows=10)
+    >>> for block in store.todo():
+    ...     rows = store.get_rows(block)
+    ...     store.write_block(block, {'score': np.ones((10, 80))})
+    >>> score = store.layers['score']
+    """
+    manifest_name = 'manifest.json'
+
+    def __init__(self, directory, shape, block_rows, settings=None):
+        self.directory = directory
+        self.shape = tuple(int(s) for s in shape)
+        self.block_rows = int(block_rows)
+        self.settings = {} if settings is None else settings
+        self.layers, self.dtypes, self.done = {}, {}, []
+
+        os.makedirs(directory, exist_ok=True)
+        manifest = self.read_manifest()
+        if manifest is None:
+            self.write_manifest()
+            return
+        assert (tuple(manifest['shape']) == self.shape) and \
+            (manifest['block_rows'] == self.block_rows) and \
+            (manifest['settings'] == json.loads(json.dumps(self.settings))), \
+            ('the store at ' + directory + ' is made with other settings')
+        self.done = manifest['done']
+        for name, (dtype, shape) in manifest['layers'].items():
+            self.dtypes[name] = (dtype, tuple(shape))
+            self.layers[name] = np.load(self._layer_path(name), mmap_mode='r+')
+
+    @property
+    def n_blocks(self):
+        return int(np.ceil(self.shape[0] / self.block_rows))
+
+    def get_rows(self, block):
+        """ get the grid rows of a block
+
+        Parameters
+        ----------
+        block : integer
+            index of the block
+
+        Returns
+        -------
+        rows : slice
+            rows of the grid
+        """
+        return slice(block*self.block_rows,
+                     min((block+1)*self.block_rows, self.shape[0]))
+
+    def todo(self):
+        """ get the blocks that are not finished
+
+        Returns
+        -------
+        blocks : list
+            indices of the blocks
+        """
+        return [block for block in range(self.n_blocks)
+                if block not in self.done]
+
+    def write_block(self, block, arrays):
+        """ write the results of a block, and register it as finished
+
+        Parameters
+        ----------
+        block : integer
+            index of the block
+        arrays : dictionary
+            results of the block, with the name of the layer as key, and an
+            array of size=(r,n) or (r,n,b) as value
+        """
+        rows = self.get_rows(block)
+        for name, A in arrays.items():
+            A = np.asarray(A)
+            if name not in self.layers:
+                self._create_layer(name, A)
+            self.layers[name][rows] = A
+            self.layers[name].flush()
+        self.done.append(int(block))
+        self.write_manifest()
+
+    def read_manifest(self):
+        path = os.path.join(self.directory, self.manifest_name)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r') as f:
+            return json.load(f)
+
+    def write_manifest(self):
+        manifest = {'shape': self.shape, 'block_rows': self.block_rows,
+                    'settings': self.settings, 'done': self.done,
+                    'layers': {name: [dtype, shape] for name, (dtype, shape)
+                               in self.dtypes.items()}}
+        path = os.path.join(self.directory, self.manifest_name)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(manifest, f, indent=1)
+        os.replace(path + '.tmp', path)  # replace at once
+
+    def export_geotiff(self, geoTransform, crs, names=None):
+        """ write the layers towards GeoTIFF files within the store
+
+        Parameters
+        ----------
+        geoTransform : tuple
+            affine transformation coefficients of the grid
+        crs : string
+            coordinate reference string
+        names : list, optional
+            layers to export, by default all
+
+        See Also
+        --------
+        .mapping_io.make_geo_im
+        """
+        from .mapping_io import make_geo_im  # gdal is only needed here
+
+        names = self.layers.keys() if names is None else names
+        for name in names:
+            make_geo_im(np.asarray(self.layers[name]), geoTransform, crs,
+                        os.path.join(self.directory, name + '.tif'))
+
+    def _layer_path(self, name):
+        return os.path.join(self.directory, name + '.npy')
+
+    def _create_layer(self, name, A):
+        shape = self.shape + A.shape[2:]
+        self.layers[name] = np.lib.format.open_memmap(
+            self._layer_path(name), mode='w+', dtype=A.dtype, shape=shape)
+        self.dtypes[name] = (A.dtype.str, shape)
@@ -0,0 +1,360 @@
+# generic libraries
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import numpy as np
+import scipy.fft
+
+from .handler_multiprocessing import get_number_of_workers
+
+# pyFFTW is optional, when it is not installed its backend is not available
+try:
+    import pyfftw
+    import pyfftw.builders
+except ImportError:
+    pyfftw = None
+
+FFT_SETTINGS = {'backend': 'numpy', 'workers': None}
+FFTW_PLANS = OrderedDict()
+FFTW_PLANS_MAX = 64
+
+def list_fft_backends():
+    """ list the implementations of the fast Fourier transform, that can be
+    used within this environment
+
+    Returns
+    -------
+    backends : list of strings
+        names of the backends, "pyfftw" is only present when installed
+
+    See Also
+    --------
+    set_fft_backend, get_fft_backend
+    """
+    backends = ['numpy', 'scipy']
+    if pyfftw is not None:
+        backends += ['pyfftw']
+    return backends
+
+def set_fft_backend(backend='numpy', workers=None):
+    """ set the implementation of the fast Fourier transform, that is used by
+    the frequency based correlators and filters of this package
+
+    Parameters
+    ----------
+    backend : {'numpy', 'scipy', 'pyfftw'}, default='numpy'
+        name of the backend, see "list_fft_backends"
+    workers : integer, optional
+        amount of threads for a single transform, when negative all available
+        cores are used, this is not used by the "numpy" backend
+
+    See Also
+    --------
+    fft_backend : set the backend temporary, in a with-statement
+
+    Notes
+    -----
+    The "scipy" and "pyfftw" backends keep single precision data single,
+    while older versions of numpy promote towards double precision. The
+    "pyfftw" backend plans a transform once for each shape and data type, and
+    re-uses this plan for every following array of the same kind.
+
+    When a process pool is used, see "map_on_shared_arrays", each process has
+    its own backend setting, hence keep "workers" low.
+
+    Example
+    -------
+    >>> import numpy as np
+    >>> set_fft_backend('scipy', workers=4)
+    >>> S = fft2(np.random.random((2**5, 2**5)))
+    >>> set_fft_backend('numpy')
+    """
+    assert backend in list_fft_backends(), \
+        ('please provide a valid backend, thus: ' +
+         f' { {*list_fft_backends()} }')
+    FFT_SETTINGS['backend'] = backend
+    FFT_SETTINGS['workers'] = workers
+
+def get_fft_backend():
+    """ get the implementation of the fast Fourier transform, that is in use
+
+    Returns
+    -------
+    backend : string
+        name of the backend
+    workers : integer
+        amount of threads for a single transform
+    """
+    return FFT_SETTINGS['backend'], FFT_SETTINGS['workers']
+
+@contextmanager
+def fft_backend(backend='numpy', workers=None):
+    """ temporary use another implementation of the fast Fourier transform
+
+    Parameters
+    ----------
+    backend : {'numpy', 'scipy', 'pyfftw'}, default='numpy'
+        name of the backend, see "list_fft_backends"
+    workers : integer, optional
+        amount of threads for a single transform
+
+    Example
+    -------
+    >>> import numpy as np
+    >>> from ..processing.matching_tools_frequency_correlators import \
+            phase_corr
+    >>> I1, I2 = np.random.random((2, 2**6, 2**6))
+    >>> with fft_backend('scipy', workers=-1):
+    ...     Q = phase_corr(I1, I2)
+    """
+    previous = get_fft_backend()
+    set_fft_backend(backend, workers)
+    try:
+        yield
+    finally:
+        set_fft_backend(*previous)
+
+def get_fftw_plan(kind, A, s=None, axes=(-2, -1), workers=None):
+    """ get a planned transform of pyFFTW, which is created once for every
+    type of transform, array shape and data type, and stored afterwards
+
+    Parameters
+    ----------
+    kind : {'fft', 'ifft', 'fft2', 'ifft2', 'rfft2', 'irfft2'}
+        type of transform
+    A : numpy.array
+        array to transform
+    s : tuple, optional
+        shape of the output along the transformed axes
+    axes : tuple, default=(-2,-1)
+        axes to transform over
+    workers : integer, optional
+        amount of threads
+
+    Returns
+    -------
+    plan : pyfftw.FFTW
+        planned transform, which can be called with an array
+
+    Notes
+    -----
+    The amount of plans that is kept is bounded by "FFTW_PLANS_MAX", the plan
+    that was used the longest time ago is removed first.
+    """
+    threads = get_number_of_workers(workers) if workers is not None else 1
+    key = (kind, A.shape, A.dtype.str, s, axes, threads)
+    if key in FFTW_PLANS:
+        FFTW_PLANS.move_to_end(key)
+        return FFTW_PLANS[key]
+
+    builder = getattr(pyfftw.builders, kind)
+    if kind in ('fft', 'ifft'):
+        plan = builder(A, n=s, axis=axes, threads=threads,
+                       planner_effort='FFTW_MEASURE')
+    else:
+        plan = builder(A, s=s, axes=axes, threads=threads,
+                       planner_effort='FFTW_MEASURE')
+    FFTW_PLANS[key] = plan
+    if len(FFTW_PLANS) > FFTW_PLANS_MAX:
+        FFTW_PLANS.popitem(last=False)
+    return plan
+
+def _transform(kind, A, s=None, axes=(-2, -1), backend=None, workers=None):
+    if backend is None:
+        backend, workers_set = get_fft_backend()
+        workers = workers_set if workers is None else workers
+    if backend == 'numpy':
+        if kind in ('fft', 'ifft'):
+            return getattr(np.fft, kind)(A, n=s, axis=axes)
+        return getattr(np.fft, kind)(A, s=s, axes=axes)
+    if workers is not None:
+        workers = get_number_of_workers(workers)
+    if backend == 'scipy':
+        if kind in ('fft', 'ifft'):
+            return getattr(scipy.fft, kind)(A, n=s, axis=axes,
+                                            workers=workers)
+        return getattr(scipy.fft, kind)(A, s=s, axes=axes, workers=workers)
+    assert backend == 'pyfftw' and pyfftw is not None, \
+        ('please provide a valid backend, thus: ' +
+         f' { {*list_fft_backends()} }')
+    plan = get_fftw_plan(kind, A, s=s, axes=axes, workers=workers)
+    # the plan writes in its own output array, which is re-used by the next
+    # call, hence a copy is returned
+    return plan(A).copy()
+
+def fft(A, n=None, axis=-1, backend=None, workers=None):
+    """ one dimensional discrete Fourier transform
+
+    Parameters
+    ----------
+    A : numpy.array
+        data array
+    n : integer, optional
+        length of the transformed axis
+    axis : integer, default=-1
+        axis to transform over
+    backend : {'numpy', 'scipy', 'pyfftw'}, optional
+        implementation to use, by default the one set by "set_fft_backend"
+    workers : integer, optional
+        amount of threads
+
+    Returns
+    -------
+    S : numpy.array, dtype=complex
+        spectrum
+
+    See Also
+    --------
+    numpy.fft.fft, ifft
+    """
+    return _transform('fft', A, s=n, axes=axis, backend=backend,
+                      workers=workers)
+
+def ifft(S, n=None, axis=-1, backend=None, workers=None):
+    """ one dimensional inverse discrete Fourier transform
+
+    Parameters
+    ----------
+    S : numpy.array, dtype=complex
+        spectrum
+    n : integer, optional
+        length of the transformed axis
+    axis : integer, default=-1
+        axis to transform over
+    backend : {'numpy', 'scipy', 'pyfftw'}, optional
+        implementation to use, by default the one set by "set_fft_backend"
+    workers : integer, optional
+        amount of threads
+
+    Returns
+    -------
+    A : numpy.array, dtype=complex
+        data array
+
+    See Also
+    --------
+    numpy.fft.ifft, fft
+    """
+    return _transform('ifft', S, s=n, axes=axis, backend=backend,
+                      workers=workers)
+
+def fft2(A, s=None, axes=(-2, -1), backend=None, workers=None):
+    """ two dimensional discrete Fourier transform, which can be applied to
+    a stack of arrays, as only the last two axes are transformed by default
+
+    Parameters
+    ----------
+    A : numpy.array, size=(m,n) or size=(k,m,n)
+        data array
+    s : tuple, optional
+        shape of the output along the transformed axes
+    axes : tuple, default=(-2,-1)
+        axes to transform over
+    backend : {'numpy', 'scipy', 'pyfftw'}, optional
+        implementation to use, by default the one set by "set_fft_backend"
+    workers : integer, optional
+        amount of threads
+
+    Returns
+    -------
+    S : numpy.array, dtype=complex
+        spectrum
+
+    See Also
+    --------
+    numpy.fft.fft2, ifft2, rfft2
+    """
+    return _transform('fft2', A, s=s, axes=axes, backend=backend,
+                      workers=workers)
+
+def ifft2(S, s=None, axes=(-2, -1), backend=None, workers=None):
+    """ two dimensional inverse discrete Fourier transform
+
+    Parameters
+    ----------
+    S : numpy.array, size=(m,n) or size=(k,m,n), dtype=complex
+        spectrum
+    s : tuple, optional
+        shape of the output along the transformed axes
+    axes : tuple, default=(-2,-1)
+        axes to transform over
+    backend : {'numpy', 'scipy', 'pyfftw'}, optional
+        implementation to use, by default the one set by "set_fft_backend"
+    workers : integer, optional
+        amount of threads
+
+    Returns
+    -------
+    A : numpy.array, dtype=complex
+        data array
+
+    See Also
+    --------
+    numpy.fft.ifft2, fft2, irfft2
+    """
+    return _transform('ifft2', S, s=s, axes=axes, backend=backend,
+                      workers=workers)
+
+def rfft2(A, s=None, axes=(-2, -1), backend=None, workers=None):
+    """ two dimensional discrete Fourier transform of real data, where only
+    the non-negative frequencies of the last axis are computed
+
+    Parameters
+    ----------
+    A : numpy.array, size=(m,n) or size=(k,m,n), dtype=float
+        data array
+    s : tuple, optional
+        shape of the input along the transformed axes
+    axes : tuple, default=(-2,-1)
+        axes to transform over
+    backend : {'numpy', 'scipy', 'pyfftw'}, optional
+        implementation to use, by default the one set by "set_fft_backend"
+    workers : integer, optional
+        amount of threads
+
+    Returns
+    -------
+    S : numpy.array, size=(m,n//2+1), dtype=complex
+        half of the spectrum, the other half is its complex conjugate
+
+    See Also
+    --------
+    numpy.fft.rfft2, irfft2, fft2
+
+    Notes
+    -----
+    A spectrum of a real signal is Hermitian, hence the half spectrum is
+    sufficient, when the multiplications and filters applied on it are real
+    and symmetric. This gives a transform that is about twice as fast.
+    """
+    return _transform('rfft2', A, s=s, axes=axes, backend=backend,
+                      workers=workers)
+
+def irfft2(S, s=None, axes=(-2, -1), backend=None, workers=None):
+    """ two dimensional inverse discrete Fourier transform towards real data
+
+    Parameters
+    ----------
+    S : numpy.array, size=(m,n//2+1), dtype=complex
+        half of the spectrum, see "rfft2"
+    s : tuple, optional
+        shape of the output along the transformed axes, which should be given
+        when the last axis of the original array has an odd length
+    axes : tuple, default=(-2,-1)
+        axes to transform over
+    backend : {'numpy', 'scipy', 'pyfftw'}, optional
+        implementation to use, by default the one set by "set_fft_backend"
+    workers : integer, optional
+        amount of threads
+
+    Returns
+    -------
+    A : numpy.array, size=(m,n), dtype=float
+        data array
+
+    See Also
+    --------
+    numpy.fft.irfft2, rfft2, ifft2
+    """
+    return _transform('irfft2', S, s=s, axes=axes, backend=backend,
+                      workers=workers)
@@ -234,19 +234,20 @@ def bilinear_interpolation(I, di, dj):
     I : np.array, size=(m,n), ndim={2,3}
         data array.
     di :
-        * np.array, size=(k,l), ndim=2
+        * np.array, size=(k,l) or (p,k,l)
             vertical locations, within local image frame.
         * float
             uniform horizontal displacement
     dj :
-        * np.array, size=(k,l), ndim=2
+        * np.array, size=(k,l) or (p,k,l)
             horizontal locations, within local image frame.
         * float
             uniform horizontal displacement
     Returns
     -------
-    I_new : np.array, size=(k,l), ndim=2, dtype={float,complex}
-        interpolated values.
+    I_new : np.array, size=(k,l) or (p,k,l), dtype={float,complex}
+        interpolated values, for a multi-band array the bands are placed
+        along an extra last axis.
 
     See Also
     --------
@@ -292,11 +293,9 @@ def bilinear_interpolation(I, di, dj):
     wa,wb,wc,wd = (j1-dj)*(i1-di), (j1-dj)*(di-i0), (dj-j0)*(i1-di), \
                   (dj-j0)*(di-i0)
 
-    if I.ndim==3:
-        wa = np.repeat(wa[:, :, np.newaxis], I.shape[2], axis=2)
-        wb = np.repeat(wb[:, :, np.newaxis], I.shape[2], axis=2)
-        wc = np.repeat(wc[:, :, np.newaxis], I.shape[2], axis=2)
-        wd = np.repeat(wd[:, :, np.newaxis], I.shape[2], axis=2)
+    if I.ndim==3: # locations can be a stack, thus extend the last axis
+        wa, wb = wa[..., np.newaxis], wb[..., np.newaxis]
+        wc, wd = wc[..., np.newaxis], wd[..., np.newaxis]
 
     I_new = wa*Ia + wb*Ib + wc*Ic + wd*Id
     return I_new
@@ -0,0 +1,177 @@
+# generic libraries
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+def get_number_of_workers(n_workers=None):
+    """ get the amount of processes to use, bounded by the available cores
+
+    Parameters
+    ----------
+    n_workers : integer, optional
+        requested amount of processes, when negative or None, all available
+        cores are used
+
+    Returns
+    -------
+    n_workers : integer
+        amount of processes
+    """
+    n_cores = os.cpu_count() or 1
+    if (n_workers is None) or (n_workers < 1):
+        return n_cores
+    return int(np.minimum(n_workers, n_cores))
+
+def create_shared_array(A):
+    """ copy an array into a block of shared memory, so other processes can
+    read it without the array being pickled
+
+    Parameters
+    ----------
+    A : numpy.array, size=(m,n), ndim={2,3}
+        data array
+
+    Returns
+    -------
+    shm : multiprocessing.shared_memory.SharedMemory
+        handle of the block, which should be kept alive by the caller and
+        released afterwards, see "release_shared_arrays"
+    spec : tuple, size=(3,)
+        name, shape and dtype of the array, which can be send to other
+        processes, see "attach_shared_array"
+
+    Example
+    -------
+    >>> import numpy as np
+    >>> A = np.random.random((2**8, 2**8))
+    >>> shm, spec = create_shared_array(A)
+    >>> shm_other, B = attach_shared_array(spec)
+    >>> assert np.all(A == B)
+    >>> del B  # views need to be removed, before the block can be closed
+    >>> release_shared_arrays([shm_other])
+    >>> release_shared_arrays([shm], unlink=True)
+
+    Notes
+    -----
+    Shared memory is only available from Python 3.8 onwards, hence it is
+    imported here, so the other functions of this module remain usable.
+    """
+    from multiprocessing import shared_memory
+
+    assert isinstance(A, np.ndarray), ('please provide an array')
+    A = np.ascontiguousarray(A)
+    shm = shared_memory.SharedMemory(create=True, size=max(A.nbytes, 1))
+    B = np.ndarray(A.shape, dtype=A.dtype, buffer=shm.buf)
+    B[...] = A
+    spec = (shm.name, A.shape, A.dtype.str)
+    return shm, spec
+
+def attach_shared_array(spec):
+    """ get access to an array that lives in a block of shared memory
+
+    Parameters
+    ----------
+    spec : tuple, size=(3,)
+        name, shape and dtype of the array, see "create_shared_array"
+
+    Returns
+    -------
+    shm : multiprocessing.shared_memory.SharedMemory
+        handle of the block, which needs to be closed after use
+    A : numpy.array
+        data array, that shares its memory with the block
+    """
+    from multiprocessing import shared_memory
+
+    name, shape, dtype = spec
+    shm = shared_memory.SharedMemory(name=name)
+    A = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+    return shm, A
+
+def release_shared_arrays(shms, unlink=False):
+    """ close the blocks of shared memory, and free them when not needed
+
+    Parameters
+    ----------
+    shms : list
+        collection of multiprocessing.shared_memory.SharedMemory
+    unlink : bool, default=False
+        free the memory, which should only be done by the creating process
+    """
+    for shm in shms:
+        shm.close()
+        if unlink:
+            shm.unlink()
+
+def run_on_shared_arrays(func, specs, *args, **kwargs):
+    """ execute a function upon arrays that reside in shared memory
+
+    Parameters
+    ----------
+    func : function
+        function to execute, its first arguments are the shared arrays
+    specs : list
+        name, shape and dtype of the shared arrays, see "create_shared_array"
+    args, kwargs :
+        other arguments for the function
+
+    Returns
+    -------
+    output : the output of the function
+    """
+    shms, arrays = [], []
+    try:
+        for spec in specs:
+            shm, A = attach_shared_array(spec)
+            shms.append(shm)
+            arrays.append(A)
+            del A  # only the list holds a view
+        output = func(*arrays, *args, **kwargs)
+    finally:
+        arrays.clear()  # views need to be removed, before closing
+        release_shared_arrays(shms)
+    return output
+
+def map_on_shared_arrays(func, arrays, tasks, n_workers=None, **kwargs):
+    """ execute a function for several tasks on a pool of processes, while
+    the (large) arrays needed by every task are placed in shared memory, thus
+    they are not pickled and send to each process
+
+    Parameters
+    ----------
+    func : function
+        function to execute, its first arguments are the shared arrays
+    arrays : list
+        collection of numpy.arrays to share
+    tasks : list
+        collection of tuples, with the task specific arguments of the function
+    n_workers : integer, optional
+        amount of processes, by default all available cores are used
+    kwargs :
+        keyword arguments for the function, which are the same for each task
+
+    Returns
+    -------
+    outputs : list
+        output of the function for each task, in the same order as "tasks"
+
+    See Also
+    --------
+    run_on_shared_arrays
+    """
+    n_workers = get_number_of_workers(n_workers)
+
+    shms, specs = [], []
+    for A in arrays:
+        shm, spec = create_shared_array(np.asarray(A))
+        shms.append(shm)
+        specs.append(spec)
+    try:
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            jobs = [executor.submit(run_on_shared_arrays, func, specs,
+                                    *task, **kwargs) for task in tasks]
+            outputs = [job.result() for job in jobs]
+    finally:
+        release_shared_arrays(shms, unlink=True)
+    return outputs
@@ -0,0 +1,210 @@
+# generic libraries
+import functools
+import json
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+PROFILE_SETTINGS = {'enabled': False, 'memory': False, 'callback': None}
+PROFILE_STATS = {}
+# resetting the peak of the traced memory is only possible from Python 3.9
+RESET_PEAK = hasattr(tracemalloc, 'reset_peak')
+
+class NullStage(object):
+    """ context, that does nothing, used when profiling is switched off
+    """
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+NULL_STAGE = NullStage()
+
+class TimedStage(object):
+    """ context, that accumulates the wall time, calls and allocated bytes of
+    a stage, see "timed_stage"
+    """
+    __slots__ = ('key', 'tic', 'bytes')
+
+    def __init__(self, stage, method):
+        if isinstance(method, (list, tuple, np.ndarray)):  # several metrics
+            method = ','.join(str(m) for m in method)
+        self.key = (stage, method)
+
+    def __enter__(self):
+        if PROFILE_SETTINGS['memory']:
+            if RESET_PEAK:
+                tracemalloc.reset_peak()
+            self.bytes = tracemalloc.get_traced_memory()[0]
+        self.tic = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        toc = time.perf_counter() - self.tic
+        nbytes = 0
+        if PROFILE_SETTINGS['memory']:
+            current, peak = tracemalloc.get_traced_memory()
+            if not RESET_PEAK:  # the peak would be of the whole trace
+                peak = current
+            nbytes = max(peak - self.bytes, 0)
+
+        stats = PROFILE_STATS.setdefault(self.key,
+                                         {'time': 0., 'calls': 0, 'bytes': 0})
+        stats['time'] += toc
+        stats['calls'] += 1
+        stats['bytes'] += nbytes
+        if PROFILE_SETTINGS['callback'] is not None:
+            PROFILE_SETTINGS['callback'](self.key[0], self.key[1], toc, nbytes)
+        return False
+
+def timed_stage(stage, method=None):
+    """ measure a stage of the processing, when profiling is switched on
+
+    Parameters
+    ----------
+    stage : string
+        name of the stage, for example 'correlation' or 'subpixel'
+    method : {string, list}, optional
+        name of the method used within the stage, for example the correlator,
+        where a list of names, as for several metrics, is joined by commas
+
+    Returns
+    -------
+    context : context manager
+        which does nothing when profiling is switched off
+
+    See Also
+    --------
+    profile_stages
+
+    Example
+    -------
+    >>> with timed_stage('correlation', 'phas_corr'):
+    ...     Q = phase_corr(I1, I2)
+    """
+    if not PROFILE_SETTINGS['enabled']:
+        return NULL_STAGE
+    return TimedStage(stage, method)
+
+def profiled(stage, method=None):
+    """ decorator, that measures every call of a function as a stage, when
+    profiling is switched on
+
+    Parameters
+    ----------
+    stage : string
+        name of the stage
+    method : string, optional
+        name of the method used within the stage
+
+    See Also
+    --------
+    timed_stage
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not PROFILE_SETTINGS['enabled']:
+                return func(*args, **kwargs)
+            with TimedStage(stage, method):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+@contextmanager
+def profile_stages(memory=False, callback=None, reset=True):
+    """ switch on the profiling of the processing stages, within a
+    with-statement
+
+    Parameters
+    ----------
+    memory : bool, default=False
+        also trace the bytes that are allocated within a stage, which slows
+        down the processing considerably
+    callback : function, optional
+        called at the end of every stage, with the name of the stage, the
+        method, the elapsed time in seconds and the allocated bytes
+    reset : bool, default=True
+        remove the statistics of earlier profiling
+
+    See Also
+    --------
+    timed_stage, get_stage_stats, dump_stage_stats
+
+    Notes
+    -----
+    The statistics are kept per process, hence stages that run on a pool of
+    processes, see "..generic.handler_multiprocessing", are not included.
+    Stages can lie within each other, for example 'perdecomp' is part of the
+    'correlation', thus the times of nested stages are counted twice.
+    The memory of a stage is its peak allocation above the start, while a
+    nested stage resets this peak for the stage it lies within. Before Python
+    3.9 the peak can not be reset, then the memory that is still allocated at
+    the end of a stage is given instead.
+
+    Example
+    -------
+    >>> from ..processing.coupling_tools import match_pair
+    >>> with profile_stages():
+    ...     X2, Y2, score = match_pair(I1, I2, L1, L2, geoTransform1,
+    ...                                geoTransform2, X_grd, Y_grd)
+    >>> df = get_stage_stats(as_frame=True)
+    """
+    if reset:
+        PROFILE_STATS.clear()
+    previous = dict(PROFILE_SETTINGS)
+    start_tracing = memory and not tracemalloc.is_tracing()
+    if start_tracing:
+        tracemalloc.start()
+    PROFILE_SETTINGS.update({'enabled': True, 'memory': memory,
+                             'callback': callback})
+    try:
+        yield PROFILE_STATS
+    finally:
+        PROFILE_SETTINGS.update(previous)
+        if start_tracing:
+            tracemalloc.stop()
+
+def get_stage_stats(as_frame=False):
+    """ get the accumulated statistics of the processing stages
+
+    Parameters
+    ----------
+    as_frame : bool, default=False
+        give the statistics as a pandas.DataFrame
+
+    Returns
+    -------
+    stats : {list, pandas.DataFrame}
+        for every stage and method, the total time in seconds, the amount of
+        calls and the allocated bytes
+    """
+    stats = [{'stage': stage, 'method': method, **values}
+             for (stage, method), values in PROFILE_STATS.items()]
+    if as_frame:
+        return pd.DataFrame(stats,
+                            columns=['stage', 'method', 'time', 'calls',
+                                     'bytes'])
+    return stats
+
+def dump_stage_stats(fname):
+    """ write the accumulated statistics of the processing stages to a JSON
+    file
+
+    Parameters
+    ----------
+    fname : string
+        path of the file
+
+    See Also
+    --------
+    get_stage_stats
+    """
+    with open(fname, 'w') as f:
+        json.dump(get_stage_stats(), f, indent=1)
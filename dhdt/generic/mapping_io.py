@@ -4,7 +4,9 @@ import glob
 import numpy as np
 
 # geospatial libaries
-from osgeo import gdal, osr
+from osgeo import gdal, osr, gdal_array
+
+from .mapping_tools import get_pixel_bbox, ref_trans
 
 def read_geo_info(fname):
     """ This function takes as input the geotiff name and the path of the
@@ -44,7 +46,8 @@ def read_geo_info(fname):
     geoTransform += (rows, cols,)
     return spatialRef, geoTransform, targetprj, rows, cols, bands
 
-def read_geo_image(fname, boi=np.array([])):
+def read_geo_image(fname, boi=np.array([]), bbox=None, map_bbox=None,
+                   interleave='pixel', level=0, out=None, resample='nearest'):
     """ This function takes as input the geotiff name and the path of the
     folder that the images are stored, reads the image and returns the data as
     an array
@@ -55,22 +58,54 @@ def read_geo_image(fname, boi=np.array([])):
         geotiff file name and path.
     boi : numpy.array, size=(k,1)
         bands of interest, if a multispectral image is read, a selection can
-        be specified
+        be specified, counting from zero
+    bbox : numpy.array, size=(1,4), dtype=integer, optional
+        pixel window to read, in the following order: [minimum row, maximum
+        row, minimum collumn maximum collumn], as for "get_image_subset"
+    map_bbox : numpy.array, size=(1,4), dtype=float, optional
+        bounding box in map coordinates to read, in the following order:
+        min max X, min max Y, as for "get_bbox"
+    interleave : {'pixel' (default), 'band'}
+        layout of a multispectral image:
+
+          * 'pixel' : the bands are along the last axis, size=(m,n,b)
+          * 'band' : the bands are along the first axis, size=(b,m,n), so
+            every band is contiguous in memory
+    level : integer, default=0
+        resolution level, the window is read downsampled by a factor of
+        2**level
+    out : numpy.array, size=(k,l) or (k,l,b), optional
+        array to read into, for example a slice of a larger stack. Its data
+        type is used, and when its size differs from the window, the window
+        is resampled to it, hence the level is then not used
+    resample : {'nearest' (default), 'bilinear', 'cubic', 'cubicspline',
+                'lanczos', 'average', 'mode'}
+        resampling used by GDAL, when the window is read at another size
 
     Returns
     -------
     data : numpy.array, size=(m,n), ndim=2
-        data array of the band
+        data array of the band, or of size=(m,n,b) or (b,m,n) when several
+        bands are present, in the data type of the file, or "out" when it
+        is given
     spatialRef : string
         osr.SpatialReference in well known text
     geoTransform : tuple, size=(6,1)
-        affine transformation coefficients.
+        affine transformation coefficients, of the window when it is given.
     targetprj : osgeo.osr.SpatialReference() object
         coordinate reference system (CRS)
 
     See Also
     --------
-    make_geo_im, read_geo_info
+    make_geo_im, read_geo_info, .mapping_tools.get_pixel_bbox
+
+    Notes
+    -----
+    The array is allocated once, and each band is read directly into it,
+    while only the window of interest is decoded. When a resolution level is
+    given, GDAL reads from the overview that fits best, for JPEG2000 these
+    are the levels of the wavelet decomposition, hence the finer levels are
+    not decoded at all.
 
     Example
     -------
@@ -89,19 +124,69 @@ def read_geo_image(fname, boi=np.array([])):
     img = gdal.Open(fname)
     # imagery can consist of multiple bands
     if len(boi) == 0:
-        for counter in range(img.RasterCount):
-            band = np.array(img.GetRasterBand(counter+1).ReadAsArray())
-            data = band if counter == 0 else np.dstack((data,
-                                                        band[:,:,np.newaxis]))
+        boi = np.arange(img.RasterCount)
     else:
+        boi = np.asarray(boi).flatten()
         num_bands = img.RasterCount
         assert (np.max(boi)+1)<=num_bands, 'bands of interest is out of range'
-        for band_id, counter in enumerate(boi):
-            band = np.array(img.GetRasterBand(band_id+1).ReadAsArray())
-            data = band if counter==0 else np.dstack((data,
-                                                      band[:, :, np.newaxis]))
-    spatialRef = img.GetProjection()
+
     geoTransform = img.GetGeoTransform()
+    rows, cols = img.RasterYSize, img.RasterXSize
+    if map_bbox is not None:
+        bbox = get_pixel_bbox(map_bbox, geoTransform, rows, cols)
+    if bbox is None:
+        bbox = (0, rows, 0, cols)
+    i_0, i_1 = np.clip(bbox[:2], 0, rows).astype(int)
+    j_0, j_1 = np.clip(bbox[2:], 0, cols).astype(int)
+    (m, n, b) = (i_1-i_0, j_1-j_0, boi.size)
+    # size of the buffer, when a coarser resolution level is asked for,
+    # the window is cropped to a multiple of it
+    m_buf, n_buf = max(m // 2**level, 1), max(n // 2**level, 1)
+    m, n = min(m_buf * 2**level, m), min(n_buf * 2**level, n)
+
+    bands = [img.GetRasterBand(int(band_id)+1) for band_id in boi]
+    if out is None:
+        dtype = np.result_type(*[gdal_array.GDALTypeCodeToNumericTypeCode(
+            band.DataType) for band in bands])
+        data = np.empty((b, m_buf, n_buf) if interleave in ('band') else
+                        (m_buf, n_buf, b), dtype=dtype)
+    else:
+        assert isinstance(out, np.ndarray), ('please provide an array')
+        data = out
+        if out.ndim == 2:
+            data = np.expand_dims(out, 0 if interleave in ('band') else -1)
+        (m_buf, n_buf) = data.shape[1:] if interleave in ('band') else \
+            data.shape[:2]
+        assert data.shape[0 if interleave in ('band') else -1] == b, \
+            ('please provide an array with room for all bands of interest')
+        (m, n) = (i_1-i_0, j_1-j_0)
+    resample_alg = {'nearest': gdal.GRIORA_NearestNeighbour,
+                    'bilinear': gdal.GRIORA_Bilinear,
+                    'cubic': gdal.GRIORA_Cubic,
+                    'cubicspline': gdal.GRIORA_CubicSpline,
+                    'lanczos': gdal.GRIORA_Lanczos,
+                    'average': gdal.GRIORA_Average,
+                    'mode': gdal.GRIORA_Mode}[resample]
+
+    for counter, band in enumerate(bands):
+        buf = data[counter] if interleave in ('band') else data[..., counter]
+        band.ReadAsArray(int(j_0), int(i_0), int(n), int(m),
+                         buf_xsize=int(n_buf), buf_ysize=int(m_buf),
+                         buf_obj=buf, resample_alg=resample_alg)
+    if out is not None:
+        data = out
+    elif b == 1:
+        data = data[0] if interleave in ('band') else data[..., 0]
+        data = np.ascontiguousarray(data)
+
+    spatialRef = img.GetProjection()
+    geoTransform = ref_trans(geoTransform, int(i_0), int(j_0))
+    if (m, n) != (m_buf, n_buf): # pixel spacing of the read array
+        s_i, s_j = float(m/m_buf), float(n/n_buf)
+        geoTransform = (geoTransform[0],
+                        geoTransform[1]*s_j, geoTransform[2]*s_i,
+                        geoTransform[3],
+                        geoTransform[4]*s_j, geoTransform[5]*s_i)
     targetprj = osr.SpatialReference(wkt=img.GetProjection())
     return data, spatialRef, geoTransform, targetprj
 
@@ -591,6 +591,34 @@ def aff_trans_template_coord(A, t_radius):
     Y_aff = X * A[1, 0] + Y * A[1, 1]
     return X_aff, Y_aff
 
+def aff_trans_template_coord_batch(A, t_radius):
+    """ transform the local coordinates of a template, for a stack of affine
+    transformations
+
+    Parameters
+    ----------
+    A : np.array, size=(k,2,2)
+        stack of affine transformation matrices
+    t_radius : integer
+        radius of the template
+
+    Returns
+    -------
+    X_aff, Y_aff : np.array, size=(k,2*t_radius+1,2*t_radius+1)
+        transformed horizontal and vertical coordinates
+
+    See Also
+    --------
+    aff_trans_template_coord : the same for a single transformation
+    """
+    x = np.arange(-t_radius, t_radius + 1)
+    X, Y = np.meshgrid(x, x)
+
+    A = A[:, :, :, np.newaxis, np.newaxis]
+    X_aff = X * A[:, 0, 0] + Y * A[:, 0, 1]
+    Y_aff = X * A[:, 1, 0] + Y * A[:, 1, 1]
+    return X_aff, Y_aff
+
 def rot_trans_template_coord(theta, t_radius):
     x = np.arange(-t_radius, t_radius + 1)
     y = np.arange(-t_radius, t_radius + 1)
@@ -853,6 +881,44 @@ def get_shape_extent(bbox, geoTransform):
                      ).astype(int)
     return (rows, cols)
 
+def get_pixel_bbox(bbox, geoTransform, rows=None, cols=None):
+    """ given a bounding box in map coordinates, get the pixel window of an
+    image that covers it
+
+    Parameters
+    ----------
+    bbox : np.array, size=(1,4), dtype=float
+        bounding box, in the following order: min max X, min max Y
+    geoTransform : tuple, size=(1,6)
+        georeference transform of an image.
+    rows, cols : integer, optional
+        amount of rows and collumns in the image, the window is clipped to it
+
+    Returns
+    -------
+    bbox_pix : np.array, size=(1,4), dtype=integer
+        pixel window, in the following order: [minimum row, maximum row,
+        minimum collumn maximum collumn], as used by "get_image_subset"
+
+    See Also
+    --------
+    get_bbox, map2pix, ..handler_im.get_image_subset
+    """
+    assert isinstance(geoTransform, tuple), ('geoTransform should be a tuple')
+    x, y = np.meshgrid(np.asarray(bbox[:2], dtype=float),
+                       np.asarray(bbox[2:], dtype=float))
+    i, j = map2pix(geoTransform, x, y)
+
+    eps = 1E-6 # be robust against rounding, when on the pixel edge
+    bbox_pix = np.array([np.floor(np.min(i)+eps), np.ceil(np.max(i)-eps),
+                         np.floor(np.min(j)+eps), np.ceil(np.max(j)-eps)],
+                        dtype=int)
+    if rows is not None:
+        bbox_pix[:2] = np.clip(bbox_pix[:2], 0, rows)
+    if cols is not None:
+        bbox_pix[2:] = np.clip(bbox_pix[2:], 0, cols)
+    return bbox_pix
+
 def get_map_extent(bbox):
     """ generate coordinate list in counterclockwise direction from boundingbox
     input:   bbox           array (1 x 4)     min max X, min max Y
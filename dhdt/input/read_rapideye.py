@@ -163,7 +163,7 @@ def list_central_wavelength_re():
     df = pd.DataFrame(d)
     return df
 
-def read_band_re(band, path):
+def read_band_re(band, path, bbox=None, level=0):
     """ read specific band of RapidEye image
 
     This function takes as input the RapidEye band number and the path of the
@@ -176,6 +176,11 @@ def read_band_re(band, path):
         RapidEye band number.
     path : string
         path to folder with imagery.
+    bbox : numpy.array, size=(1,4), dtype=integer, optional
+        pixel window to read, in the following order: [minimum row, maximum
+        row, minimum collumn maximum collumn]
+    level : integer, default=0
+        resolution level, the image is downsampled by a factor of 2**level
 
     Returns
     -------
@@ -191,7 +196,7 @@ def read_band_re(band, path):
     fname = os.path.join(path, '*_Analytic.tif')
 
     data, spatialRef, geoTransform, targetprj = \
-        read_geo_image(glob.glob(fname)[0])
+        read_geo_image(glob.glob(fname)[0], bbox=bbox, level=level)
     return data, spatialRef, geoTransform, targetprj
 
 def read_sun_angles_re(path):
@@ -1,8 +1,12 @@
 # generic libraries
+import functools
 import glob
+import hashlib
+import inspect
 import os
 import warnings
 
+from concurrent.futures import ThreadPoolExecutor
 from xml.etree import ElementTree
 
 import numpy as np
@@ -13,7 +17,6 @@ from osgeo import gdal, osr
 
 # raster/image libraries
 from PIL import Image, ImageDraw
-from skimage.transform import resize
 from sklearn.neighbors import NearestNeighbors
 from scipy.interpolate import griddata, interp2d
 from scipy.ndimage import label
@@ -22,6 +25,7 @@ from scipy.signal import convolve2d
 from ..generic.handler_sentinel2 import get_array_from_xml
 from ..generic.mapping_tools import map2pix, ecef2map, ecef2llh, get_bbox
 from ..generic.mapping_io import read_geo_image, read_geo_info
+from ..generic.handler_multiprocessing import get_number_of_workers
 
 def list_central_wavelength_msi():
     """ create dataframe with metadata about Sentinel-2
@@ -178,7 +182,7 @@ def s2_dn2toa(I):
     I_toa = np.divide(I.astype('float'), 1E4)
     return I_toa
 
-def read_band_s2(path, band=None):
+def read_band_s2(path, band=None, bbox=None, level=0):
     """
     This function takes as input the Sentinel-2 band name and the path of the
     folder that the images are stored, reads the image and returns the data as
@@ -190,6 +194,12 @@ def read_band_s2(path, band=None):
         path of the folder, or full path with filename as well
     band : string, optional
         Sentinel-2 band name, for example '04', '8A'.
+    bbox : numpy.array, size=(1,4), dtype=integer, optional
+        pixel window to read, in the following order: [minimum row, maximum
+        row, minimum collumn maximum collumn]
+    level : integer, default=0
+        resolution level of the JPEG2000 to decode, the band is downsampled
+        by a factor of 2**level
 
     Returns
     -------
@@ -240,10 +250,11 @@ def read_band_s2(path, band=None):
     assert len(glob.glob(fname))!=0, ('file does not seem to be present')
 
     data, spatialRef, geoTransform, targetprj = \
-        read_geo_image(glob.glob(fname)[0])
+        read_geo_image(glob.glob(fname)[0], bbox=bbox, level=level)
     return data, spatialRef, geoTransform, targetprj
 
-def read_stack_s2(s2_df):
+def read_stack_s2(s2_df, dtype=np.uint16, upsample=True, resample='cubic',
+                  n_workers=None):
     """
     read imagery data of interest into an three dimensional np.array
 
@@ -252,6 +263,17 @@ def read_stack_s2(s2_df):
     s2_df : pandas.Dataframe
         metadata and general multispectral information about the MSI
         instrument that is onboard Sentinel-2
+    dtype : numpy.dtype, default=np.uint16
+        data type of the stack, for example np.uint16 or np.float32
+    upsample : bool, default=True
+        stack the bands at the finest resolution, otherwise the finer bands
+        are stacked at the coarsest resolution present
+    resample : {'cubic' (default), 'nearest', 'bilinear', 'cubicspline',
+                'lanczos', 'average'}
+        resampling of bands that have a different resolution
+    n_workers : integer, optional
+        amount of threads that decode bands at the same time, by default all
+        available cores are used
 
     Returns
     -------
@@ -269,33 +291,240 @@ def read_stack_s2(s2_df):
     list_central_wavelength_msi : creates a dataframe for the MSI instrument
     get_S2_image_locations : provides dataframe with specific file locations
     read_band_s2 : reading a single Sentinel-2 band
+
+    Notes
+    -----
+    The stack is allocated once, and every band is decoded directly into its
+    slice of the stack. The JPEG2000 decoding of GDAL releases the GIL, hence
+    the bands are read by a pool of threads. Bands at another resolution are
+    resampled by GDAL while reading, thus no intermediate full resolution
+    copy in double precision is made.
     """
     assert isinstance(s2_df, pd.DataFrame), ('please provide a dataframe')
     assert 'filepath' in s2_df, ('please first run "get_S2_image_locations"'+
                                 ' to find the proper file locations')
 
-    roi = np.min(s2_df['gsd'].array) # resolution of interest
-    im_scaling = s2_df['gsd'] / roi
     # start with the highest resolution
-    for val, idx in enumerate(s2_df.sort_values('gsd').index):
-        full_path = s2_df['filepath'][idx] + '.jp2'
-        if val==0:
-            im_stack, spatialRef, geoTransform, targetprj = read_band_s2(full_path)
-        else: # stack others bands
-            if im_stack.ndim==2:
-                im_stack = im_stack[:,:,np.newaxis]
-            band,_,_,_ = read_band_s2(full_path)
-            if im_scaling[idx]!=1: # resize image to higher res.
-                band = resize(band, (im_stack.shape[0], im_stack.shape[1]), order=3)
-            band = band[:,:,np.newaxis]
-            im_stack = np.concatenate((im_stack, band), axis=2)
+    s2_df = s2_df.sort_values('gsd')
+    full_paths = [s2_df['filepath'][idx] + '.jp2' for idx in s2_df.index]
+    # resolution of interest
+    roi_idx = s2_df.index[0] if upsample else s2_df.index[-1]
+    spatialRef, geoTransform, targetprj, rows, cols, _ = \
+        read_geo_info(s2_df['filepath'][roi_idx] + '.jp2')
+
+    im_stack = np.empty((rows, cols, len(full_paths)), dtype=dtype)
+
+    def _read_band(counter):
+        read_geo_image(full_paths[counter], out=im_stack[...,counter],
+                       resample=resample)
+
+    n_workers = get_number_of_workers(n_workers)
+    with ThreadPoolExecutor(max_workers=n_workers) as executor:
+        list(executor.map(_read_band, range(len(full_paths))))
 
     # in the meta data files there is no mention of its size, hence include
     # it to the geoTransform
-    geoTransform = geoTransform + (im_stack.shape[0], im_stack.shape[1])
+    geoTransform = geoTransform[:6] + (im_stack.shape[0], im_stack.shape[1])
     return im_stack, spatialRef, geoTransform, targetprj
 
+class Sentinel2Scene(object):
+    """ handle of a Sentinel-2 scene, which parses its metadata files once,
+    and keeps the arrays that are derived from them
+
+    Parameters
+    ----------
+    tl_path : string, optional
+        location of the metadata of the tile, i.e.: "MTD_TL.xml"
+    ds_path : string, optional
+        location of the metadata of the datastrip, i.e.: "MTD_DS.xml"
+    full_path : string, optional
+        location of the metadata of the product, i.e.: "MTD_MSIL1C.xml"
+
+    Attributes
+    ----------
+    hits : integer
+        amount of look-ups that were found within the handle
+    misses : integer
+        amount of look-ups that needed to be derived
+
+    See Also
+    --------
+    get_root_of_table, memoize_on_scene
+
+    Notes
+    -----
+    The metadata functions of this module, like "read_sun_angles_s2" or
+    "get_flight_path_s2", accept this handle instead of a path. The files are
+    only parsed when they are needed, and the outcome of such a function is
+    kept, hence a second call does not read or interpolate anything. These
+    arrays are read-only, thus a copy is needed to change them.
+
+    The locations are the same as "MTD_TL_path", "MTD_DS_path" and
+    "full_path" of the dictionary given by "get_s2_dict".
+
+    Example
+    -------
+    >>> scene = Sentinel2Scene(tl_path=s2_dict['MTD_TL_path'],
+    ...                        ds_path=s2_dict['MTD_DS_path'])
+    >>> Zn, Az = read_sun_angles_s2(scene)
+    >>> Zn, Az = read_sun_angles_s2(scene) # taken from the handle
+    >>> scene.invalidate('read_sun_angles_s2')
+    """
+    def __init__(self, tl_path=None, ds_path=None, full_path=None):
+        self.tl_path = tl_path
+        self.ds_path = ds_path
+        self.full_path = full_path
+
+        self.trees = {}     # file name -> root of the parsed xml-file
+        self.items = {}     # description of a function call -> outcome
+        self.hits, self.misses = 0, 0
+
+    def get_path(self, fname):
+        """ get the location of a metadata file
+
+        Parameters
+        ----------
+        fname : string
+            file name of the metadata, for example "MTD_DS.xml"
+
+        Returns
+        -------
+        path : string
+            directory where the file is situated
+        """
+        if 'MTD_TL' in fname:
+            path = self.tl_path
+        elif 'MTD_DS' in fname:
+            path = self.ds_path
+        else:
+            path = self.full_path
+        assert path is not None, ('please provide the location of '+fname)
+        return path
+
+    def get_root(self, fname):
+        """ get the root of a metadata file, which is only parsed once
+
+        Parameters
+        ----------
+        fname : string
+            file name of the metadata, for example "MTD_TL.xml"
+
+        Returns
+        -------
+        root : xml.etree.ElementTree.Element
+            root of the xml-file
+        """
+        path = self.get_path(fname)
+        full_name = os.path.join(path, fname)
+        if full_name not in self.trees:
+            self.trees[full_name] = get_root_of_table(path, fname)
+        return self.trees[full_name]
+
+    def memoize(self, key, func):
+        """ look up the outcome of a function, or derive and keep it
+
+        Parameters
+        ----------
+        key : hashable
+            description of the function call
+        func : function
+            derives the outcome, without arguments
+
+        Returns
+        -------
+        item : {numpy.array, tuple, float}
+            outcome of the function, where arrays are read-only
+        """
+        if key in self.items:
+            self.hits += 1
+            return self.items[key]
+        self.misses += 1
+        item = func()
+        for A in (item if isinstance(item, tuple) else (item,)):
+            if isinstance(A, np.ndarray):
+                A.setflags(write=False)
+        self.items[key] = item
+        return item
+
+    def invalidate(self, name=None, trees=False):
+        """ remove the kept outcomes, for example when the metadata has changed
+
+        Parameters
+        ----------
+        name : string, optional
+            name of the function, for example "read_sun_angles_s2", whose
+            outcomes are removed, by default all are removed
+        trees : bool, default=False
+            also remove the parsed metadata files
+        """
+        if name is None:
+            self.items.clear()
+        else:
+            self.items = {key: item for key, item in self.items.items()
+                          if key[0] != name}
+        if trees:
+            self.trees.clear()
+
+def describe_metadata_argument(value):
+    """ describe an argument of a metadata function, where arrays and
+    dataframes are described by their content
+
+    Parameters
+    ----------
+    value : any
+        argument of the function
+
+    Returns
+    -------
+    description : hashable
+    """
+    if isinstance(value, np.ndarray):
+        return ('array', value.shape, value.dtype.str,
+                hashlib.sha1(np.ascontiguousarray(value)).hexdigest())
+    if isinstance(value, pd.DataFrame):
+        return ('frame', tuple(value.columns),
+                tuple(pd.util.hash_pandas_object(value)))
+    return value
+
+def memoize_on_scene(func):
+    """ decorator for functions that read metadata, so that when a scene
+    handle is given instead of a path, its outcome is kept within the handle
+
+    Parameters
+    ----------
+    func : function
+        reads metadata, where the first argument is the path
+
+    Returns
+    -------
+    memoized : function
+        the same function, which also accepts a "Sentinel2Scene"
+
+    See Also
+    --------
+    Sentinel2Scene
+    """
+    signature = inspect.signature(func)
+
+    @functools.wraps(func)
+    def memoized(path, *args, **kwargs):
+        if not isinstance(path, Sentinel2Scene):
+            return func(path, *args, **kwargs)
+        bound = signature.bind(path, *args, **kwargs)
+        bound.apply_defaults()
+        key = (func.__name__,) + tuple(
+            (arg, describe_metadata_argument(value))
+            for arg, value in list(bound.arguments.items())[1:])
+        try:
+            hash(key)
+        except TypeError:  # unhashable parameters, thus not memoized
+            return func(path, *args, **kwargs)
+        return path.memoize(key, lambda: func(path, *args, **kwargs))
+    return memoized
+
 def get_root_of_table(path, fname):
+    if isinstance(path, Sentinel2Scene):
+        return path.get_root(fname)
     full_name = os.path.join(path, fname)
     if not '*' in full_name:
         assert os.path.exists(full_name), \
@@ -304,13 +533,15 @@ def get_root_of_table(path, fname):
     root = dom.getroot()
     return root
 
+@memoize_on_scene
 def read_geotransform_s2(path, fname='MTD_TL.xml', resolution=10):
     """
 
     Parameters
     ----------
-    path : string
-        location where the meta data is situated
+    path : {string, Sentinel2Scene}
+        location where the meta data is situated,
+        or the handle of the scene, which keeps the outcome
     fname : string
         file name of the meta-data file
     resolution : {float,integer}, unit=meters, default=10
@@ -374,14 +605,16 @@ def get_local_bbox_in_s2_tile(fname_1, s2dir):
     bbox_ij = np.concatenate((np.flip(bbox_i), bbox_j)).astype(int)
     return bbox_ij
 
+@memoize_on_scene
 def read_sun_angles_s2(path, fname='MTD_TL.xml'):
     """ This function reads the xml-file of the Sentinel-2 scene and extracts
     an array with sun angles, as these vary along the scene.
 
     Parameters
     ----------
-    path : string
-        path where xml-file of Sentinel-2 is situated
+    path : {string, Sentinel2Scene}
+        path where xml-file of Sentinel-2 is situated,
+        or the handle of the scene, which keeps the outcome
 
     Returns
     -------
@@ -520,6 +753,7 @@ def read_sun_angles_s2(path, fname='MTD_TL.xml'):
     del Igrd, Jgrd, Zij, Aij
     return Zn, Az
 
+@memoize_on_scene
 def read_view_angles_s2(path, fname='MTD_TL.xml', det_stack=np.array([]),
                         boi=list_central_wavelength_msi()):
     """ This function reads the xml-file of the Sentinel-2 scene and extracts
@@ -527,8 +761,9 @@ def read_view_angles_s2(path, fname='MTD_TL.xml', det_stack=np.array([]),
 
     Parameters
     ----------
-    path : string
-        path where xml-file of Sentinel-2 is situated
+    path : {string, Sentinel2Scene}
+        path where xml-file of Sentinel-2 is situated,
+        or the handle of the scene, which keeps the outcome
     fname : string
         the name of the metadata file, sometimes this is changed
     band_id : integer, default=4
@@ -697,13 +932,15 @@ def read_view_angles_s2(path, fname='MTD_TL.xml', det_stack=np.array([]),
             Zn, Az = np.dstack((Zn, Zn_bnd)), np.dstack((Az, Az_bnd))
     return Zn, Az
 
+@memoize_on_scene
 def read_mean_sun_angles_s2(path, fname='MTD_TL.xml'):
     """ Read the xml-file of the Sentinel-2 scene and extract the mean sun angles.
 
     Parameters
     ----------
-    path : string
-        path where xml-file of Sentinel-2 is situated
+    path : {string, Sentinel2Scene}
+        path where xml-file of Sentinel-2 is situated,
+        or the handle of the scene, which keeps the outcome
 
     Returns
     -------
@@ -889,13 +1126,15 @@ def read_detector_mask(path_meta, boi, geoTransform):
             det_stack[:,:,i] = np.maximum(det_stack[:,:,i], msk)
     return det_stack
 
+@memoize_on_scene
 def read_sensing_time_s2(path, fname='MTD_TL.xml'):
     """
 
     Parameters
     ----------
-    path : string
-        path where the meta-data is situated
+    path : {string, Sentinel2Scene}
+        path where the meta-data is situated,
+        or the handle of the scene, which keeps the outcome
     fname : string
         file name of the metadata.
 
@@ -1063,6 +1302,7 @@ def read_cloud_mask(path_meta, geoTransform):
             msk_clouds = np.maximum(msk_clouds, msk)
     return msk_clouds
 
+@memoize_on_scene
 def read_detector_time_s2(path, fname='MTD_DS.xml'): #todo: make description of function with example
 
 # example : line_period / np.timedelta64(1, 's')
@@ -1163,6 +1403,7 @@ def get_flight_bearing_from_gnss_s2(path, spatialRef, rec_tim, fname='MTD_DS.xml
     az = np.arctan2(dif_xy[0], dif_xy[1]) * 180 / np.pi
     return az
 
+@memoize_on_scene
 def get_flight_path_s2(ds_path, fname='MTD_DS.xml', s2_dict=None):
     """
 
@@ -1171,8 +1412,9 @@ def get_flight_path_s2(ds_path, fname='MTD_DS.xml', s2_dict=None):
 
     Parameters
     ----------
-    ds_path : string
-        location of the metadata file
+    ds_path : {string, Sentinel2Scene}
+        location of the metadata file,
+        or the handle of the scene, which keeps the outcome
     fname : string, default='MTD_DS.xml'
         name of the xml-file that has the metadata
     s2_dict : dictonary
@@ -1260,6 +1502,7 @@ def get_flight_path_s2(ds_path, fname='MTD_DS.xml', s2_dict=None):
                         'velocity': np.squeeze(velo)})
         return s2_dict
 
+@memoize_on_scene
 def get_flight_orientation_s2(ds_path, fname='MTD_DS.xml', s2_dict=None):
     """ get the flight path and orientations of the Sentinel-2 satellite during
     acquisition.
@@ -1269,8 +1512,9 @@ def get_flight_orientation_s2(ds_path, fname='MTD_DS.xml', s2_dict=None):
 
     Parameters
     ----------
-    ds_path : string
-        directory where the meta-data is located
+    ds_path : {string, Sentinel2Scene}
+        directory where the meta-data is located,
+        or the handle of the scene, which keeps the outcome
     fname : string, default='MTD_DS.xml'
         filename of the meta-data file
     s2_dict : dictonary, default=None
@@ -1316,14 +1560,16 @@ def get_flight_orientation_s2(ds_path, fname='MTD_DS.xml', s2_dict=None):
             s2_dict.update({'time': sat_time})
         return s2_dict
 
+@memoize_on_scene
 def get_integration_and_sampling_time_s2(ds_path, fname='MTD_DS.xml',
                                          s2_dict=None): #todo: create s2_dict methodology
     """
 
     Parameters
     ----------
-    ds_path : string
-        location where metadata of datastrip is situated
+    ds_path : {string, Sentinel2Scene}
+        location where metadata of datastrip is situated,
+        or the handle of the scene, which keeps the outcome
     fname : string, default='MTD_DS.xml'
         metadata filename
     s2_dict : dictionary, default=None
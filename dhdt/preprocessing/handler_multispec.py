@@ -3,38 +3,33 @@ import numpy as np
 from osgeo import gdal, osr
 
 from ..generic.handler_im import get_image_subset
-from ..generic.mapping_tools import ref_trans, pix2map
+from ..generic.mapping_tools import pix2map
 from ..generic.mapping_io import read_geo_image
 from ..input.read_sentinel2 import read_band_s2, read_sun_angles_s2
 from ..input.read_rapideye import read_band_re
 from .shadow_transforms import apply_shadow_transform
 
 def create_shadow_image(dat_path, im_name, shadow_transform='ruffenacht', \
-                        bbox=(0, 0, 0, 0), Shw=None):
+                        bbox=(0, 0, 0, 0), Shw=None, level=0):
     """
     Given a specific method, employ shadow transform
     input:   dat_path       string            directory the image is residing
              im_name        string            name of one or the multispectral image     
+             bbox           tuple (1 x 4)     pixel window [minI maxI minJ maxJ]
+                                              only this part is read
+             level          integer           resolution level to read
     output:  M              array (n x m)     shadow enhanced satellite image
     """
     bandList = get_shadow_bands(im_name) # get band numbers of the multispectral images
-    (Blue, Green, Red, Nir, crs, geoTransform, targetprj) = read_shadow_bands( \
-                dat_path + im_name, bandList)
-        
-    minI = bbox[0] 
-    maxI = bbox[1] 
-    minJ = bbox[2]
-    maxJ = bbox[3]    
-    if (minI!=0 or maxI!=0 and minI!=0 or maxI!=0):        
-        # reduce image space, so it fits in memory
-        Blue = get_image_subset(Blue, (minI, maxI, minJ, maxJ))
-        Green = get_image_subset(Green, (minI, maxI, minJ, maxJ))
-        Red = get_image_subset(Red, (minI, maxI, minJ, maxJ))
-        Nir = get_image_subset(Nir, (minI, maxI, minJ, maxJ))
-            
-        geoTransform = ref_trans(geoTransform,minI,minJ) # create georeference for subframe
+    if np.any(np.asarray(bbox)!=0):
+        # reduce image space, so it fits in memory, by only reading the
+        # window of interest
+        bbox = np.asarray(bbox)
     else:
-        geoTransform = geoTransform
+        bbox = None
+    (Blue, Green, Red, Nir, crs, geoTransform, targetprj, _) = \
+        read_shadow_bands(dat_path + im_name, bandList, bbox=bbox,
+                          level=level)
     
     # transform to shadow image  
     RedEdge = None
@@ -168,7 +163,7 @@ def get_shadow_bands(satellite_name):
 
     return band_num
 
-def read_shadow_bands(sat_path, band_num):
+def read_shadow_bands(sat_path, band_num, bbox=None, level=0):
     """ read the specific band numbers of the multispectral satellite images
 
     Parameters
@@ -182,6 +177,11 @@ def read_shadow_bands(sat_path, band_num):
         * band_num[2] : Red band number
         * band_num[3] : Near-infrared band number
         * band_num[4] : panchrometic band
+    bbox : numpy.array, size=(1,4), dtype=integer, optional
+        pixel window to read, in the following order: [minimum row, maximum
+        row, minimum collumn maximum collumn]
+    level : integer, default=0
+        resolution level, the bands are downsampled by a factor of 2**level
 
     Returns
     -------
@@ -208,25 +208,25 @@ def read_shadow_bands(sat_path, band_num):
     """
     if len([n for n in ['S2','MSIL1C'] if n in sat_path])==2:
         # read imagery of the different bands
-        (Blue, crs, geoTransform, targetprj) = read_band_s2( 
-            format(band_num[0], '02d'), sat_path)
+        (Blue, crs, geoTransform, targetprj) = read_band_s2(
+            sat_path, format(band_num[0], '02d'), bbox=bbox, level=level)
         (Green, crs, geoTransform, targetprj) = read_band_s2(
-            format(band_num[1], '02d'), sat_path)
+            sat_path, format(band_num[1], '02d'), bbox=bbox, level=level)
         (Red, crs, geoTransform, targetprj) = read_band_s2(
-            format(band_num[2], '02d'), sat_path)
+            sat_path, format(band_num[2], '02d'), bbox=bbox, level=level)
         (Near, crs, geoTransform, targetprj) = read_band_s2(
-            format(band_num[3], '02d'), sat_path)
+            sat_path, format(band_num[3], '02d'), bbox=bbox, level=level)
         Pan = None
     elif len([n for n in ['RapidEye','RE'] if n in sat_path])==2:
         # read single imagery and extract the different bands
         (Blue, crs, geoTransform, targetprj) = read_band_re(
-            format(band_num[0], '02d'), sat_path)
+            format(band_num[0], '02d'), sat_path, bbox=bbox, level=level)
         (Green, crs, geoTransform, targetprj) = read_band_re(
-            format(band_num[1], '02d'), sat_path)
+            format(band_num[1], '02d'), sat_path, bbox=bbox, level=level)
         (Red, crs, geoTransform, targetprj) = read_band_re(
-            format(band_num[2], '02d'), sat_path)
+            format(band_num[2], '02d'), sat_path, bbox=bbox, level=level)
         (Near, crs, geoTransform, targetprj) = read_band_re(
-            format(band_num[3], '02d'), sat_path)
+            format(band_num[3], '02d'), sat_path, bbox=bbox, level=level)
         Pan = None
         
     return Blue, Green, Red, Near, crs, geoTransform, targetprj, Pan
\ No newline at end of file
@@ -306,7 +306,7 @@ def histogram_equalization(img, img_ref):
     return new_img.reshape(mn)
 
 def high_pass_im(Im, radius=10):
-    (m, n) = Im.shape
+    (m, n) = Im.shape[-2:] # a stack of arrays is filtered along its last axes
     If = np.fft.fft2(Im)
 
     # fourier coordinate system
@@ -14,7 +14,7 @@ from .coupling_tools import match_pair
 from dhdt.input.read_sentinel2 import read_view_angles_s2
 from ..generic.mapping_tools import cast_orientation, rot_mat
 from ..generic.filtering_statistical import mad_filtering
-from dhdt.input.read_sentinel2 import read_sun_angles_s2
+from dhdt.input.read_sentinel2 import read_sun_angles_s2, Sentinel2Scene
 
 
 def coregister_to_shading(shadow,): # todo
@@ -81,11 +81,14 @@ def coregister(sat_path, dat_path, connectivity=2, step_size=True,
     GridIdxs = getNetworkIndices(len(sat_path))
     GridIdxs = getNetworkBySunangles(dat_path, sat_path, connectivity)
     Astack = getAdjacencyMatrixFromNetwork(GridIdxs, len(sat_path))
+    # the metadata of every scene is only read once, while the images are
+    # visited several times within the network
+    scenes = [Sentinel2Scene(tl_path=dat_path + im_name)
+              for im_name in sat_path]
 
     if lstsq_mode in ('weighted', 'generalized'):
         # get observation angle
-        sen2Path = dat_path + sat_path[0]
-        (obsZn, obsAz) = read_view_angles_s2(sen2Path)
+        (obsZn, obsAz) = read_view_angles_s2(scenes[0])
         if bbox is not None:
             obsZn = obsZn[bbox[0]:bbox[1], bbox[2]:bbox[3]]
             obsAz = obsAz[bbox[0]:bbox[1], bbox[2]:bbox[3]]
@@ -95,7 +98,7 @@ def coregister(sat_path, dat_path, connectivity=2, step_size=True,
         for j in range(GridIdxs.shape[0]):
             sen2Path = dat_path + sat_path[GridIdxs[j, i]]
             # get sun orientation
-            (_, sunAz) = read_sun_angles_s2(sen2Path)
+            (_, sunAz) = read_sun_angles_s2(scenes[GridIdxs[j, i]])
             if bbox is not None:
                 sunAz = sunAz[bbox[0]:bbox[1], bbox[2]:bbox[3]]
             # read shadow image
@@ -125,8 +128,8 @@ def coregister(sat_path, dat_path, connectivity=2, step_size=True,
         # blur with gaussian?
         #####################
 
-        (y_N, y_E) = lucas_kanade(Mstack[:, :, 0], Mstack[:, :, 1],
-                                 temp_size, sampleI, sampleJ)
+        (y_N, y_E, _, _) = simple_optical_flow(Mstack[:, :, 0], Mstack[:, :, 1],
+                                               temp_size, sampleI, sampleJ)
 
 
 
@@ -9,20 +9,32 @@ import numpy as np
 from sklearn.neighbors import NearestNeighbors
 from skimage import measure
 
-from ..generic.mapping_tools import pix2map, cast_orientation, ref_trans, \
-    aff_trans_template_coord, rot_trans_template_coord
+from ..generic.mapping_tools import pix2map, map2pix, cast_orientation, \
+    ref_trans, aff_trans_template_coord_batch
 from ..generic.mapping_io import read_geo_image, read_geo_info
 from ..generic.handler_im import bilinear_interpolation, select_boi_from_stack
+from ..generic.handler_multiprocessing import get_number_of_workers, \
+    map_on_shared_arrays
+from ..generic.handler_fft import fft2
+from ..generic.handler_checkpoint import CheckpointStore
+from ..generic.handler_profiling import timed_stage
 
 from ..input.read_sentinel2 import \
     read_sun_angles_s2, get_local_bbox_in_s2_tile
 
 from .matching_tools import \
-    pad_images_and_filter_coord_list, pad_radius, get_integer_peak_location
+    pad_images_and_filter_coord_list, pad_radius, get_integer_peak_location, \
+    get_integer_peak_location_batch, get_tiles_of_posts, get_image_pyramid
 from .matching_tools_organization import \
-    match_translation_of_two_subsets, estimate_subpixel, \
+    match_translation_of_two_subsets, match_translation_of_two_batches, \
+    estimate_subpixel, estimate_subpixel_batch, get_reference_spectra_batch, \
+    list_reference_spectrum_correlators, \
     estimate_translation_of_two_subsets, list_frequency_correlators, \
-    list_spatial_correlators, list_peak_estimators, list_phase_estimators
+    list_spatial_correlators, list_peak_estimators, list_phase_estimators, \
+    get_displacement_sign
+from .matching_tools_spatial_correlators import normalized_cross_corr_dense
+from .geometric_precision_describtion import get_template_sums, \
+    fast_noise_estimation, gradient_energy_estimation
 from .matching_tools_differential import \
     affine_optical_flow, simple_optical_flow
 from .matching_tools_binairy_boundaries import \
@@ -35,7 +47,9 @@ def match_pair(I1, I2, L1, L2, geoTransform1, geoTransform2, X_grd, Y_grd,
                temp_radius=7, search_radius=22,
                correlator='robu_corr', subpix='moment',
                processing='simple', boi=np.array([]),
-               metric='peak_abs', **kwargs):
+               metric='peak_abs', batch_size=None, n_workers=None,
+               spectrum_cache=None, scene_id=None, screening=None,
+               screen_threshold=None, return_reason=False, **kwargs):
     """
     simple image matching routine
 
@@ -77,16 +91,45 @@ def match_pair(I1, I2, L1, L2, geoTransform1, geoTransform2, X_grd, Y_grd,
         Method used to estimate the sub-pixel location, see
         "list_peak_estimators", list_phase_estimators" for more information
     metric : {'peak_abs' (default), 'peak_ratio', 'peak_rms', 'peak_ener',
-              'peak_nois', 'peak_conf', 'peak_entr'}
-        Metric to be used to describe the matching score.
-    processing : {'simple' (default), 'refine', 'stacking'}
+              'peak_nois', 'peak_conf', 'peak_entr'} or list
+        Metric to be used to describe the matching score. When a list is
+        given, a layer is given for each metric, which is computed for all
+        posts of a batch at once, when "batch_size" is used
+    processing : {'simple' (default), 'refine', 'stacking', 'pyramid'}
         Specifies which procssing strategy to apply to the imagery:
 
           * 'simple' : direct single pair processing
           * 'refine' : move template to first estimate, and refine matching
           * 'stacking' : matching several bands and combine the result
+          * 'pyramid' : match coarse to fine, where only a small residual
+                        window is searched at full resolution, see
+                        "match_posts_pyramid"
     boi : np.array
         list of bands of interest
+    batch_size : integer, optional
+        when given, the templates of a frequency correlator are stacked and
+        processed in batches of this size, see "match_posts_in_batches"
+    n_workers : integer, optional
+        amount of processes to use, the posts are then grouped into spatial
+        tiles which are matched in parallel, see "match_posts_in_parallel".
+        When negative, all available cores are used
+    spectrum_cache : ..generic.handler_cache.ArrayCache, optional
+        store for the spectra of the templates of the first image, which are
+        then re-used when the same image is matched against other images. It
+        is only used for batched processing, see "batch_size", with a
+        correlator from "list_reference_spectrum_correlators", and on a
+        single process
+    scene_id : string, optional
+        identifier of the first image, used to look up its spectra in the
+        "spectrum_cache", thus the same grid of posts should be used
+    screening : {None (default), 'noise', 'gradient', 'mask'}
+        score the posts before matching, and do not match posts with too
+        little texture or mask support, see "screen_posts"
+    screen_threshold : float, optional
+        texture score below which posts are not matched, see "screen_posts"
+    return_reason : bool, default=False
+        also give the reason why a post is not matched, this does not change
+        the matching itself
 
     Returns
     -------
@@ -94,14 +137,34 @@ def match_pair(I1, I2, L1, L2, geoTransform1, geoTransform2, X_grd, Y_grd,
         horizontal map coordinates of the refined matching centers of array M2
     Y2_grd : np.array, size=(k,l), type=float
         vertical map coordinates of the refined matching centers of array M2
+    match_metric : np.array, size=(k,l) or (k,l,p), type=float
+        matching score, which is NaN for screened posts, with a layer for
+        each of the p metrics when a list is given
+    reason_grd : np.array, size=(k,l), type=integer
+        only given when "return_reason" is set, code of the reason why a post
+        is not matched, see "screen_posts"
 
     See Also
     --------
+    match_posts_in_batches, match_posts_in_parallel, match_posts_pyramid,
     .matching_tools_organization.list_differential_correlators,
     .matching_tools_organization.list_spatial_correlators,
     .matching_tools_organization.list_frequency_correlators,
     .matching_tools_organization.list_peak_estimators,
     .matching_tools_organization.list_phase_estimators
+
+    Example
+    -------
+    Matching one reference image against a time series, where the spectra of
+    the reference are computed only once
+
+    >>> from ..generic.handler_cache import ArrayCache
+    >>> cache = ArrayCache(max_bytes=2**30, directory='')
+    >>> for I2, geoTransform2 in others:
+    ...     X2, Y2, score = match_pair(I1, I2, L1, L2, geoTransform1,
+    ...                                geoTransform2, X_grd, Y_grd,
+    ...                                correlator='phas_corr', batch_size=256,
+    ...                                spectrum_cache=cache, scene_id='ref')
     """
     # combating import loops
     from .matching_tools_organization import \
@@ -129,14 +192,11 @@ def match_pair(I1, I2, L1, L2, geoTransform1, geoTransform2, X_grd, Y_grd,
     peak_based = list_peak_estimators()
 
     # prepare
-    I1,I2 = select_boi_from_stack(I1,boi), select_boi_from_stack(I2,boi)
-    I1,I2,i1,j1,i2,j2,IN = pad_images_and_filter_coord_list(I1, I2,
-                                                         geoTransform1,
-                                                         geoTransform2,
-                                                         X_grd, Y_grd,
-                                                         temp_radius,
-                                                         search_radius,
-                                                         same=True)
+    with timed_stage('padding'):
+        I1,I2 = select_boi_from_stack(I1,boi), select_boi_from_stack(I2,boi)
+        I1,I2,i1,j1,i2,j2,IN = pad_images_and_filter_coord_list(
+            I1, I2, geoTransform1, geoTransform2, X_grd, Y_grd,
+            temp_radius, search_radius, same=True)
     geoTransformPad2 = ref_trans(geoTransform2, -search_radius, -search_radius)
 
     L1,L2 = pad_radius(L1,temp_radius), pad_radius(L2, search_radius)
@@ -147,48 +207,396 @@ def match_pair(I1, I2, L1, L2, geoTransform1, geoTransform2, X_grd, Y_grd,
 
     (m,n) = X_grd.shape
     X2_grd,Y2_grd = np.zeros((m,n,b)), np.zeros((m,n,b))
-    match_metric = np.zeros((m,n))
+    match_metric = np.zeros((m,n) + np.shape(metric))
     grd_new = np.where(IN)
 
+    # pre-screening, so posts without texture or support are not matched
+    reason = np.zeros(i1.size, dtype=np.int8)
+    if screening is not None:
+        with timed_stage('screening', screening):
+            reason = screen_posts(I1, L1, L2, i1, j1, i2, j2,
+                                  temp_radius=temp_radius,
+                                  search_radius=search_radius,
+                                  screening=screening,
+                                  threshold=screen_threshold)
+    OK = reason == 0
+
+    settings = {'temp_radius': temp_radius, 'search_radius': search_radius,
+                'correlator': correlator, 'subpix': subpix,
+                'processing': processing, 'metric': metric,
+                'batch_size': batch_size, **kwargs}
+    posts = (i1[OK], j1[OK], i2[OK], j2[OK])
+    if processing in ['pyramid']:
+        di_ok, dj_ok, score_ok = match_posts_pyramid(I1, I2, L1, L2, *posts,
+                                                     n_workers=n_workers,
+                                                     **settings)
+    elif (n_workers is not None) and (n_workers != 1):
+        if spectrum_cache is not None:
+            warnings.warn('the spectrum cache is not shared among processes,'
+                          ' hence it is not used')
+        di_ok, dj_ok, score_ok = match_posts_in_parallel(I1, I2, L1, L2,
+                                                         *posts,
+                                                         n_workers=n_workers,
+                                                         **settings)
+    else:
+        di_ok, dj_ok, score_ok = match_posts(I1, I2, L1, L2, *posts,
+                                             post_id=grd_new[0][OK],
+                                             spectrum_cache=spectrum_cache,
+                                             scene_id=scene_id, **settings)
+
+    # screened posts are not matched, thus have no displacement or score
+    di, dj = np.nan*np.zeros((i2.size, b)), np.nan*np.zeros((i2.size, b))
+    score = np.nan*np.zeros((i2.size,) + np.shape(metric))
+    di[OK] = di_ok.reshape(np.sum(OK), b)
+    dj[OK] = dj_ok.reshape(np.sum(OK), b)
+    score[OK] = score_ok
+
+    # transform from local image to metric map system
+    with timed_stage('transform'):
+        x2_new, y2_new = pix2map(geoTransformPad2,
+                                 i2[:, np.newaxis] + di,
+                                 j2[:, np.newaxis] + dj)
+
+    # write results in arrays
+    idx_grd = np.unravel_index(grd_new[0], (m, n), 'C')
+    X2_grd[idx_grd[0], idx_grd[1], :] = x2_new
+    Y2_grd[idx_grd[0], idx_grd[1], :] = y2_new
+    match_metric[idx_grd[0], idx_grd[1]] = score
+
+    if X2_grd.shape[2] == 1:
+        X2_grd, Y2_grd = np.squeeze(X2_grd), np.squeeze(Y2_grd)
+    if return_reason:
+        reason_grd = np.ones((m, n), dtype=np.int8)  # outside the imagery
+        reason_grd[idx_grd[0], idx_grd[1]] = reason
+        return X2_grd, Y2_grd, match_metric, reason_grd
+    return X2_grd, Y2_grd, match_metric
+
+def match_pair_streaming(I1, I2, L1, L2, geoTransform1, geoTransform2,
+                         X_grd, Y_grd, directory, block_size=2**12,
+                         temp_radius=7, search_radius=22, **kwargs):
+    """ image matching routine, where blocks of posts are matched one after
+    another and written to disk, so a long run can be resumed
+
+    Parameters
+    ----------
+    I1, I2 : np.array, size=(m,n,b), dtype=float, ndim={2,3}
+        image arrays
+    L1, L2 : np.array, size=(m,n), dtype=bool
+        labelled images of the image arrays
+    geoTransform1, geoTransform2 : tuple
+        affine transformation coefficients of the image arrays
+    X_grd, Y_grd : np.array, size=(k,l), type=float
+        map coordinates of matching centers
+    directory : string
+        location of the store with the results and its manifest, when a
+        store with the same settings is present, only its unfinished blocks
+        are matched
+    block_size : integer, default=2**12
+        amount of posts within a block, rounded towards whole grid rows
+    temp_radius, search_radius : integer
+        amount of pixels from the center
+    kwargs :
+        other settings of "match_pair"
+
+    Returns
+    -------
+    X2_grd, Y2_grd : np.array, size=(k,l), type=float
+        memory-mapped map coordinates of the refined matching centers
+    match_metric : np.array, size=(k,l), type=float
+        memory-mapped matching score
+    reason_grd : np.array, size=(k,l), type=integer
+        memory-mapped reason why a post is not matched, only given when
+        "return_reason" is set, see "match_pair"
+
+    See Also
+    --------
+    match_pair, ..generic.handler_checkpoint.CheckpointStore
+
+    Notes
+    -----
+    Each block is matched on a subset of the imagery, that covers its posts
+    and their search windows, thus memory usage depends upon the block size
+    and not on the size of the grid. The outcome is the same as "match_pair",
+    though the default threshold of the "screening" and the neighbourhood
+    of the "pyramid" processing are taken within each block.
+    """
+    (m, n) = X_grd.shape
+    block_rows = int(np.maximum(1, block_size // n))
+    settings = {key: value for key, value in kwargs.items()
+                if isinstance(value, (str, int, float, bool, type(None))) and
+                (key not in ['n_workers', 'batch_size', 'scene_id'])}
+    settings.update({'temp_radius': temp_radius,
+                     'search_radius': search_radius})
+    store = CheckpointStore(directory, (m, n), block_rows, settings=settings)
+
+    # margin around the posts, which is needed for the templates, while the
+    # subsets start at an even pixel, so coordinates are rounded in the same
+    # way, and at a pixel of the coarsest pyramid level
+    margin, step = search_radius + 1, 2
+    if kwargs.get('processing') in ['pyramid']:
+        step = 2**np.maximum(get_pyramid_levels(temp_radius, search_radius), 1)
+        margin = (search_radius + 2) * step
+
+    def get_subset(I, geoTransform, x, y):
+        i, j = map2pix(geoTransform, x, y)
+        i_0 = int(np.clip(np.floor(np.min(i)) - margin, 0, I.shape[0]-1))
+        j_0 = int(np.clip(np.floor(np.min(j)) - margin, 0, I.shape[1]-1))
+        i_0, j_0 = i_0 - (i_0 % step), j_0 - (j_0 % step)
+        i_1 = int(np.clip(np.ceil(np.max(i)) + margin + 1, i_0+1, I.shape[0]))
+        j_1 = int(np.clip(np.ceil(np.max(j)) + margin + 1, j_0+1, I.shape[1]))
+        return (slice(i_0, i_1), slice(j_0, j_1)), \
+            ref_trans(geoTransform, i_0, j_0)
+
+    names = ['X2', 'Y2', 'score', 'reason']
+    for block in store.todo():
+        rows = store.get_rows(block)
+        X_b, Y_b = X_grd[rows], Y_grd[rows]
+        sub_1, geoTransformSub1 = get_subset(I1, geoTransform1, X_b, Y_b)
+        sub_2, geoTransformSub2 = get_subset(I2, geoTransform2, X_b, Y_b)
+
+        outputs = match_pair(I1[sub_1], I2[sub_2], L1[sub_1], L2[sub_2],
+                             geoTransformSub1, geoTransformSub2, X_b, Y_b,
+                             temp_radius=temp_radius,
+                             search_radius=search_radius, **kwargs)
+        arrays = {}
+        for name, A in zip(names, outputs):
+            A = A.reshape(X_b.shape + (-1,))
+            arrays[name] = A[..., 0] if A.shape[-1] == 1 else A
+        store.write_block(block, arrays)
+    return tuple(store.layers[name] for name in names
+                 if name in store.layers)
+
+def screen_posts(I1, L1, L2, i1, j1, i2, j2, temp_radius=7, search_radius=22,
+                 screening='noise', threshold=None, support=.5):
+    """ score all posts at once on their texture and mask support, so posts
+    that can not be matched are skipped before any correlation is done
+
+    Parameters
+    ----------
+    I1 : np.array, size=(m,n) or (m,n,b)
+        padded data array of the templates
+    L1, L2 : np.array, size=(m,n)
+        padded masks of the data arrays
+    i1, j1 : np.array, size=(k,), dtype=integer
+        image coordinates of the template centers in the first array
+    i2, j2 : np.array, size=(k,), dtype=integer
+        image coordinates of the template centers in the second array
+    temp_radius, search_radius : integer
+        amount of pixels from the center
+    screening : {'noise' (default), 'gradient', 'mask'}
+        score to describe the texture of the templates:
+
+          * 'noise' : summed pixel noise, see "fast_noise_estimation"
+          * 'gradient' : mean gradient energy, see
+                         "gradient_energy_estimation"
+          * 'mask' : only the support of the masks is used
+    threshold : float, optional
+        texture score below which a post is rejected, by default this is 5%
+        of the 95th percentile of the scores
+    support : float, default=.5
+        fraction of the template and search window that needs to be within
+        the masks
+
+    Returns
+    -------
+    reason : np.array, size=(k,), dtype=integer
+        code of the reason why a post is rejected:
+
+          * 0 : the post is matched
+          * 1 : too little support of the masks
+          * 2 : too little texture
+
+    See Also
+    --------
+    match_pair,
+    .geometric_precision_describtion.fast_noise_estimation,
+    .geometric_precision_describtion.gradient_energy_estimation
+    """
+    assert screening in ['noise', 'gradient', 'mask'], \
+        ('please provide a valid screening method')
+    t_size, s_size = 2*temp_radius+1, 2*search_radius+1
+    reason = np.zeros(i1.size, dtype=np.int8)
+    if i1.size == 0:
+        return reason
+
+    # fraction of the windows that is within the masks
+    fill_1 = get_template_sums(L1 != 0, t_size, i1, j1) / t_size**2
+    fill_2 = get_template_sums(L2 != 0, s_size, i2, j2) / s_size**2
+    reason[np.logical_or(fill_1 < support, fill_2 < support)] = 1
+    if screening in ['mask']:
+        return reason
+
+    I = np.mean(I1, axis=2) if I1.ndim == 3 else I1
+    if screening in ['noise']:
+        score = fast_noise_estimation(I, t_size, i1, j1)
+    else:
+        score = gradient_energy_estimation(I, t_size, i1, j1)
+    if threshold is None:
+        threshold = .05*np.percentile(score[reason == 0], 95) \
+            if np.any(reason == 0) else 0.
+    reason[np.logical_and(reason == 0, score < threshold)] = 2
+    return reason
+
+def match_posts(I1, I2, L1, L2, i1, j1, i2, j2,
+                temp_radius=7, search_radius=22,
+                correlator='robu_corr', subpix='moment',
+                processing='simple', metric='peak_abs',
+                batch_size=None, post_id=None, spectrum_cache=None,
+                scene_id=None, **kwargs):
+    """ match a collection of posts, either through stacks of templates or
+    one template pair at a time
+
+    Parameters
+    ----------
+    I1, I2 : np.array, size=(m,n) or (m,n,b)
+        padded data arrays, see "pad_images_and_filter_coord_list"
+    L1, L2 : np.array, size=(m,n), dtype=bool
+        padded masks of the data arrays
+    i1, j1 : np.array, size=(k,), dtype=integer
+        image coordinates of the template centers in the first array
+    i2, j2 : np.array, size=(k,), dtype=integer
+        image coordinates of the template centers in the second array
+    batch_size : integer, optional
+        when given, the templates of a frequency correlator are stacked and
+        processed in batches of this size. The dense spatial correlator
+        'dens_corr' always works on batches, see "match_posts_dense"
+    post_id : np.array, size=(k,), dtype=integer, optional
+        identifiers of the posts, used to look up the "spectrum_cache"
+    spectrum_cache : ..generic.handler_cache.ArrayCache, optional
+        store for the spectra of the templates of the first array
+    scene_id : string, optional
+        identifier of the first array, used to look up the "spectrum_cache"
+
+    Returns
+    -------
+    di, dj : np.array, size=(k,) or (k,b), dtype=float
+        displacement of the posts, in pixels
+    score : np.array, size=(k,) or (k,p), dtype=float
+        matching metric of the posts
+
+    See Also
+    --------
+    match_posts_in_batches, match_posts_dense, match_posts_one_by_one,
+    match_pair
+    """
+    if kwargs.get('num_estimates') is None:
+        b = 1
+    else:
+        b = kwargs.get('num_estimates')
+
+    if (correlator in ['dens_corr']) and (I1.ndim == 2) and (b == 1):
+        return match_posts_dense(I1, I2, L1, L2, i1, j1, i2, j2,
+                                 temp_radius, search_radius, subpix, metric,
+                                 batch_size=batch_size or 1024)
+    if (batch_size is not None) and \
+            (correlator in list_frequency_correlators()) and \
+            (correlator not in ['upsp_corr']) and (I1.ndim == 2) and (b == 1):
+        return match_posts_in_batches(I1, I2, L1, L2, i1, j1, i2, j2,
+                                      temp_radius, search_radius,
+                                      correlator, subpix,
+                                      processing, metric, batch_size,
+                                      post_id=post_id,
+                                      spectrum_cache=spectrum_cache,
+                                      scene_id=scene_id)
+    return match_posts_one_by_one(I1, I2, L1, L2, i1, j1, i2, j2,
+                                  temp_radius, search_radius,
+                                  correlator, subpix,
+                                  processing, metric, **kwargs)
+
+def match_posts_one_by_one(I1, I2, L1, L2, i1, j1, i2, j2,
+                           temp_radius=7, search_radius=22,
+                           correlator='robu_corr', subpix='moment',
+                           processing='simple', metric='peak_abs',
+                           **kwargs):
+    """ match a collection of posts, one template pair at a time
+
+    Parameters
+    ----------
+    I1, I2 : np.array, size=(m,n) or (m,n,b)
+        padded data arrays, see "pad_images_and_filter_coord_list"
+    L1, L2 : np.array, size=(m,n), dtype=bool
+        padded masks of the data arrays
+    i1, j1 : np.array, size=(k,), dtype=integer
+        image coordinates of the template centers in the first array
+    i2, j2 : np.array, size=(k,), dtype=integer
+        image coordinates of the template centers in the second array
+
+    Returns
+    -------
+    di, dj : np.array, size=(k,b), dtype=float
+        displacement of the posts, in pixels
+    score : np.array, size=(k,) or (k,p), dtype=float
+        matching metric of the posts
+
+    See Also
+    --------
+    match_posts, match_pair
+    """
+    # combating import loops
+    from .matching_tools_organization import list_differential_correlators
+
+    frequency_based = list_frequency_correlators()
+    differential_based = list_differential_correlators()
+    peak_based = list_peak_estimators()
+
+    if kwargs.get('num_estimates') is None:
+        b = 1
+    else:
+        b = kwargs.get('num_estimates')
+
+    di_grd, dj_grd = np.zeros((i1.size, b)), np.zeros((i1.size, b))
+    score_grd = np.zeros((i1.size,) + np.shape(metric))
+
     # processing
     for counter in range(len(i1)): # loop through all posts
         # create templates
-        if correlator in frequency_based:
-            I1_sub = create_template_off_center(I1,i1[counter],j1[counter],
-                                                2*temp_radius)
-            I2_sub = create_template_off_center(I2,i2[counter],j2[counter],
-                                                2*search_radius)
-            L1_sub = create_template_off_center(L1,i1[counter],j1[counter],
-                                                2*temp_radius)
-            L2_sub = create_template_off_center(L2,i2[counter],j2[counter],
-                                                2*search_radius)
-        else: # differential or spatial based
-            I1_sub = create_template_at_center(I1,i1[counter],j1[counter],
-                                                temp_radius)
-            I2_sub = create_template_at_center(I2,i2[counter],j2[counter],
-                                                search_radius)
-            L1_sub = create_template_at_center(L1,i1[counter],j1[counter],
-                                                temp_radius)
-            L2_sub = create_template_at_center(L2,i2[counter],j2[counter],
-                                                search_radius)
+        with timed_stage('templates'):
+            if correlator in frequency_based:
+                I1_sub = create_template_off_center(I1,i1[counter],
+                                                    j1[counter],
+                                                    2*temp_radius)
+                I2_sub = create_template_off_center(I2,i2[counter],
+                                                    j2[counter],
+                                                    2*search_radius)
+                L1_sub = create_template_off_center(L1,i1[counter],
+                                                    j1[counter],
+                                                    2*temp_radius)
+                L2_sub = create_template_off_center(L2,i2[counter],
+                                                    j2[counter],
+                                                    2*search_radius)
+            else: # differential or spatial based
+                I1_sub = create_template_at_center(I1,i1[counter],
+                                                   j1[counter],
+                                                   temp_radius)
+                I2_sub = create_template_at_center(I2,i2[counter],
+                                                   j2[counter],
+                                                   search_radius)
+                L1_sub = create_template_at_center(L1,i1[counter],
+                                                   j1[counter],
+                                                   temp_radius)
+                L2_sub = create_template_at_center(L2,i2[counter],
+                                                   j2[counter],
+                                                   search_radius)
 
         if np.all(L1_sub==0) or np.all(L2_sub==0):
             di, dj, score = np.nan*np.zeros(b), np.nan*np.zeros(b), 0
         else:
             if correlator in differential_based:
-                di,dj,rms = estimate_translation_of_two_subsets(I1_sub, I2_sub,
-                                                                L1_sub, L2_sub,
-                                                                correlator,
-                                                                **kwargs)
+                with timed_stage('correlation', correlator):
+                    di,dj,rms = estimate_translation_of_two_subsets(
+                        I1_sub, I2_sub, L1_sub, L2_sub, correlator, **kwargs)
                 score = np.sqrt(np.nansum(rms**2))# euclidean distance of rms
             else:
-                QC = match_translation_of_two_subsets(I1_sub,I2_sub,
-                                                      correlator, subpix,
-                                                      L1_sub,L2_sub)
+                with timed_stage('correlation', correlator):
+                    QC = match_translation_of_two_subsets(I1_sub,I2_sub,
+                                                          correlator, subpix,
+                                                          L1_sub,L2_sub)
                 if (subpix in peak_based) or (subpix is None):
-                    di,dj,score,_ = get_integer_peak_location(QC, metric=metric)
+                    with timed_stage('peak', metric):
+                        di,dj,score,_ = get_integer_peak_location(
+                            QC, metric=metric)
                 else:
-                    di, dj, score = np.zeros(b), np.zeros(b), np.zeros(b)
+                    di, dj, score = np.zeros(b), np.zeros(b), 0
                 m0 = np.array([di, dj])
 
                 if processing in ['refine']: # reposition second template
@@ -211,42 +619,350 @@ def match_pair(I1, I2, L1, L2, geoTransform1, geoTransform2, X_grd, Y_grd,
                                                            i2[counter]-di,
                                                            j2[counter]-dj,
                                                            temp_radius)
-                    QC = match_translation_of_two_subsets(I1_sub, I2_new,
-                                                          correlator,subpix,
-                                                          L1_sub,L2_new)
+                    with timed_stage('correlation', correlator):
+                        QC = match_translation_of_two_subsets(
+                            I1_sub, I2_new, correlator, subpix,
+                            L1_sub, L2_new)
                 if subpix is None:
                     ddi,ddj = 0, 0
                 else:
-                    ddi,ddj = estimate_subpixel(QC, subpix, m0=m0)
+                    with timed_stage('subpixel', subpix):
+                        ddi,ddj = estimate_subpixel(QC, subpix, m0=m0)
 
                 if abs(ddi)<2: di += ddi
                 if abs(ddj)<2: dj += ddj
-        # transform from local image to metric map system
-        x2_new,y2_new = pix2map(geoTransformPad2,
-                                i2[counter] + di,
-                                j2[counter] + dj)
-
-        # write results in arrays
-        idx_grd = np.unravel_index(grd_new[0][counter], (m,n), 'C')
-        if b>1:
-            for bands in range(b):
-                X2_grd[idx_grd[0],idx_grd[1],bands] = x2_new[bands]
-                Y2_grd[idx_grd[0],idx_grd[1],bands] = y2_new[bands]
+        di_grd[counter], dj_grd[counter] = di, dj
+        score_grd[counter] = score
+    return di_grd, dj_grd, score_grd
+
+def match_posts_in_parallel(I1, I2, L1, L2, i1, j1, i2, j2, n_workers=None,
+                            tile_size=None, **kwargs):
+    """ match a collection of posts on several processes, where the posts are
+    grouped into spatial tiles
+
+    Parameters
+    ----------
+    I1, I2 : np.array, size=(m,n) or (m,n,b)
+        padded data arrays, see "pad_images_and_filter_coord_list"
+    L1, L2 : np.array, size=(m,n), dtype=bool
+        padded masks of the data arrays
+    i1, j1 : np.array, size=(k,), dtype=integer
+        image coordinates of the template centers in the first array
+    i2, j2 : np.array, size=(k,), dtype=integer
+        image coordinates of the template centers in the second array
+    n_workers : integer, optional
+        amount of processes, by default all available cores are used
+    tile_size : integer, optional
+        dimension of a tile in pixels, by default the domain is split into
+        four times as much tiles as there are workers
+
+    Returns
+    -------
+    di, dj : np.array, size=(k,) or (k,b), dtype=float
+        displacement of the posts, in pixels
+    score : np.array, size=(k,) or (k,p), dtype=float
+        matching metric of the posts
+
+    See Also
+    --------
+    match_posts, .matching_tools.get_tiles_of_posts,
+    ..generic.handler_multiprocessing.map_on_shared_arrays
+
+    Notes
+    -----
+    The imagery is placed in shared memory, so it is not copied towards each
+    process. The results are placed back through the indices of the posts,
+    hence the outcome does not depend upon the order in which tiles finish.
+    """
+    n_workers = get_number_of_workers(n_workers)
+    if tile_size is None:
+        area = (np.ptp(i1)+1) * (np.ptp(j1)+1) if i1.size > 0 else 1
+        tile_size = int(np.ceil(np.sqrt(area / (4*n_workers))))
+    tiles = get_tiles_of_posts(i1, j1, tile_size)
+
+    tasks = [(i1[idx], j1[idx], i2[idx], j2[idx]) for idx in tiles]
+    outputs = map_on_shared_arrays(match_posts, (I1, I2, L1, L2), tasks,
+                                   n_workers=n_workers, **kwargs)
+
+    if kwargs.get('num_estimates') is None:
+        b = 1
+    else:
+        b = kwargs.get('num_estimates')
+    di, dj = np.nan*np.zeros((i1.size, b)), np.nan*np.zeros((i1.size, b))
+    score = np.zeros((i1.size,) + np.shape(kwargs.get('metric', 'peak_abs')))
+    for idx, (di_t, dj_t, score_t) in zip(tiles, outputs):
+        di[idx] = di_t.reshape(idx.size, -1)
+        dj[idx] = dj_t.reshape(idx.size, -1)
+        score[idx] = score_t
+    return di, dj, score
+
+def get_pyramid_levels(temp_radius, search_radius, residual=3, max_levels=2):
+    """ get the amount of pyramid levels, so the displacement range at the
+    coarsest level is only a couple of pixels
+
+    Parameters
+    ----------
+    temp_radius, search_radius : integer
+        amount of pixels from the center, at full resolution
+    residual : integer, default=3
+        displacement range that is searched at the finer levels, in pixels
+    max_levels : integer, default=2
+        upper bound on the amount of levels
+
+    Returns
+    -------
+    levels : integer
+        amount of times the imagery is halved
+
+    See Also
+    --------
+    match_posts_pyramid
+    """
+    d = search_radius - temp_radius
+    if d <= residual:
+        return 0
+    return int(np.minimum(np.floor(np.log2(d / residual)), max_levels))
+
+def get_median_of_neighbours(i, j, di, dj, n_neighbours=9, i_q=None,
+                             j_q=None):
+    """ smooth the displacements of a collection of posts, by taking the
+    median of each post and its nearest neighbours
+
+    Parameters
+    ----------
+    i, j : np.array, size=(k,), dtype=integer
+        image coordinates of the posts
+    di, dj : np.array, size=(k,), dtype=float
+        displacement of the posts, where NaN's are not used
+    n_neighbours : integer, default=9
+        amount of posts the median is taken from
+    i_q, j_q : np.array, size=(l,), dtype=integer, optional
+        image coordinates where the median is evaluated, by default these
+        are the posts themselves
+
+    Returns
+    -------
+    di, dj : np.array, size=(k,) or (l,), dtype=float
+        median displacement of the neighbourhood, which is zero when none of
+        the neighbours has a displacement
+    """
+    if i_q is None:
+        i_q, j_q = i, j
+    if i.size == 0:
+        return np.zeros(i_q.size), np.zeros(i_q.size)
+    nbrs = NearestNeighbors(n_neighbors=np.minimum(n_neighbours, i.size))
+    nbrs.fit(np.vstack((i, j)).T)
+    idx = nbrs.kneighbors(np.vstack((i_q, j_q)).T, return_distance=False)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', category=RuntimeWarning)
+        di, dj = np.nanmedian(di[idx], axis=1), np.nanmedian(dj[idx], axis=1)
+    return np.nan_to_num(di), np.nan_to_num(dj)
+
+def get_thinned_posts(i, j, spacing):
+    """ select one post within every cell of a regular grid, so the templates
+    of the selected posts do not overlap too much
+
+    Parameters
+    ----------
+    i, j : np.array, size=(k,), dtype=integer
+        image coordinates of the posts
+    spacing : integer
+        dimension of the cells, in pixels
+
+    Returns
+    -------
+    idx : np.array, size=(l,), dtype=integer
+        indices of the selected posts, in increasing order
+    """
+    if i.size == 0:
+        return np.zeros(0, dtype=np.int64)
+    cells = np.floor(np.vstack((i, j)).T / np.maximum(spacing, 1))
+    _, idx = np.unique(cells, axis=0, return_index=True)
+    return np.sort(idx)
+
+def match_posts_pyramid(I1, I2, L1, L2, i1, j1, i2, j2,
+                        temp_radius=7, search_radius=22, levels=None,
+                        stop_level=0, n_workers=None, **kwargs):
+    """ match a collection of posts from coarse to fine, through Gaussian
+    image pyramids
+
+    Parameters
+    ----------
+    I1, I2 : np.array, size=(m,n) or (m,n,b)
+        padded data arrays, see "pad_images_and_filter_coord_list"
+    L1, L2 : np.array, size=(m,n), dtype=bool
+        padded masks of the data arrays
+    i1, j1 : np.array, size=(k,), dtype=integer
+        image coordinates of the template centers in the first array
+    i2, j2 : np.array, size=(k,), dtype=integer
+        image coordinates of the template centers in the second array
+    temp_radius, search_radius : integer
+        amount of pixels from the center, at full resolution
+    levels : integer, optional
+        amount of times the imagery is halved, see "get_pyramid_levels"
+    stop_level : integer, default=0
+        finest level that is matched, when larger than zero only a guess of
+        the displacement is given
+    n_workers : integer, optional
+        amount of processes to use at each level, see
+        "match_posts_in_parallel"
+
+    Returns
+    -------
+    di, dj : np.array, size=(k,b), dtype=float
+        displacement of the posts, in pixels of the full resolution, in the
+        convention of the correlator, as given by "match_posts"
+    score : np.array, size=(k,) or (k,p), dtype=float
+        matching metric of the posts, at the finest level
+
+    See Also
+    --------
+    match_posts, match_pair, .matching_tools.get_image_pyramid
+
+    Notes
+    -----
+    The displacement range of the simple processing, thus "search_radius"
+    minus "temp_radius", is scaled down at the coarsest level. There, the
+    templates of neighbouring posts overlap largely, hence only one post per
+    template size is matched. The guess of every post is the median of its
+    nearest matched posts, so outliers do not propagate. At the finest
+    level all posts are matched, though only a residual window around the
+    guess is searched, thus the second template is repositioned as in the
+    "refine" processing. Within the pyramid the displacements are taken in
+    the convention of the spatial correlators, see "get_displacement_sign",
+    so the guesses move the templates the right way for any correlator.
+
+    The pyramid makes larger search ranges feasible, though for the search
+    ranges of the simple processing it is not necessarily faster, as every
+    post is still matched at the finest level.
+    """
+    d, residual = search_radius - temp_radius, 3
+    if levels is None:
+        levels = get_pyramid_levels(temp_radius, search_radius, residual)
+    kwargs.pop('processing', None)
+    sign = get_displacement_sign(kwargs.get('correlator', 'robu_corr'))
+    if i1.size == 0:
+        return np.zeros((0, 1)), np.zeros((0, 1)), np.zeros(0)
+
+    pyramid_1 = get_image_pyramid(I1, levels)
+    pyramid_2 = get_image_pyramid(I2, levels)
+    pyramid_L1 = get_image_pyramid(L1, levels, mask=True)
+    pyramid_L2 = get_image_pyramid(L2, levels, mask=True)
+
+    di, dj = np.zeros(i1.size), np.zeros(i1.size)
+    for level in sorted({levels, stop_level}, reverse=True):
+        scale = 2**level
+        if level == levels:
+            radius = temp_radius + int(np.ceil(d / scale))
+        else:  # only the error of the coarse guess is left to be searched
+            radius = temp_radius + int(np.maximum(residual, np.ceil(
+                .75 * 2**(levels - level))))
+        if level > stop_level:
+            idx = get_thinned_posts(i1, j1, temp_radius*scale)
+        else:
+            idx = np.arange(i1.size)
+        pad = radius + 1
+
+        # positions at this level, where the second template is moved
+        # towards the guess of the level above
+        i1_l = np.round(i1[idx] / scale).astype(np.int64) + pad
+        j1_l = np.round(j1[idx] / scale).astype(np.int64) + pad
+        i2_l = np.round((i2[idx] + di[idx]) / scale).astype(np.int64) + pad
+        j2_l = np.round((j2[idx] + dj[idx]) / scale).astype(np.int64) + pad
+
+        I1_l, I2_l = pad_radius(pyramid_1[level], pad), \
+            pad_radius(pyramid_2[level], pad)
+        L1_l, L2_l = pad_radius(pyramid_L1[level], pad), \
+            pad_radius(pyramid_L2[level], pad)
+
+        settings = {**kwargs, 'temp_radius': temp_radius,
+                    'search_radius': radius, 'processing': 'simple'}
+        if (n_workers is not None) and (n_workers != 1):
+            di_l, dj_l, score = match_posts_in_parallel(
+                I1_l, I2_l, L1_l, L2_l, i1_l, j1_l, i2_l, j2_l,
+                n_workers=n_workers, **settings)
+        else:
+            di_l, dj_l, score = match_posts(I1_l, I2_l, L1_l, L2_l,
+                                            i1_l, j1_l, i2_l, j2_l,
+                                            **settings)
+
+        # transform towards a displacement at full resolution
+        di_l = sign * di_l.reshape(idx.size, -1)
+        dj_l = sign * dj_l.reshape(idx.size, -1)
+        di_l = ((i2_l - pad)[:, np.newaxis] + di_l) * scale - \
+            i2[idx, np.newaxis]
+        dj_l = ((j2_l - pad)[:, np.newaxis] + dj_l) * scale - \
+            j2[idx, np.newaxis]
+        if level > stop_level:
+            di, dj = get_median_of_neighbours(i1[idx], j1[idx], di_l[:, 0],
+                                              dj_l[:, 0], i_q=i1, j_q=j1)
+            di, dj = np.clip(di, -d, +d), np.clip(dj, -d, +d)
         else:
-            X2_grd[idx_grd[0],idx_grd[1]] = x2_new
-            Y2_grd[idx_grd[0],idx_grd[1]] = y2_new
-        match_metric[idx_grd[0],idx_grd[1]] = score
+            di, dj = di_l, dj_l
+    return sign*di, sign*dj, score
 
-    if X2_grd.shape[2]==1:
-        X2_grd,Y2_grd = np.squeeze(X2_grd), np.squeeze(Y2_grd)
-    return X2_grd, Y2_grd, match_metric
+def guess_displacement_pyramid(I1, I2, L1, L2, geoTransform1, geoTransform2,
+                               xy1, xy2, temp_radius=7, search_radius=22,
+                               **kwargs):
+    """ get a first guess of the location of a collection of posts, by
+    matching at the coarser levels of an image pyramid
+
+    Parameters
+    ----------
+    I1, I2 : np.array, size=(m,n) or (m,n,b)
+        image arrays
+    L1, L2 : np.array, size=(m,n)
+        labelled images or masks of the image arrays
+    geoTransform1, geoTransform2 : tuple
+        affine transformation coefficients of the image arrays
+    xy1 : np.array, size=(k,2), type=float
+        map coordinates of the posts in the first image
+    xy2 : np.array, size=(k,2), type=float
+        map coordinates of the posts in the second image
+    temp_radius, search_radius : integer
+        amount of pixels from the center, at full resolution
+
+    Returns
+    -------
+    xy2_new : np.array, size=(k,2), type=float
+        map coordinates of the guessed locations in the second image
+    search_radius : integer
+        amount of pixels from the center, that is left to be searched around
+        the guessed locations
+
+    See Also
+    --------
+    match_posts_pyramid, couple_pair
+    """
+    levels = get_pyramid_levels(temp_radius, search_radius)
+    xy2_new = np.copy(xy2)
+    if levels == 0:
+        return xy2_new, search_radius
+
+    M1, M2, i1, j1, i2, j2, IN = pad_images_and_filter_coord_list(
+        I1, I2, geoTransform1, geoTransform2,
+        np.vstack((xy1[:, 0], xy2[:, 0])).T,
+        np.vstack((xy1[:, 1], xy2[:, 1])).T, temp_radius, search_radius,
+        same=False)
+    L1, L2 = pad_radius(L1, temp_radius), pad_radius(L2, search_radius)
+    geoTransformPad2 = ref_trans(geoTransform2, -search_radius, -search_radius)
+
+    di, dj, _ = match_posts_pyramid(M1, M2, L1, L2, i1, j1, i2, j2,
+                                    temp_radius=temp_radius,
+                                    search_radius=search_radius,
+                                    levels=levels, stop_level=1, **kwargs)
+    sign = get_displacement_sign(kwargs.get('correlator', 'robu_corr'))
+    x2_new, y2_new = pix2map(geoTransformPad2, i2 + sign*di[:, 0],
+                             j2 + sign*dj[:, 0])
+    xy2_new[IN, 0], xy2_new[IN, 1] = x2_new, y2_new
+    return xy2_new, temp_radius + 3
 
 def couple_pair(file_1, file_2, bbox=None, rgi_id=None,
                 rect='metadata', prepro='bandpass',
                 match='wght_corr', boi=np.array([]),
                 temp_radius=7, search_radius = 22,
                 processing=None,
-                subpix='moment', metric='peak_entr'):
+                subpix='moment', metric='peak_entr', n_workers=None):
     """ refine and couple two shadow images together
 
     Parameters
@@ -279,11 +995,14 @@ def couple_pair(file_1, file_2, bbox=None, rgi_id=None,
         amount of pixels from the center
     search_radius: integer
         amount of pixels from the center
-    processing : {"stacking", "shadow", None}
+    processing : {"stacking", "shadow", "pyramid", None}
         matching can be done on a single image pair, or by matching several
         bands and combine the result (stacking)
             * stacking - using multiple bands in the matching
             * shadow - using the shadow transfrom in the given folder
+            * pyramid - using the image files provided, where the posts are
+                        first moved to a guess from an image pyramid, see
+                        "guess_displacement_pyramid"
             else - using the image files provided in 'file1' & 'file2'
     subpix : {'tpss' (default), 'svd', 'radon', 'hough', 'ransac', 'wpca',\
               'pca', 'lsq', 'diff', 'gauss_1', 'parab_1', 'moment', 'mass',\
@@ -291,6 +1010,8 @@ def couple_pair(file_1, file_2, bbox=None, rgi_id=None,
               'gauss_2', 'parab_2', 'optical_flow'}
         Method used to estimate the sub-pixel location, see
         "list_peak_estimators", list_phase_estimators" for more information
+    n_workers : integer, optional
+        amount of processes to use for the matching, see "match_shadow_casts"
 
     Returns
     -------
@@ -387,6 +1108,12 @@ def couple_pair(file_1, file_2, bbox=None, rgi_id=None,
             scale_12 = np.ones((np.shape(post_1)[0]))
             simple_sh = np.zeros((np.shape(post_1)[0]))
 
+        if processing in ['pyramid']: # search around a coarse guess
+            post_2, search_radius = guess_displacement_pyramid(
+                I1, I2, L1, L2, geoTransform1, geoTransform2, post_1, post_2,
+                temp_radius=temp_radius, search_radius=search_radius,
+                correlator=match, subpix=subpix, metric='peak_abs')
+
         post_2_new, corr_score = match_shadow_casts(I1, I2, L1, L2,
                                                    sun1_Az, sun2_Az,
                                                    geoTransform1, geoTransform2,
@@ -397,7 +1124,8 @@ def couple_pair(file_1, file_2, bbox=None, rgi_id=None,
                                                    reg=rect, prepro=prepro,
                                                    correlator=match,
                                                    subpix=subpix,
-                                                   metric='peak_abs')
+                                                   metric='peak_abs',
+                                                   n_workers=n_workers)
     post_1 = conn_1[idxConn[:,1],2:4] # cast location in xy-coordinates for t1
     post_2 = conn_2[idxConn[:,0],2:4]
     # extract elevation change
@@ -519,6 +1247,298 @@ def create_template_off_center(I, i,j, width, filling='random'):
         I_sub = I[i-radius[0]:i+radius[1], j-radius[0]:j+radius[1]]
     return I_sub
 
+def create_template_batch_off_center(I, i, j, width):
+    """ get a stack of sub templates of a data array, at several locations
+
+    Parameters
+    ----------
+    I : np.array, size=(m,n) or (m,n,b)
+        data array
+    i : np.array, size=(k,), dtype=integer
+        vertical coordinates of the template centers
+    j : np.array, size=(k,), dtype=integer
+        horizontal coordinates of the template centers
+    width : {integer, tuple}
+        dimension of the template
+
+    Returns
+    -------
+    I_sub : np.array, size=(k,m,n) or (k,m,n,b)
+        stack of templates of the data array
+
+    See Also
+    --------
+    create_template_off_center : the same for a single location
+
+    Notes
+    -----
+    The templates are taken from a strided view upon the data array, hence
+    only the selected templates are copied. Templates that would extend
+    beyond the data array are shifted inwards.
+    """
+    if not isinstance(width, tuple):
+        width = (width, width)
+    radius = (width[0] // 2, width[1] // 2)
+    view = np.lib.stride_tricks.sliding_window_view(
+        I, (2*radius[0], 2*radius[1]), axis=(0, 1))
+
+    i_ul = np.clip(np.asarray(i, dtype=int) - radius[0], 0, view.shape[0]-1)
+    j_ul = np.clip(np.asarray(j, dtype=int) - radius[1], 0, view.shape[1]-1)
+    I_sub = view[i_ul, j_ul]
+    if I.ndim == 3:  # put the bands again at the last axis
+        I_sub = np.moveaxis(I_sub, 1, -1)
+    return I_sub
+
+def create_template_batch_at_center(I, i, j, radius):
+    """ get a stack of sub templates of a data array, centered at several
+    locations
+
+    Parameters
+    ----------
+    I : np.array, size=(m,n) or (m,n,b)
+        data array
+    i : np.array, size=(k,), dtype=integer
+        vertical coordinates of the template centers
+    j : np.array, size=(k,), dtype=integer
+        horizontal coordinates of the template centers
+    radius : {integer, tuple}
+        radius of the template
+
+    Returns
+    -------
+    I_sub : np.array, size=(k,2*radius+1,2*radius+1) or (k,m,n,b)
+        stack of templates of the data array
+
+    See Also
+    --------
+    create_template_at_center : the same for a single location
+    create_template_batch_off_center
+    """
+    if not isinstance(radius, tuple):
+        radius = (radius, radius)
+    view = np.lib.stride_tricks.sliding_window_view(
+        I, (2*radius[0]+1, 2*radius[1]+1), axis=(0, 1))
+
+    i_ul = np.clip(np.asarray(i, dtype=int) - radius[0], 0, view.shape[0]-1)
+    j_ul = np.clip(np.asarray(j, dtype=int) - radius[1], 0, view.shape[1]-1)
+    I_sub = view[i_ul, j_ul]
+    if I.ndim == 3:  # put the bands again at the last axis
+        I_sub = np.moveaxis(I_sub, 1, -1)
+    return I_sub
+
+def match_posts_in_batches(I1, I2, L1, L2, i1, j1, i2, j2,
+                           temp_radius=7, search_radius=22,
+                           correlator='robu_corr', subpix='moment',
+                           processing='simple', metric='peak_abs',
+                           batch_size=256, post_id=None,
+                           spectrum_cache=None, scene_id=None):
+    """ match a collection of posts, where the templates are stacked, so the
+    frequency correlators can transform a whole stack at once
+
+    Parameters
+    ----------
+    I1, I2 : np.array, size=(m,n)
+        padded data arrays, see "pad_images_and_filter_coord_list"
+    L1, L2 : np.array, size=(m,n), dtype=bool
+        padded masks of the data arrays
+    i1, j1 : np.array, size=(k,), dtype=integer
+        image coordinates of the template centers in the first array
+    i2, j2 : np.array, size=(k,), dtype=integer
+        image coordinates of the template centers in the second array
+    temp_radius: integer
+        amount of pixels from the center
+    search_radius: integer
+        amount of pixels from the center
+    correlator : string
+        frequency correlator, see "list_frequency_correlators"
+    subpix : string
+        method used to estimate the sub-pixel location, see
+        "list_peak_estimators", list_phase_estimators"
+    processing : {'simple' (default), 'refine'}
+        Specifies which procssing strategy to apply to the imagery
+    metric : {string, list}
+        Metric to be used to describe the matching score, or a list of these.
+    batch_size : integer, default=256
+        amount of posts that are processed at once
+    post_id : np.array, size=(k,), dtype=integer, optional
+        identifiers of the posts, by default their position in the list
+    spectrum_cache : ..generic.handler_cache.ArrayCache, optional
+        store for the spectra of the templates of the first array, these are
+        looked up through the key (scene_id, post_id, template size,
+        'perdecomp'), and computed and stored when not present
+    scene_id : string, optional
+        identifier of the first array
+
+    Returns
+    -------
+    di, dj : np.array, size=(k,), dtype=float
+        displacement of the posts, in pixels
+    score : np.array, size=(k,) or (k,p), dtype=float
+        matching metric of the posts
+
+    See Also
+    --------
+    match_pair, create_template_batch_off_center,
+    .matching_tools_organization.match_translation_of_two_batches
+    """
+    phase_based = list_phase_estimators()
+    peak_based = list_peak_estimators()
+
+    if post_id is None:
+        post_id = np.arange(i1.size)
+    use_cache = (spectrum_cache is not None) and \
+        (correlator in list_reference_spectrum_correlators())
+
+    k = i1.size
+    di, dj = np.nan*np.zeros(k), np.nan*np.zeros(k)
+    score = np.zeros((k,) + np.shape(metric))
+    for start in range(0, k, batch_size):
+        idx = np.arange(start, np.minimum(start+batch_size, k))
+        with timed_stage('templates'):
+            L1_sub = create_template_batch_off_center(L1, i1[idx], j1[idx],
+                                                      2*temp_radius)
+            L2_sub = create_template_batch_off_center(L2, i2[idx], j2[idx],
+                                                      2*search_radius)
+            # posts without any data are not matched
+            IN = np.logical_and(np.any(L1_sub != 0, axis=(1, 2)),
+                                np.any(L2_sub != 0, axis=(1, 2)))
+            if not np.any(IN):
+                continue
+            idx, L1_sub, L2_sub = idx[IN], L1_sub[IN], L2_sub[IN]
+
+            I1_sub = create_template_batch_off_center(I1, i1[idx], j1[idx],
+                                                      2*temp_radius)
+            I2_sub = create_template_batch_off_center(I2, i2[idx], j2[idx],
+                                                      2*search_radius)
+        S1_sub = None
+        if use_cache:
+            keys = [(scene_id, post, 2*temp_radius, 'perdecomp')
+                    for post in post_id[idx]]
+            S1_sub = spectrum_cache.get_stack(
+                keys, lambda sel: get_reference_spectra_batch(I1_sub[sel]))
+        with timed_stage('correlation', correlator):
+            QC = match_translation_of_two_batches(I1_sub, I2_sub,
+                                                  correlator, subpix,
+                                                  L1_sub, L2_sub, S1_sub)
+        if (subpix in peak_based) or (subpix is None):
+            with timed_stage('peak', metric):
+                di_b, dj_b, score_b, _ = get_integer_peak_location_batch(
+                    QC, metric=metric)
+        else:
+            di_b, dj_b = np.zeros(idx.size), np.zeros(idx.size)
+            score_b = np.zeros((idx.size,) + np.shape(metric))
+
+        if processing in ['refine']:  # reposition second template
+            I2_new = create_template_batch_off_center(I2,
+                                                      i2[idx]-di_b,
+                                                      j2[idx]-dj_b,
+                                                      2*temp_radius)
+            L2_new = create_template_batch_off_center(L2,
+                                                      i2[idx]-di_b,
+                                                      j2[idx]-dj_b,
+                                                      2*temp_radius)
+            with timed_stage('correlation', correlator):
+                QC = match_translation_of_two_batches(I1_sub, I2_new,
+                                                      correlator, subpix,
+                                                      L1_sub, L2_new, S1_sub)
+        di[idx], dj[idx], score[idx] = di_b, dj_b, score_b
+        if subpix is None:
+            continue
+        with timed_stage('subpixel', subpix):
+            ddi, ddj = estimate_subpixel_batch(
+                QC, subpix, m0=np.stack((di_b, dj_b), axis=1))
+        di[idx] += np.where(np.abs(ddi) < 2, ddi, 0)
+        dj[idx] += np.where(np.abs(ddj) < 2, ddj, 0)
+    return di, dj, score
+
+def match_posts_dense(I1, I2, L1, L2, i1, j1, i2, j2,
+                      temp_radius=7, search_radius=22, subpix='moment',
+                      metric='peak_abs', batch_size=1024):
+    """ match a collection of posts through normalized cross correlation,
+    where the correlation surfaces of many posts are computed at once
+
+    Parameters
+    ----------
+    I1, I2 : np.array, size=(m,n)
+        padded data arrays, see "pad_images_and_filter_coord_list"
+    L1, L2 : np.array, size=(m,n), dtype=bool
+        padded masks of the data arrays
+    i1, j1 : np.array, size=(k,), dtype=integer
+        image coordinates of the template centers in the first array
+    i2, j2 : np.array, size=(k,), dtype=integer
+        image coordinates of the template centers in the second array
+    temp_radius: integer
+        amount of pixels from the center
+    search_radius: integer
+        amount of pixels from the center
+    subpix : string
+        method used to estimate the sub-pixel location, see
+        "list_peak_estimators", list_phase_estimators"
+    metric : {string, list}
+        Metric to be used to describe the matching score, or a list of these.
+    batch_size : integer, default=1024
+        amount of posts that are processed at once
+
+    Returns
+    -------
+    di, dj : np.array, size=(k,), dtype=float
+        displacement of the posts, in pixels
+    score : np.array, size=(k,) or (k,p), dtype=float
+        matching metric of the posts
+
+    See Also
+    --------
+    match_pair, match_posts_one_by_one,
+    .matching_tools_spatial_correlators.normalized_cross_corr_dense
+
+    Notes
+    -----
+    The outcome is the same as for the correlator 'norm_corr', though the
+    "refine" processing strategy is not applied, as the correlation surface
+    already spans the whole search space.
+    """
+    phase_based = list_phase_estimators()
+
+    k = i1.size
+    di, dj = np.nan*np.zeros(k), np.nan*np.zeros(k)
+    score = np.zeros((k,) + np.shape(metric))
+    for start in range(0, k, batch_size):
+        idx = np.arange(start, np.minimum(start+batch_size, k))
+        L1_sub = create_template_batch_at_center(L1, i1[idx], j1[idx],
+                                                 temp_radius)
+        L2_sub = create_template_batch_at_center(L2, i2[idx], j2[idx],
+                                                 search_radius)
+        # posts without any data are not matched
+        IN = np.logical_and(np.any(L1_sub != 0, axis=(1, 2)),
+                            np.any(L2_sub != 0, axis=(1, 2)))
+        if not np.any(IN):
+            continue
+        idx = idx[IN]
+
+        with timed_stage('correlation', 'dens_corr'):
+            C = normalized_cross_corr_dense(I1, I2, i1[idx], j1[idx],
+                                            i2[idx], j2[idx],
+                                            temp_radius=temp_radius,
+                                            search_radius=search_radius,
+                                            batch_size=batch_size)
+        if subpix in phase_based:
+            di_b, dj_b = np.zeros(idx.size), np.zeros(idx.size)
+            score_b = np.zeros((idx.size,) + np.shape(metric))
+        else:
+            with timed_stage('peak', metric):
+                di_b, dj_b, score_b, _ = get_integer_peak_location_batch(
+                    C, metric=metric)
+        di[idx], dj[idx], score[idx] = di_b, dj_b, score_b
+        if subpix is None:
+            continue
+        with timed_stage('subpixel', subpix):
+            QC = fft2(C) if subpix in phase_based else C
+            ddi, ddj = estimate_subpixel_batch(
+                QC, subpix, m0=np.stack((di_b, dj_b), axis=1))
+        di[idx] += np.where(np.abs(ddi) < 2, ddi, 0)
+        dj[idx] += np.where(np.abs(ddj) < 2, ddj, 0)
+    return di, dj, score
+
 def make_time_pairing(acq_time,
                       t_min=np.timedelta64(300, 'ms').astype('timedelta64[ns]'),
                       t_max=np.timedelta64(3, 's').astype('timedelta64[ns]')):
@@ -693,9 +1713,9 @@ def match_shadow_casts(M1, M2, L1, L2, sun1_Az, sun2_Az,
                        xy1, xy2,
                        scale_12, simple_sh,
                        temp_radius=7, search_radius=22,
-                       reg='binary', prepro='bandpass',
+                       reg='metadata', prepro='bandpass',
                        correlator='cosicorr', subpix='moment',
-                       metric='peak_nois'):
+                       metric='peak_nois', n_workers=None, batch_size=256):
     """
     Redirecting arrays to
 
@@ -725,8 +1745,10 @@ def match_shadow_casts(M1, M2, L1, L2, sun1_Az, sun2_Az,
         amount of pixels from the center
     search_radius: integer
         amount of pixels from the center
-    reg : {"binary", other}
-         * "binary" :
+    reg : {"metadata" (default), "binary"}
+         * "binary" : registration through binary templates of the cast
+                      direction, which is not implemented yet, and raises a
+                      ValueError
          * otherwise, estimate scale and shear from geometry and metadata
     prepro : {'bandpass' (default), 'raiscos', 'highpass'}
         Specifies which pre-procssing to apply to the imagery:
@@ -752,6 +1774,13 @@ def match_shadow_casts(M1, M2, L1, L2, sun1_Az, sun2_Az,
               'peak_nois', 'peak_conf', 'peak_entr'}
         Abbreviation for the metric type to be calculated, for the options see
         "list_matching_metrics" for the options
+    n_workers : integer, optional
+        amount of processes to use, the posts are then grouped into spatial
+        tiles which are matched in parallel. When negative, all available
+        cores are used
+    batch_size : integer, default=256
+        amount of posts whose search templates are warped at once, see
+        "match_shadow_cast_posts"
 
     Returns
     -------
@@ -761,12 +1790,9 @@ def match_shadow_casts(M1, M2, L1, L2, sun1_Az, sun2_Az,
         associated scoring metric of xy2_corr
     """
     correlator, subpix = correlator.lower(), subpix.lower()
-    frequency_based = list_frequency_correlators()
-    spatial_based = list_spatial_correlators()
-
-    # some sub-pixel methods use the peak of the correlation surface,
-    # while others need the phase of the cross-spectrum
-    phase_based, peak_based = list_phase_estimators(), list_peak_estimators()
+    if reg in ['binary']:
+        raise ValueError('the binary registration is not implemented, ' +
+                         'please use reg="metadata"')
 
     if correlator=='aff_of': # optical flow needs to be of the same size
         search_radius = np.copy(temp_radius)
@@ -778,126 +1804,224 @@ def match_shadow_casts(M1, M2, L1, L2, sun1_Az, sun2_Az,
     L1,L2 = pad_radius(L1, temp_radius), pad_radius(L2, temp_radius)
     geoTransformPad2 = ref_trans(geoTransform2, -search_radius, -search_radius)
 
+    settings = {'temp_radius': temp_radius, 'search_radius': search_radius,
+                'reg': reg, 'correlator': correlator, 'subpix': subpix,
+                'metric': metric, 'batch_size': batch_size}
+    if (n_workers is not None) and (n_workers != 1):
+        n_workers = get_number_of_workers(n_workers)
+        area = (np.ptp(i1)+1) * (np.ptp(j1)+1) if i1.size > 0 else 1
+        tile_size = np.ceil(np.sqrt(area / (4*n_workers)))
+        tiles = get_tiles_of_posts(i1, j1, tile_size)
+
+        tasks = [(i1[idx], j1[idx], i2[idx], j2[idx],
+                  scale_12[idx], simple_sh[idx]) for idx in tiles]
+        outputs = map_on_shared_arrays(match_shadow_cast_posts,
+                                       (M1, M2, L1, L2, sun1_Az, sun2_Az),
+                                       tasks, n_workers=n_workers, **settings)
+
+        ij2_corr = np.zeros((i1.shape[0], 2)).astype(np.float64)
+        snr_score = np.zeros((i1.shape[0], 1)).astype(np.float16)
+        for idx, (ij2_t, snr_t) in zip(tiles, outputs):
+            ij2_corr[idx, :], snr_score[idx, :] = ij2_t, snr_t
+    else:
+        ij2_corr, snr_score = match_shadow_cast_posts(M1, M2, L1, L2,
+                                                      sun1_Az, sun2_Az,
+                                                      i1, j1, i2, j2,
+                                                      scale_12, simple_sh,
+                                                      **settings)
+
+    xy2_corr = np.zeros((i1.shape[0], 2)).astype(np.float64)
+    xy2_corr[:, 0], xy2_corr[:, 1] = pix2map(geoTransformPad2,
+                                             ij2_corr[:, 0], ij2_corr[:, 1])
+    return xy2_corr, snr_score
 
-    ij2_corr = np.zeros((i1.shape[0],2)).astype(np.float64)
-    xy2_corr = np.zeros((i1.shape[0],2)).astype(np.float64)
-    snr_score = np.zeros((i1.shape[0],1)).astype(np.float16)
-
-    for counter in range(len(i1)): # loop through all posts
-
-        # deformation compensation
-        if reg in ['binary']:
-            # construct binary templates
-            az1_sub = sun1_Az[i1[counter],j1[counter]]
-            d_elong = 0 # move center of template into the direction of the caster
-            i1_c = np.round(i1[counter] + \
-                            (np.cos(np.degrees(az1_sub))*d_elong)).astype('int')
-            j1_c = np.round(j1[counter] - \
-                            (np.sin(np.degrees(az1_sub))*d_elong)).astype('int')
+def match_shadow_cast_posts(M1, M2, L1, L2, sun1_Az, sun2_Az,
+                            i1, j1, i2, j2, scale_12, simple_sh,
+                            temp_radius=7, search_radius=22, reg='metadata',
+                            correlator='cosicorr', subpix='moment',
+                            metric='peak_nois', batch_size=256):
+    """ match a collection of shadow casts, where the search templates are
+    warped in batches
 
-            L1_sub = L1[i1_c-search_radius : i1_c+search_radius+1,
-                    j1_c-search_radius : j1_c+search_radius+1]
+    Parameters
+    ----------
+    M1, M2 : np.array, size=(m,n,b), dtype=float
+        padded image arrays, see "pad_images_and_filter_coord_list"
+    L1, L2 : np.array, size=(m,n), dtype=bool
+        padded labelled images
+    sun1_Az, sun2_Az : np.array, size=(m,n), unit=degrees
+        sun azimuth, not used as long as the "binary" registration is not
+        implemented
+    i1, j1 : np.array, size=(k,), dtype=integer
+        image coordinates of the template centers in the first array
+    i2, j2 : np.array, size=(k,), dtype=integer
+        image coordinates of the template centers in the second array
+    scale_12 : np.array, size=(k,)
+        estimate of scale change between array M1 & M2
+    simple_sh : np.array, size=(k,)
+        estimate of shear between array M1 & M2
+    reg : {"metadata" (default), "binary"}
+        registration, see "match_shadow_casts"
+    batch_size : integer, default=256
+        amount of posts that are warped at once
 
-            Xr,Yr = rot_trans_template_coord(az1_sub, search_radius)
+    Returns
+    -------
+    ij2_corr : np.array, size=(k,2), type=float
+        image coordinates of the refined matching centers of array M2
+    snr_score : np.array, size=(k,1), type=float
+        associated scoring metric
 
-            sun_along = np.abs(Xr)<(temp_radius/2) # sides lobe
-            sun_top = Yr<=0 # upper part of the template
+    See Also
+    --------
+    match_shadow_casts
 
-            B1_sub = (sun_along & sun_top & L1_sub)
-            B1_sub = np.logical_or(B1_sub, np.flip(np.flip(B1_sub, 0),1))
+    Notes
+    -----
+    All affine matrices are inverted at once, and the search templates of a
+    batch are sampled through one bilinear interpolation. When the correlator
+    works on stacks, see "list_batch_spatial_correlators", and the peak is
+    estimated from the correlation surface, the batch is also matched at
+    once, otherwise one template pair at a time.
+    """
+    # combating import loops
+    from .matching_tools_organization import list_batch_spatial_correlators
 
-            az2_sub = sun2_Az[i2[counter],j2[counter]]
-            i2_c = np.round(i2[counter] + \
-                            (np.cos(np.degrees(az2_sub))*d_elong)).astype('int')
-            j2_c = np.round(j2[counter] - \
-                            (np.sin(np.degrees(az2_sub))*d_elong)).astype('int')
+    if reg in ['binary']:
+        raise ValueError('the binary registration is not implemented, ' +
+                         'please use reg="metadata"')
 
-            L2_sub = L2[i2_c-search_radius : i2_c+search_radius+1,
-                    j2_c-search_radius : j2_c+search_radius+1]
+    frequency_based = list_frequency_correlators()
 
-            Xr,Yr = rot_trans_template_coord(az2_sub, search_radius)
-            sun_along = np.abs(Xr)<(temp_radius/2) # sides lobe
-            sun_top = Yr<=0 # upper part of the template
+    # some sub-pixel methods use the peak of the correlation surface,
+    # while others need the phase of the cross-spectrum
+    phase_based, peak_based = list_phase_estimators(), list_peak_estimators()
 
-            B2_sub = (sun_along & sun_top & L2_sub)
-            B2_sub = np.logical_or(B2_sub, np.flip(np.flip(B2_sub, 0),1))
+    k = i1.shape[0]
+    ij2_corr = np.zeros((k,2)).astype(np.float64)
+    snr_score = np.zeros((k,1)).astype(np.float16)
+
+    # deformation compensation, estimate scale and shear from geometry
+    A = np.zeros((k, 2, 2))
+    A[:, 0, 0], A[:, 0, 1], A[:, 1, 1] = 1, simple_sh, scale_12
+    A_inv = np.linalg.inv(A)
+
+    batched = (M1.ndim == 2) and \
+        (correlator in list_batch_spatial_correlators()) and \
+        (subpix in peak_based) and (subpix not in ['optical_flow'])
+
+    for start in range(0, k, batch_size):
+        idx = np.arange(start, np.minimum(start+batch_size, k))
+        with timed_stage('warping'):
+            X_aff, Y_aff = aff_trans_template_coord_batch(A_inv[idx],
+                                                          search_radius)
+            I_aff = i2[idx, np.newaxis, np.newaxis] + Y_aff
+            J_aff = j2[idx, np.newaxis, np.newaxis] + X_aff
+            M2_stack = bilinear_interpolation(M2, I_aff, J_aff)
+            L2_stack = bilinear_interpolation(L2, I_aff, J_aff)
+
+        if batched:
+            with timed_stage('templates'):
+                M1_stack = create_template_batch_at_center(M1, i1[idx],
+                                                           j1[idx],
+                                                           temp_radius)
+                L1_stack = create_template_batch_at_center(L1, i1[idx],
+                                                           j1[idx],
+                                                           temp_radius)
+            with timed_stage('correlation', correlator):
+                C = match_translation_of_two_batches(M1_stack, M2_stack,
+                                                     correlator, subpix,
+                                                     L1_stack, L2_stack)
+            with timed_stage('peak', metric):
+                di, dj, score, _ = get_integer_peak_location_batch(
+                    C, metric=metric)
+            with timed_stage('subpixel', subpix):
+                ddi, ddj = estimate_subpixel_batch(
+                    C, subpix, m0=np.stack((di, dj), axis=1))
+            di = di + np.where(np.abs(ddi) < 2, ddi, 0)
+            dj = dj + np.where(np.abs(ddj) < 2, ddj, 0)
+
+            # adjust for affine transform
+            dj_rig = dj*A[idx, 0, 0] + di*A[idx, 0, 1]
+            di_rig = dj*A[idx, 1, 0] + di*A[idx, 1, 1]
+
+            snr_score[idx, 0] = score
+            ij2_corr[idx, 0] = i2[idx] - di_rig
+            ij2_corr[idx, 1] = j2[idx] - dj_rig
+            continue
+
+        for counter, M2_sub, L2_sub in zip(idx, M2_stack, L2_stack):
+            # create templates
+            with timed_stage('templates'):
+                if correlator in frequency_based:
+                    M1_sub = create_template_off_center(M1, i1[counter],
+                                                        j1[counter],
+                                                        temp_radius)
+                    L1_sub = create_template_off_center(L1, i1[counter],
+                                                        j1[counter],
+                                                        temp_radius)
+                else:
+                    M1_sub = create_template_at_center(M1, i1[counter],
+                                                       j1[counter],
+                                                       temp_radius)
+                    L1_sub = create_template_at_center(L1, i1[counter],
+                                                       j1[counter],
+                                                       temp_radius)
 
-            breakpoint()
-        else: # estimate scale and shear from geometry
-            A = np.array([[1, simple_sh[counter]],
-                          [0, scale_12[counter]]])
-            A_inv = np.linalg.inv(A)
-            X_aff,Y_aff = aff_trans_template_coord(A_inv, search_radius)
+            if correlator in ['aff_of']:
+                with timed_stage('correlation', correlator):
+                    (di,dj,Aff,snr) = affine_optical_flow(M1_sub, M2_sub)
 
-        # create templates
-        if correlator in frequency_based:
-            M1_sub = create_template_off_center(M1,i1[counter],j1[counter],
-                                                 temp_radius)
-            L1_sub = create_template_off_center(L1, i1[counter], j1[counter],
-                                                temp_radius)
-        else:
-            M1_sub = create_template_at_center(M1, i1[counter], j1[counter],
-                                                temp_radius)
-            L1_sub = create_template_at_center(L1, i1[counter], j1[counter],
-                                               temp_radius)
-
-        M2_sub = bilinear_interpolation(M2,
-                                        i2[counter]+Y_aff, j2[counter]+X_aff)
-        L2_sub = bilinear_interpolation(L2,
-                                        i2[counter]+Y_aff, j2[counter]+X_aff)
-        if correlator in ['aff_of']:
-            (di,dj,Aff,snr) = affine_optical_flow(M1_sub, M2_sub)
+            else:
+                with timed_stage('correlation', correlator):
+                    QC = match_translation_of_two_subsets(M1_sub, M2_sub,
+                                                          correlator,subpix,
+                                                          L1_sub,L2_sub)
+            if (subpix in peak_based) or (subpix is None):
+                with timed_stage('peak', metric):
+                    di, dj, score, _ = get_integer_peak_location(
+                        QC, metric=metric)
+            else:
+                di, dj, score = np.zeros((1)), np.zeros((1)), np.zeros((1))
+            m0 = np.array([di, dj])
+
+            if subpix in ['optical_flow']:
+                # reposition second template
+                M2_new = create_template_at_center(M2,
+                                                   i2[counter]-di,
+                                                   j1[counter]-dj,temp_radius)
+                # optical flow refinement
+                with timed_stage('subpixel', subpix):
+                    ddi,ddj = simple_optical_flow(M1_sub, M2_new)
+
+                if (abs(ddi)>0.5) or (abs(ddj)>0.5): # divergence
+                    ddi = 0
+                    ddj = 0
+            else:
+                with timed_stage('subpixel', subpix):
+                    ddi,ddj = estimate_subpixel(QC, subpix, m0=m0)
 
-        else:
-            QC = match_translation_of_two_subsets(M1_sub, M2_sub,
-                                                  correlator,subpix,
-                                                  L1_sub,L2_sub)
-        if counter==6064:
-            breakpoint
-        if (subpix in peak_based) or (subpix is None):
-            di, dj, score, _ = get_integer_peak_location(QC, metric=metric)
-        else:
-            di, dj, score = np.zeros((1)), np.zeros((1)), np.zeros((1))
-        m0 = np.array([di, dj])
-
-        if subpix in ['optical_flow']:
-            # reposition second template
-            M2_new = create_template_at_center(M2,
-                                               i2[counter]-di,
-                                               j1[counter]-dj,temp_radius)
-            # optical flow refinement
-            ddi,ddj = simple_optical_flow(M1_sub, M2_new)
-
-            if (abs(ddi)>0.5) or (abs(ddj)>0.5): # divergence
-                ddi = 0
-                ddj = 0
-        else:
-            ddi,ddj = estimate_subpixel(QC, subpix, m0=m0)
-
-        if abs(ddi)<2:
-            di += ddi
-        if abs(ddj)<2:
-            dj += ddj
-
-        # adjust for affine transform
-        if 'Aff' in locals(): # affine transform is also estimated
-            Anew = A*Aff
-            dj_rig = dj*Anew[0,0] + di*Anew[0,1]
-            di_rig = dj*Anew[1,0] + di*Anew[1,1]
-        else:
-            dj_rig = dj*A[0,0] + di*A[0,1]
-            di_rig = dj*A[1,0] + di*A[1,1]
+            if abs(ddi)<2:
+                di += ddi
+            if abs(ddj)<2:
+                dj += ddj
 
-        snr_score[counter] = score
+            # adjust for affine transform
+            if 'Aff' in locals(): # affine transform is also estimated
+                Anew = A[counter]*Aff
+                dj_rig = dj*Anew[0,0] + di*Anew[0,1]
+                di_rig = dj*Anew[1,0] + di*Anew[1,1]
+            else:
+                dj_rig = dj*A[counter,0,0] + di*A[counter,0,1]
+                di_rig = dj*A[counter,1,0] + di*A[counter,1,1]
 
-        ij2_corr[counter,0] = i2[counter] - di_rig
-        ij2_corr[counter,1] = j2[counter] - dj_rig
+            snr_score[counter] = score
 
-    xy2_corr[:,0], xy2_corr[:,1] = pix2map(geoTransformPad2,
-                                           ij2_corr[:,0], ij2_corr[:,1])
-    return xy2_corr, snr_score
+            ij2_corr[counter,0] = i2[counter] - di_rig
+            ij2_corr[counter,1] = j2[counter] - dj_rig
+    return ij2_corr, snr_score
 
-def get_stack_out_of_dir(im_dir,boi,bbox): #todo I donot think this is a very robust function
+def get_stack_out_of_dir(im_dir,boi,bbox,level=0): #todo I donot think this is a very robust function
     """
     Create a stack of images from different bands, with at specific bounding box
 
@@ -906,7 +2030,9 @@ def get_stack_out_of_dir(im_dir,boi,bbox): #todo I donot think this is a very ro
     :param boi:           NP.ARRAY
         list of bands of interest
     :param bbox:          NP.ARRAY  [1,4]
-        list with outer coordinates
+        list with outer coordinates, only this pixel window is read
+    :param level:         INTEGER
+        resolution level to read, downsampling by a factor of 2**level
 
     :return M:            NP.ARRAY [_,_,boi]
         array with data from images in folder
@@ -914,7 +2040,8 @@ def get_stack_out_of_dir(im_dir,boi,bbox): #todo I donot think this is a very ro
         coordinate metadata of array
     """
     # create empty stack
-    M = np.zeros((bbox[1]-bbox[0], bbox[3]-bbox[2], len(boi)))
+    M = np.zeros(((bbox[1]-bbox[0]) // 2**level,
+                  (bbox[3]-bbox[2]) // 2**level, len(boi)))
 
     for i in range(len(boi)):
         # find image
@@ -924,15 +2051,10 @@ def get_stack_out_of_dir(im_dir,boi,bbox): #todo I donot think this is a very ro
             find_str = os.path.join(im_dir, f'*{boi[i]:02d}.tif')
             im_file = glob.glob(find_str)
 
-        # read image
+        # read the window of the image, and stack it
         if len(im_file)!=0:
-            (im_bnd,crs, geoTransform, targetprj) = read_geo_image(
-                im_file[0])
-
-        # stack image
-        M[:,:,i] = im_bnd[bbox[0]:bbox[1], bbox[2]:bbox[3]]
-
-    geoTransform = ref_trans(geoTransform,bbox[0],bbox[2])
+            (M[:,:,i],crs, geoTransform, targetprj) = read_geo_image(
+                im_file[0], bbox=bbox, level=level)
     return M, geoTransform
 
 def angles2unit(azimuth):
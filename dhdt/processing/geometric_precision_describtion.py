@@ -3,11 +3,50 @@ import numpy as np
 # image processing libraries
 from scipy import ndimage
 
-from .coupling_tools import \
-    create_template_at_center, create_template_off_center
-from .matching_tools import pad_radius
+from .matching_tools_spatial_correlators import get_integral_image
 
 # precision estimation
+def get_template_sums(S, t_size, grd_i, grd_j):
+    """ sum an array over templates at several locations, through its
+    summed-area table
+
+    Parameters
+    ----------
+    S : np.array, size=(m,n), dtype=float
+        data array
+    t_size : {integer, tuple}
+        width and height of the template, when odd the template is centered
+        at the location, otherwise it is one pixel off-center
+    grd_i : np.array, size=(k,l), dtype=integer
+        vertical location of the template centers
+    grd_j : np.array, size=(k,l), dtype=integer
+        horizontal location of the template centers
+
+    Returns
+    -------
+    L : np.array, size=(k,l), dtype=float
+        sum of the array within each template, where the part of a template
+        that is outside the array is counted as zero
+
+    See Also
+    --------
+    .coupling_tools.create_template_at_center,
+    .coupling_tools.create_template_off_center
+    """
+    if not type(t_size) is tuple: t_size = (t_size, t_size)
+    (h, w) = t_size
+    grd_i, grd_j = np.asarray(grd_i), np.asarray(grd_j)
+
+    # upper left and lower right corner in the summed-area table
+    C = get_integral_image(S)
+    i_ul = np.clip(grd_i - h//2, 0, S.shape[0]).astype(np.int64)
+    j_ul = np.clip(grd_j - w//2, 0, S.shape[1]).astype(np.int64)
+    i_lr = np.clip(grd_i - h//2 + h, 0, S.shape[0]).astype(np.int64)
+    j_lr = np.clip(grd_j - w//2 + w, 0, S.shape[1]).astype(np.int64)
+
+    L = C[i_lr, j_lr] - C[i_ul, j_lr] - C[i_lr, j_ul] + C[i_ul, j_ul]
+    return L
+
 def fast_noise_estimation(I, t_size, grd_i, grd_j, Gaussian=True):
     """
 
@@ -30,6 +69,15 @@ def fast_noise_estimation(I, t_size, grd_i, grd_j, Gaussian=True):
     S : np.array, size=(k,l), dtype=float
         image with pixel based noise estimates, based upon [1]
 
+    See Also
+    --------
+    gradient_energy_estimation
+
+    Notes
+    -----
+    The pixel based estimates are summed over all templates at once, through
+    a summed-area table, see "get_template_sums".
+
     References
     ----------
     .. [1] Immerkær "Fast noise variance estimation" Computer vision and image
@@ -40,37 +88,53 @@ def fast_noise_estimation(I, t_size, grd_i, grd_j, Gaussian=True):
     """
     # admin
     if not type(t_size) is tuple: t_size = (t_size, t_size)
-    t_rad = (t_size[0] //2, t_size[1] //2)
-
-    I = pad_radius(I, t_rad)
-    grd_i += t_rad[0]
-    grd_j += t_rad[1]
 
     # single pixel esitmation
     N = np.array([[1, -2, 1],[-2, 4, -2],[1, -2, 1]])
 
     if Gaussian is True:
-        S = ndimage.convolve(I,N)**2
+        S = ndimage.convolve(I.astype(float), N)**2
         preamble = 1/(36*(t_size[0]-2)*(t_size[1]-2))
     else:
-        S = ndimage.convolve(I,N)
+        S = np.abs(ndimage.convolve(I.astype(float), N))
         preamble = np.sqrt(np.pi/2)/(6*(t_size[0]-2)*(t_size[1]-2))
 
-    (m,n) = grd_i.shape
-    grd_i,grd_j = grd_i.flatten(), grd_j.flatten()
-    L = np.zeros_like(grd_i)
-    if np.any(np.mod(t_size,2)): # central template
-        for idx, i_coord in enumerate(grd_i):
-            S_sub = create_template_at_center(S, i_coord, grd_j[idx], t_rad)
-            L[idx] = np.sum(S_sub)
-    else: # off-center template
-        for idx, i_coord in enumerate(grd_i):
-            S_sub = create_template_off_center(S, i_coord, grd_j[idx], t_rad)
-            L[idx] = np.sum(S_sub)
-
+    L = get_template_sums(S, t_size, grd_i, grd_j)
     L *= preamble
     return L
 
+def gradient_energy_estimation(I, t_size, grd_i, grd_j):
+    """ estimate the mean gradient energy within templates, as a measure of
+    texture
+
+    Parameters
+    ----------
+    I : np.array, size=(m,n), dtype=float
+        image with intensities
+    t_size : {integer, tuple}
+        width and height of the template
+    grd_i : np.array, size=(k,l), dtype=integer
+        vertical location of the template centers
+    grd_j : np.array, size=(k,l), dtype=integer
+        horizontal location of the template centers
+
+    Returns
+    -------
+    E : np.array, size=(k,l), dtype=float
+        mean of the squared gradient magnitude within each template
+
+    See Also
+    --------
+    fast_noise_estimation
+    """
+    if not type(t_size) is tuple: t_size = (t_size, t_size)
+    I = I.astype(float)
+    S = ndimage.sobel(I, axis=0)**2 + ndimage.sobel(I, axis=1)**2
+
+    E = get_template_sums(S, t_size, grd_i, grd_j)
+    E /= t_size[0]*t_size[1]
+    return E
+
 # foerstner & Haralick Shapiro, color
 
 # precision descriptors
@@ -2,6 +2,7 @@
 import warnings
 import numpy as np
 
+from scipy import ndimage
 from skimage.morphology import extrema
 
 from ..generic.mapping_tools import map2pix
@@ -73,7 +74,7 @@ def get_integer_peak_location(C, metric='peak_abs'):
 
     assert type(C)==np.ndarray, ("please provide an array")
     metrics_list = list_matching_metrics()
-    assert (metric in metrics_list), \
+    assert np.all(np.isin(metric, metrics_list)), \
         ('please provide a valid metric method. '+
          'it can be one of the following:'+
          f' { {*metrics_list} }')
@@ -86,6 +87,52 @@ def get_integer_peak_location(C, metric='peak_abs'):
     dj -= C.shape[1] // 2
     return di, dj, score, max_corr
 
+def get_integer_peak_location_batch(C, metric='peak_abs'):
+    """ get the location of the highest score, for a stack of score surfaces
+
+    Parameters
+    ----------
+    C : np.array, size=(k,m,n)
+        stack of similarity score surfaces
+    metric : {'peak_abs' (default), 'peak_ratio', 'peak_rms', 'peak_ener',
+              'peak_nois', 'peak_conf', 'peak_entr'} or list
+        Metric to be used to describe the matching score, or a list of these.
+
+    Returns
+    -------
+    di : np.array, size=(k,), dtype=integer
+        vertical location of highest score
+    dj : np.array, size=(k,), dtype=integer
+        horizontal location of highest score
+    matching_metric : np.array, size=(k,) or (k,p), dtype=float
+        metric as specified by 'method', for each of the p metrics when a list
+        is given
+    max_corr : np.array, size=(k,), dtype=integer
+        flat index of the highest point in each surface
+
+    See Also
+    --------
+    get_integer_peak_location : the same for a single score surface
+    """
+    from .matching_tools_correlation_metrics import \
+        get_correlation_metric_batch, list_matching_metrics
+
+    assert isinstance(C, np.ndarray), ("please provide an array")
+    assert C.ndim == 3, ("please provide a stack of surfaces, size=(k,m,n)")
+    metrics_list = list_matching_metrics()
+    assert np.all(np.isin(metric, metrics_list)), \
+        ('please provide a valid metric method. ' +
+         'it can be one of the following:' +
+         f' { {*metrics_list} }')
+    max_corr = np.argmax(C.reshape(C.shape[0], -1), axis=1)
+    score = get_correlation_metric_batch(C, metric=metric).astype(float)
+
+    ij = np.unravel_index(max_corr, C.shape[1:], order='F')  # 'C'
+    di, dj = ij[::-1]
+    di -= C.shape[1] // 2
+    dj -= C.shape[2] // 2
+    return di, dj, score, max_corr
+
 def get_peak_indices(C, num_estimates=1):
     """ get the locations in an array where peaks are present
 
@@ -123,7 +170,10 @@ def get_peak_indices(C, num_estimates=1):
     ids = np.array(np.where(peak_C)) # this seems to go in rows
     scores = C[peak_C]
 
-    # rank scores from max to minimum
+    # only rank the highest scores, from max to minimum
+    if scores.size > num_estimates:
+        top_idx = np.argpartition(scores, -num_estimates)[-num_estimates:]
+        scores, ids = scores[top_idx], ids[:,top_idx]
     sort_idx = np.flip(np.argsort(scores))
     scores, ids = scores[sort_idx], ids[:,sort_idx]
 
@@ -135,6 +185,312 @@ def get_peak_indices(C, num_estimates=1):
     val[:maximal_num] = scores[:maximal_num]
     return idx, val
 
+def get_peak_indices_batch(C, num_estimates=1):
+    """ get the locations in a stack of arrays where peaks are present
+
+    Parameters
+    ----------
+    C : np.array, size=(k,m,n)
+        stack of scoring or voting surfaces
+    num_estimates : integer
+        number of peaks to be estimated
+
+    Returns
+    -------
+    idx : np.array, size=(k,num_estimates,2), dtype=integer
+        vertical and horizontal location of highest peak(s), based upon an
+        image coordinate system, that is [row, collumn] indexing
+    val : np.array, size=(k,num_estimates)
+        voting score at peak location, which is zero when less peaks are
+        present
+
+    See Also
+    --------
+    get_peak_indices : the same for a single surface
+
+    Notes
+    -----
+    A peak is an element that is not exceeded by its eight neighbours, thus
+    each element of a plateau is seen as a peak, though a flat surface has
+    none.
+    """
+    assert C.ndim == 3, ("please provide a stack of surfaces, size=(k,m,n)")
+    (k,m,n) = C.shape
+    peak_C = ndimage.maximum_filter(C, size=(1,3,3), mode='nearest') == C
+    peak_C &= np.ptp(C, axis=(1,2))[:,np.newaxis,np.newaxis] > 0 # not flat
+    C_peak = np.where(peak_C, C, -np.inf).reshape(k, -1)
+
+    # only rank the highest scores, from max to minimum
+    num = np.minimum(num_estimates, m*n)
+    top_idx = np.argpartition(C_peak, -num, axis=1)[:, -num:]
+    top_val = np.take_along_axis(C_peak, top_idx, axis=1)
+    sort_idx = np.flip(np.argsort(top_val, axis=1), axis=1)
+    top_idx = np.take_along_axis(top_idx, sort_idx, axis=1)
+    top_val = np.take_along_axis(top_val, sort_idx, axis=1)
+
+    idx = np.zeros((k, num_estimates, 2), dtype=int)
+    val = np.zeros((k, num_estimates))
+    IN = np.isfinite(top_val)
+    idx[:, :num, 0] = np.where(IN, top_idx // n, 0)
+    idx[:, :num, 1] = np.where(IN, top_idx % n, 0)
+    val[:, :num] = np.where(IN, top_val, 0)
+    return idx, val
+
+def get_hough_votes(A, y, rows, cols, weighting='cauchy', scale=.05,
+                    wrap=False, block_size=2**20):
+    """ accumulate the votes of samples upon a regular grid of two parameters,
+    where a sample supports the parameters (p_row, p_col) that satisfy
+    y = A[0]*p_row + A[1]*p_col
+
+    Parameters
+    ----------
+    A : np.array, size=(k,2)
+        coefficients of the parameters, for each sample
+    y : np.array, size=(k,)
+        observation of each sample
+    rows, cols : np.array, size=(m,), size=(n,)
+        values of the parameters along the axes of the voting space
+    weighting : {'cauchy' (default), 'laplace', 'hard'}
+        weight of a vote, given the residual r of a sample:
+
+          * 'cauchy' : 1 / (1 + (r/scale)**2)
+          * 'laplace' : exp(-|r|/scale)
+          * 'hard' : one when |r| <= scale, otherwise zero
+    scale : float, default=.05
+        scale of the weighting, in units of the observation
+    wrap : bool, default=False
+        the observations are cyclic with a period of one, as is the case for
+        phase angles in cycles
+    block_size : integer, default=2**20
+        amount of residuals that are evaluated at once
+
+    Returns
+    -------
+    vote : np.array, size=(m,n), dtype=float
+        voting space
+
+    See Also
+    --------
+    get_hough_votes_sparse, refine_hough_peak, get_peak_indices
+
+    Notes
+    -----
+    The residuals of a block of samples are evaluated for all cells at once,
+    through broadcasting, so the Python overhead does not grow with the
+    amount of samples.
+    """
+    A, y = np.atleast_2d(A), np.asarray(y).ravel()
+    P_row, P_col = np.meshgrid(rows, cols, indexing='ij')
+    P_row, P_col = P_row.ravel(), P_col.ravel()
+
+    vote = np.zeros(P_row.size)
+    step = np.maximum(block_size // P_row.size, 1)
+    for b in range(0, y.size, step):
+        R = np.outer(A[b:b+step, 0], P_row)
+        R += np.outer(A[b:b+step, 1], P_col)
+        np.subtract(y[b:b+step, np.newaxis], R, out=R)
+        if wrap:
+            R -= np.rint(R)
+        if weighting in ['laplace']:
+            np.abs(R, out=R)
+            R /= -scale
+            np.exp(R, out=R)
+        elif weighting in ['hard']:
+            R = np.abs(R) <= scale
+        else: # cauchy weighting
+            R /= scale
+            R *= R
+            R += 1
+            np.reciprocal(R, out=R)
+        vote += np.sum(R, axis=0)
+    return vote.reshape(len(rows), len(cols))
+
+def get_hough_votes_sparse(A, y, rows, cols, threshold=.05, wrap=False,
+                           block_size=2**20):
+    """ accumulate hard-threshold votes of samples upon a regular grid of two
+    parameters, where only the cells along the line of a sample are visited
+
+    Parameters
+    ----------
+    A : np.array, size=(k,2)
+        coefficients of the parameters, for each sample
+    y : np.array, size=(k,)
+        observation of each sample
+    rows, cols : np.array, size=(m,), size=(n,)
+        regularly spaced values of the parameters along the axes of the
+        voting space
+    threshold : float, default=.05
+        maximum residual of a vote, in units of the observation
+    wrap : bool, default=False
+        the observations are cyclic with a period of one
+    block_size : integer, default=2**20
+        amount of cells that are gathered at once
+
+    Returns
+    -------
+    vote : np.array, size=(m,n), dtype=integer
+        voting space
+
+    See Also
+    --------
+    get_hough_votes : the same through evaluation of all cells
+
+    Notes
+    -----
+    A sample supports a band of cells around a line, or around parallel lines
+    when the observations are cyclic. The grid is swept along the axis with
+    the smallest coefficient, while the cells across are computed directly,
+    and are counted through "np.bincount". Samples without any coefficient
+    support all cells or none, hence are left out.
+
+    This is faster than the dense 'hard' weighting of "get_hough_votes" for
+    observations that are not cyclic, and more so for finer grids; for 1000
+    samples it is about four times faster on a grid of 129x129 cells, and
+    about fifteen times on 1025x1025 cells. For cyclic observations, as the
+    phase angles of "phase_hough", a sample supports many parallel bands,
+    hence most cells are visited and the dense voting is about ten times
+    faster, while the votes are identical.
+    """
+    A, y = np.atleast_2d(A), np.asarray(y).ravel()
+    rows, cols = np.asarray(rows, dtype=float), np.asarray(cols, dtype=float)
+
+    vote = np.zeros((rows.size, cols.size), dtype=np.int64)
+    along_col = np.abs(A[:, 1]) >= np.abs(A[:, 0])  # solve for the column
+    OK = np.any(A != 0, axis=1)
+
+    sel = OK & along_col
+    vote += vote_along_lines(A[sel, 0], A[sel, 1], y[sel], rows, cols,
+                             threshold, wrap, block_size)
+    sel = OK & ~along_col
+    vote += vote_along_lines(A[sel, 1], A[sel, 0], y[sel], cols, rows,
+                             threshold, wrap, block_size).T
+    return vote
+
+def vote_along_lines(a, b, y, sweep, solve, threshold=.05, wrap=False,
+                     block_size=2**20):
+    """ count the cells within a band around the lines y = a*p_sweep +
+    b*p_solve, by visiting every cell along the sweep axis
+
+    Parameters
+    ----------
+    a, b : np.array, size=(k,)
+        coefficients of the sweep and solve parameter, where |b|>0
+    y : np.array, size=(k,)
+        observation of each sample
+    sweep, solve : np.array, size=(m,), size=(n,)
+        regularly spaced values of the parameters
+    threshold : float
+        maximum residual of a vote
+    wrap : bool
+        the observations are cyclic with a period of one
+    block_size : integer
+        amount of cells that are gathered at once
+
+    Returns
+    -------
+    vote : np.array, size=(m,n), dtype=integer
+        voting space
+
+    See Also
+    --------
+    get_hough_votes_sparse
+    """
+    m, n = sweep.size, solve.size
+    vote = np.zeros(m*n, dtype=np.int64)
+    if y.size == 0:
+        return vote.reshape(m, n)
+    d_solve = (solve[-1] - solve[0]) / np.maximum(n - 1, 1)
+    if d_solve == 0:
+        d_solve = 1.
+
+    # band width in cells, and the amount of parallel lines per sweep cell
+    half = threshold / np.abs(b)
+    width = np.floor(np.minimum(2*half/d_solve, n)).astype(int)
+    width = np.minimum(width + 2, n)
+    if wrap:
+        span = np.abs(b)*(solve[-1] - solve[0])
+        n_lines = np.floor(span + 2*threshold).astype(int) + 2
+    else:
+        n_lines = np.ones_like(width)
+    n_cells = width*n_lines
+
+    # group samples, so a block of cells is of limited size
+    per_sample = m*n_cells
+    blocks = np.cumsum(per_sample) // np.maximum(block_size, 1)
+    for blk in np.unique(blocks):
+        s = np.flatnonzero(blocks == blk)
+        p = np.arange(np.max(n_cells))
+        IN = p[np.newaxis, :] < n_cells[s, np.newaxis]  # (S,P)
+
+        # lowest line that can pass through the band of a sweep cell
+        t = y[s, np.newaxis] - a[s, np.newaxis]*sweep[np.newaxis, :]  # (S,m)
+        if wrap:
+            t_lo = np.minimum(b[s]*solve[0], b[s]*solve[-1])
+            k_lo = np.ceil(t_lo[:, np.newaxis] - t - threshold)
+        else:
+            k_lo = np.zeros_like(t)
+        k = k_lo[:, :, np.newaxis] + (p // width[s, np.newaxis])[:, np.newaxis]
+        v_c = (t[:, :, np.newaxis] + k) / b[s, np.newaxis, np.newaxis]
+        v_lo = v_c - half[s, np.newaxis, np.newaxis]
+        idx = np.ceil((v_lo - solve[0]) / d_solve - 1E-9).astype(np.int64)
+        np.maximum(idx, 0, out=idx)
+        idx += (p % width[s, np.newaxis])[:, np.newaxis]
+
+        # keep the cells within the band and within the grid
+        v = solve[0] + idx*d_solve
+        IN = IN[:, np.newaxis, :] & (idx >= 0) & (idx < n) & \
+            (np.abs(t[:, :, np.newaxis] + k - b[s, np.newaxis, np.newaxis]*v)
+             <= threshold)
+        flat = np.arange(m)[np.newaxis, :, np.newaxis]*n + idx
+        vote += np.bincount(flat[IN], minlength=m*n)
+    return vote.reshape(m, n)
+
+def refine_hough_peak(A, y, row, col, spacing, levels=2, n_cells=9,
+                      weighting='cauchy', scale=.05, wrap=False):
+    """ refine a peak of the voting space, through voting on ever finer grids
+    around the estimate
+
+    Parameters
+    ----------
+    A : np.array, size=(k,2)
+        coefficients of the parameters, for each sample
+    y : np.array, size=(k,)
+        observation of each sample
+    row, col : float
+        parameters of the peak
+    spacing : tuple, size=(2,)
+        cell size of the voting space the peak is found in
+    levels : integer, default=2
+        amount of refinements
+    n_cells : integer, default=9
+        amount of cells along an axis of a refined grid, which spans two
+        cells of the coarser grid
+    weighting, scale, wrap
+        see "get_hough_votes"
+
+    Returns
+    -------
+    row, col : float
+        refined parameters of the peak
+    vote : float
+        amount of support at the refined peak
+
+    See Also
+    --------
+    get_hough_votes
+    """
+    d_row, d_col = spacing
+    vote = 0.
+    for _ in range(levels):
+        rows = row + np.linspace(-d_row, +d_row, n_cells)
+        cols = col + np.linspace(-d_col, +d_col, n_cells)
+        V = get_hough_votes(A, y, rows, cols, weighting=weighting,
+                            scale=scale, wrap=wrap)
+        i, j = np.unravel_index(np.argmax(V), V.shape)
+        row, col, vote = rows[i], cols[j], V[i, j]
+        d_row, d_col = 2*d_row/(n_cells-1), 2*d_col/(n_cells-1)
+    return row, col, vote
+
 # supporting functions
 def get_template(I, idx_1, idx_2, radius):
     """ get a template, eventhough the index or template might be outside the
@@ -260,6 +616,38 @@ def pad_images_and_filter_coord_list(M1, M2, geoTransform1, geoTransform2,
 
     return M1_new, M2_new, i1, j1, i2, j2, IN
 
+def get_tiles_of_posts(i, j, tile_size):
+    """ group a collection of posts into square tiles, so these can be
+    processed independently
+
+    Parameters
+    ----------
+    i : np.array, size=(k,), dtype=integer
+        vertical image coordinates of the posts
+    j : np.array, size=(k,), dtype=integer
+        horizontal image coordinates of the posts
+    tile_size : integer
+        dimension of a tile, in pixels
+
+    Returns
+    -------
+    tiles : list
+        indices of the posts within each tile, the tiles are ordered row by
+        row, while the posts within a tile keep their original order
+    """
+    assert isinstance(i, np.ndarray), ("please provide an array")
+    assert isinstance(j, np.ndarray), ("please provide an array")
+    if i.size == 0:
+        return []
+    tile_size = int(np.maximum(tile_size, 1))
+
+    tile_i, tile_j = i // tile_size, j // tile_size
+    order = np.lexsort((tile_j, tile_i))  # a stable sort
+    new_tile = np.logical_or(np.diff(tile_i[order]) != 0,
+                             np.diff(tile_j[order]) != 0)
+    tiles = np.split(order, np.flatnonzero(new_tile)+1)
+    return tiles
+
 def pad_radius(I, radius, cval=0):
     """ add extra boundary to array, so templates can be easier extracted
 
@@ -288,6 +676,38 @@ def pad_radius(I, radius, cval=0):
                         'constant', constant_values=cval)
     return I_xtra
 
+def get_image_pyramid(I, levels, mask=False):
+    """ create a Gaussian image pyramid, where each level halves the
+    resolution of the level below
+
+    Parameters
+    ----------
+    I : np.array, size=(m,n) or (m,n,b)
+        data array
+    levels : integer
+        amount of times the data array is halved
+    mask : bool, default=False
+        the data array is a mask or labelled image, thus it is subsampled
+        without smoothing, so its values are kept
+
+    Returns
+    -------
+    pyramid : list, size=(levels+1,)
+        data arrays, starting with the original array, where element [k,l] of
+        a level is located at [2*k,2*l] of the level below
+
+    See Also
+    --------
+    ..coupling_tools.match_posts_pyramid
+    """
+    sigma = (1, 1, 0)[:I.ndim]
+    pyramid = [I]
+    for level in range(levels):
+        I = I if mask else ndimage.gaussian_filter(I.astype(float), sigma)
+        I = I[::2, ::2, ...]
+        pyramid.append(I)
+    return pyramid
+
 def prepare_grids(im_stack, ds, cval=0):
     """prepare stack by padding, dependent on the matching template
 
@@ -364,6 +784,41 @@ def make_templates_same_size(I1,I2):
             I2sub = I2[+md:-md, +nd:-nd]
     return I1, I2sub
 
+def make_template_batches_same_size(I1, I2):
+    """ crop the center of a stack of search templates, so it has the same
+    dimension as a stack of templates
+
+    Parameters
+    ----------
+    I1 : np.array, size=(k,mt,nt)
+        stack of templates
+    I2 : np.array, size=(k,ms,ns)
+        stack of search templates
+
+    Returns
+    -------
+    I1 : np.array, size=(k,mt,nt)
+        stack of templates
+    I2sub : np.array, size=(k,mt,nt)
+        stack of cropped search templates
+
+    See Also
+    --------
+    make_templates_same_size : the same for a single template pair
+    """
+    assert isinstance(I1, np.ndarray), ("please provide an array")
+    assert isinstance(I2, np.ndarray), ("please provide an array")
+
+    mt, nt = I1.shape[-2], I1.shape[-1]  # dimension of the template
+    ms, ns = I2.shape[-2], I2.shape[-1]  # dimension of the search space
+
+    assert ms >= mt  # search domain should be of equal size or bigger
+    assert ns >= nt
+
+    md, nd = (ms-mt)//2, (ns-nt)//2
+    I2sub = I2[..., md:ms-md, nd:ns-nd]
+    return I1, I2sub
+
 def test_bounds_reposition(d, temp_size, search_size):
     """
     See Also
@@ -0,0 +1,441 @@
+# generic libraries
+import json
+import platform
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+import scipy
+
+from ..__version__ import __version__
+from ..generic.test_tools import create_sample_image_pair, \
+    create_sheared_image_pair
+from ..generic.handler_profiling import RESET_PEAK
+from .matching_tools_organization import list_frequency_correlators, \
+    list_spatial_correlators, list_peak_estimators, list_phase_estimators, \
+    get_displacement_sign
+from .coupling_tools import match_posts
+
+def get_benchmark_combinations(correlators=None, subpixes=None):
+    """ list the combinations of correlators and sub-pixel estimators that
+    can be benchmarked
+
+    Parameters
+    ----------
+    correlators : list, optional
+        abbreviations of the correlators, by default all frequency and spatial
+        correlators, see "list_frequency_correlators" and
+        "list_spatial_correlators"
+    subpixes : list, optional
+        abbreviations of the sub-pixel estimators, by default all, see
+        "list_peak_estimators" and "list_phase_estimators"
+
+    Returns
+    -------
+    combinations : list
+        tuples with the correlator and the sub-pixel estimator
+
+    Notes
+    -----
+    The phase plane estimators are only combined with frequency correlators,
+    while the 'optical_flow' refinement is not a peak estimator on its own,
+    hence it is left out.
+    """
+    frequency_based = list_frequency_correlators()
+    spatial_based = list_spatial_correlators()
+    phase_based = list_phase_estimators()
+    peak_based = [s for s in list_peak_estimators() if s != 'optical_flow']
+
+    if correlators is None:
+        correlators = frequency_based + spatial_based
+    if subpixes is None:
+        subpixes = peak_based + phase_based
+
+    combinations = []
+    for correlator in correlators:
+        for subpix in subpixes:
+            if (subpix in phase_based) and (correlator not in frequency_based):
+                continue
+            if (subpix not in peak_based) and (subpix not in phase_based):
+                continue
+            combinations.append((correlator, subpix))
+    return combinations
+
+def is_batched(correlator):
+    """ does the correlator make use of stacks of templates, see "match_posts"
+    """
+    return (correlator in ['dens_corr']) or \
+        ((correlator in list_frequency_correlators()) and
+         (correlator not in ['upsp_corr']))
+
+def get_sheared_displacement(d, di, dj, sh_i, sh_j, m=512, n=512):
+    """ get the displacement field of an image pair made through
+    "create_sheared_image_pair", in the convention of the spatial
+    correlators
+
+    Parameters
+    ----------
+    d : integer
+        radius of the template
+    di, dj : float, unit=pixel
+        random displacement of the pair
+    sh_i, sh_j : float, unit=image
+        shear of the pair
+    m, n : integer
+        dimension of the full resolution image
+
+    Returns
+    -------
+    Di, Dj : numpy.array, size=(2*d,2*d), dtype=float
+        displacement of every pixel of the templates
+    """
+    U, V = np.meshgrid(np.linspace(-1, 1, m), np.linspace(-1, 1, n),
+                       indexing='ij')
+    U = U[m//2-d:m//2+d, n//2-d:n//2+d]
+    V = V[m//2-d:m//2+d, n//2-d:n//2+d]
+
+    # the sampling position is shifted, thus the content moves the other way
+    Di = -(sh_i*V + di/m)*(m-1)/2
+    Dj = -(sh_j*U + dj/n)*(n-1)/2
+    return Di, Dj
+
+def create_benchmark_pairs(n_pairs=2, d=2**6, max_range=2., shear=0.,
+                           seed=0):
+    """ create image pairs with a known displacement field
+
+    Parameters
+    ----------
+    n_pairs : integer, default=2
+        amount of image pairs
+    d : integer, default=2**6
+        radius of the images
+    max_range : float, default=2.
+        maximum offset of the random displacement
+    shear : float, default=0.
+        shear in both directions, when given "create_sheared_image_pair" is
+        used instead of "create_sample_image_pair"
+    seed : integer, default=0
+        seed of the random displacements
+
+    Returns
+    -------
+    pairs : list
+        tuples with the images I1, I2, and the displacement Di, Dj of every
+        pixel, all of size=(2*d,2*d), where the displacement is in the
+        convention of the spatial correlators, see "get_displacement_sign"
+
+    See Also
+    --------
+    ..generic.test_tools.create_sample_image_pair,
+    ..generic.test_tools.create_sheared_image_pair
+    """
+    state = np.random.get_state()  # keep the random state of the user
+    np.random.seed(seed)
+    pairs = []
+    try:
+        for _ in range(n_pairs):
+            if shear == 0:
+                I1, I2, di, dj, _ = create_sample_image_pair(
+                    d=d, max_range=max_range)
+                Di, Dj = -di*np.ones_like(I1), -dj*np.ones_like(I1)
+            else:
+                I1, I2, di, dj, _ = create_sheared_image_pair(
+                    d=d, sh_i=shear, sh_j=shear, max_range=max_range)
+                Di, Dj = get_sheared_displacement(d, di, dj, shear, shear)
+            pairs.append((I1, np.nan_to_num(I2), Di, Dj))
+    finally:
+        np.random.set_state(state)
+    return pairs
+
+def benchmark_combination(pairs, correlator, subpix, temp_radius=8,
+                          noise=0., batch_size=None, n_templates=64,
+                          max_range=2., memory=True, seed=0):
+    """ measure the throughput, memory use and precision of a correlator and
+    sub-pixel estimator
+
+    Parameters
+    ----------
+    pairs : list
+        image pairs with known displacement, see "create_benchmark_pairs"
+    correlator : string
+        abbreviation of the correlator
+    subpix : string
+        abbreviation of the sub-pixel estimator
+    temp_radius : integer, default=8
+        radius of the templates
+    noise : float, default=0.
+        standard deviation of the additive noise, relative to the standard
+        deviation of the imagery
+    batch_size : integer, optional
+        amount of templates that are processed at once, see "match_posts"
+    n_templates : integer, default=64
+        amount of templates per image pair
+    max_range : float, default=2.
+        maximum offset of the pairs, used to set the search radius of the
+        spatial correlators
+    memory : bool, default=True
+        trace the peak memory use on the first pair, which is done in a
+        separate run, so it does not influence the timing. Before Python 3.9
+        the memory that is still allocated after the run is given instead
+    seed : integer, default=0
+        seed of the noise and the template positions
+
+    Returns
+    -------
+    record : dictionary
+        with the settings, and
+            * templates_per_second : throughput, without the warm-up
+            * memory_peak : allocated bytes above the start, in bytes, which
+              is NaN when the measurement failed
+            * rmse : root mean square error of the finite estimates, in pixels
+            * bias_i, bias_j : mean error, in pixels
+            * outliers : fraction of estimates that are not finite, or off
+              by more than a pixel
+            * error : message when the combination fails
+    """
+    if correlator in list_frequency_correlators():
+        search_radius = temp_radius
+    else:
+        search_radius = temp_radius + int(np.ceil(max_range)) + 1
+    record = {'correlator': correlator, 'subpix': subpix,
+              'temp_radius': int(temp_radius),
+              'search_radius': int(search_radius), 'noise': float(noise),
+              'batch_size': batch_size, 'n_templates': 0, 'time': np.nan,
+              'templates_per_second': np.nan, 'memory_peak': np.nan,
+              'rmse': np.nan, 'bias_i': np.nan, 'bias_j': np.nan,
+              'outliers': np.nan, 'error': None}
+
+    rng = np.random.default_rng(seed)
+    posts = []
+    for I1, I2, Di, Dj in pairs:
+        if noise > 0:
+            sigma = noise*np.std(I1)
+            I1 = I1 + rng.normal(scale=sigma, size=I1.shape)
+            I2 = I2 + rng.normal(scale=sigma, size=I2.shape)
+        margin = search_radius + 1
+        i = rng.integers(margin, I1.shape[0]-margin, size=n_templates)
+        j = rng.integers(margin, I1.shape[1]-margin, size=n_templates)
+        posts.append((I1, I2, i, j, Di[i, j], Dj[i, j]))
+    L = np.ones(pairs[0][0].shape, dtype=bool)
+    sign = get_displacement_sign(correlator)
+
+    def run(I1, I2, i, j):
+        di, dj, _ = match_posts(I1, I2, L, L, i, j, i, j,
+                                temp_radius=temp_radius,
+                                search_radius=search_radius,
+                                correlator=correlator, subpix=subpix,
+                                batch_size=batch_size)
+        return sign*np.ravel(di), sign*np.ravel(dj)
+
+    try:
+        I1, I2, i, j, _, _ = posts[0]
+        run(I1, I2, i[:2], j[:2])  # warm-up, for auxiliary arrays and plans
+
+        Err_i, Err_j, toc = [], [], 0.
+        for I1, I2, i, j, di_true, dj_true in posts:
+            tic = time.perf_counter()
+            di, dj = run(I1, I2, i, j)
+            toc += time.perf_counter() - tic
+            Err_i.append(di - di_true)
+            Err_j.append(dj - dj_true)
+
+    except Exception as e:
+        record['error'] = f'{type(e).__name__}: {e}'
+        return record
+
+    if memory:  # a failing measurement only leaves the memory unknown
+        start_tracing = not tracemalloc.is_tracing()
+        if start_tracing:
+            tracemalloc.start()
+        try:
+            if RESET_PEAK:
+                tracemalloc.reset_peak()
+            start = tracemalloc.get_traced_memory()[0]
+            I1, I2, i, j, _, _ = posts[0]
+            run(I1, I2, i, j)
+            current, peak = tracemalloc.get_traced_memory()
+            if not RESET_PEAK:  # the peak would be of the whole trace
+                peak = current
+            record['memory_peak'] = int(max(peak - start, 0))
+        except Exception:
+            pass
+        finally:
+            if start_tracing:
+                tracemalloc.stop()
+
+    Err_i, Err_j = np.concatenate(Err_i), np.concatenate(Err_j)
+    OK = np.logical_and(np.isfinite(Err_i), np.isfinite(Err_j))
+    Dist = np.hypot(Err_i, Err_j)
+    record.update({'n_templates': int(Err_i.size), 'time': toc,
+                   'templates_per_second': Err_i.size/toc,
+                   'outliers': 1 - np.mean(OK & (Dist <= 1))})
+    if np.any(OK):
+        record.update({'rmse': np.sqrt(np.mean(Dist[OK]**2)),
+                       'bias_i': np.mean(Err_i[OK]),
+                       'bias_j': np.mean(Err_j[OK])})
+    return record
+
+def run_matching_benchmark(correlators=None, subpixes=None,
+                           temp_radii=(8, 16), noise_levels=(0., .1),
+                           batch_sizes=(None, 256), shear=0., n_pairs=2,
+                           n_templates=64, d=2**6, max_range=2.,
+                           memory=True, seed=0, fname=None, callback=None):
+    """ benchmark combinations of correlators and sub-pixel estimators, over
+    a range of template sizes, noise levels and batch sizes
+
+    Parameters
+    ----------
+    correlators, subpixes : list, optional
+        abbreviations of the correlators and sub-pixel estimators, see
+        "get_benchmark_combinations"
+    temp_radii : tuple, default=(8, 16)
+        radii of the templates
+    noise_levels : tuple, default=(0., .1)
+        standard deviation of the additive noise, relative to the standard
+        deviation of the imagery
+    batch_sizes : tuple, default=(None, 256)
+        amount of templates processed at once, where None is one template at
+        a time. Correlators that do not work on stacks are only benchmarked
+        one template at a time
+    shear : float, default=0.
+        shear of the image pairs
+    n_pairs : integer, default=2
+        amount of image pairs
+    n_templates : integer, default=64
+        amount of templates per image pair
+    d : integer, default=2**6
+        radius of the image pairs
+    max_range : float, default=2.
+        maximum offset of the image pairs
+    memory : bool, default=True
+        trace the peak memory use
+    seed : integer, default=0
+        seed of the displacements, noise and template positions, thus a run
+        can be reproduced
+    fname : string, optional
+        path of a JSON file, where the results are written towards
+    callback : function, optional
+        called with every finished record, for example to follow the progress
+
+    Returns
+    -------
+    results : pandas.DataFrame
+        one row per setting, see "benchmark_combination"
+
+    See Also
+    --------
+    create_benchmark_pairs, benchmark_combination, read_matching_benchmark
+
+    Notes
+    -----
+    The image pairs are created once, as the interpolation of
+    "create_sample_image_pair" takes a few seconds, while the noise is added
+    for each setting.
+
+    The displacement of the pairs is given in the convention of the spatial
+    correlators, while the estimates of the other correlators are flipped
+    towards this convention, see "get_displacement_sign".
+
+    Example
+    -------
+    >>> df = run_matching_benchmark(correlators=['phas_corr', 'norm_corr'],
+    ...                             subpixes=['moment', 'tpss'],
+    ...                             fname='benchmark.json')
+    >>> df.groupby(['correlator', 'subpix'])['rmse'].mean()
+    """
+    assert d > 2*(np.max(temp_radii) + np.ceil(max_range) + 2), \
+        ('the image pairs are too small for these templates')
+    pairs = create_benchmark_pairs(n_pairs=n_pairs, d=d,
+                                   max_range=max_range, shear=shear,
+                                   seed=seed)
+
+    records = []
+    for correlator, subpix in get_benchmark_combinations(correlators,
+                                                         subpixes):
+        batches = batch_sizes if is_batched(correlator) else (None,)
+        for temp_radius in temp_radii:
+            for noise in noise_levels:
+                for batch_size in batches:
+                    record = benchmark_combination(
+                        pairs, correlator, subpix, temp_radius=temp_radius,
+                        noise=noise, batch_size=batch_size,
+                        n_templates=n_templates, max_range=max_range,
+                        memory=memory, seed=seed)
+                    record['shear'] = float(shear)
+                    records.append(record)
+                    if callback is not None:
+                        callback(record)
+
+    if fname is not None:
+        settings = {'temp_radii': list(temp_radii),
+                    'noise_levels': list(noise_levels),
+                    'batch_sizes': list(batch_sizes), 'shear': shear,
+                    'n_pairs': n_pairs, 'n_templates': n_templates, 'd': d,
+                    'max_range': max_range, 'seed': seed}
+        dump_matching_benchmark(records, fname, settings)
+    return pd.DataFrame(records)
+
+def get_benchmark_environment():
+    """ describe the software and machine a benchmark is run on
+
+    Returns
+    -------
+    environment : dictionary
+        versions of dhdt, python, numpy and scipy, and the machine
+    """
+    return {'dhdt': __version__, 'python': platform.python_version(),
+            'numpy': np.__version__, 'scipy': scipy.__version__,
+            'machine': platform.machine(), 'processor': platform.processor(),
+            'system': platform.system()}
+
+def dump_matching_benchmark(records, fname, settings=None):
+    """ write the results of a benchmark to a JSON file, together with a
+    description of the environment
+
+    Parameters
+    ----------
+    records : {list, pandas.DataFrame}
+        results, see "run_matching_benchmark"
+    fname : string
+        path of the file
+    settings : dictionary, optional
+        settings of the benchmark
+
+    See Also
+    --------
+    read_matching_benchmark
+    """
+    if isinstance(records, pd.DataFrame):
+        records = records.to_dict(orient='records')
+    # JSON has no NaN, thus missing values are written as null
+    records = [{key: (None if isinstance(value, float) and
+                      not np.isfinite(value) else value)
+                for key, value in record.items()} for record in records]
+    content = {'environment': get_benchmark_environment(),
+               'settings': {} if settings is None else settings,
+               'results': records}
+    with open(fname, 'w') as f:
+        json.dump(content, f, indent=1)
+
+def read_matching_benchmark(fname):
+    """ read the results of a benchmark, for example to compare releases
+
+    Parameters
+    ----------
+    fname : string
+        path of the JSON file, see "dump_matching_benchmark"
+
+    Returns
+    -------
+    results : pandas.DataFrame
+        one row per setting
+    environment : dictionary
+        description of the software and machine
+    settings : dictionary
+        settings of the benchmark
+    """
+    with open(fname, 'r') as f:
+        content = json.load(f)
+    return pd.DataFrame(content['results']), content['environment'], \
+        content['settings']
@@ -1,5 +1,6 @@
 import numpy as np
 
+from scipy import ndimage
 from skimage.morphology import extrema
 
 from ..preprocessing.image_transforms import high_pass_im
@@ -26,22 +27,27 @@ def get_correlation_metric(C, metric='peak_abs'):
     Parameters
     ----------
     C : numpy.array, size=(m,n)
-    metric : string
+    metric : {string, list}
         abbreviation for the metric type to be calculated, for the options see
-        "list_matching_metrics" for the options
+        "list_matching_metrics" for the options. When a list is given, all
+        these metrics are calculated
 
     Returns
     -------
-    score : float
-        metric of the matching peak in relation to its surface
+    score : {float, numpy.array}
+        metric of the matching peak in relation to its surface, an array of
+        size=(p,) when a list of p metrics is given
 
     See Also
     --------
-    list_matching_metrics
+    list_matching_metrics, get_correlation_metric_batch
     """
     # admin
     assert type(C) == np.ndarray, ('please provide an array')
     if C.size==0: return None
+    if isinstance(metric, (list, tuple)):
+        return np.array([np.squeeze(get_correlation_metric(C, metric=metr))
+                         for metr in metric], dtype=float)
 
     # redistribute correlation surface to the different functions
     if metric in ['peak_ratio']:
@@ -50,7 +56,7 @@ def get_correlation_metric(C, metric='peak_abs'):
         score = peak_rms_ratio(C)
     elif metric in ['peak_ener']:
         score = peak_corr_energy(C)
-    elif metric in ['peak_noise']:
+    elif metric in ['peak_nois', 'peak_noise']:
         score = peak_to_noise(C)
     elif metric in ['peak_conf']:
         score = peak_confidence(C)
@@ -66,6 +72,59 @@ def get_correlation_metric(C, metric='peak_abs'):
         score = np.argmax(C)
     return score
 
+def get_correlation_metric_batch(C, metric='peak_abs'):
+    """ redistribution function, to get a metric from a stack of matching score
+    surfaces
+
+    Parameters
+    ----------
+    C : numpy.array, size=(k,m,n)
+        stack of matching score surfaces
+    metric : {string, list}
+        abbreviation for the metric type to be calculated, for the options see
+        "list_matching_metrics" for the options. When a list is given, all
+        these metrics are calculated
+
+    Returns
+    -------
+    score : numpy.array, size=(k,) or (k,p)
+        metric of the matching peak in relation to its surface, for each of
+        the p metrics when a list is given
+
+    See Also
+    --------
+    get_correlation_metric : the same for a single surface
+    """
+    # admin
+    assert type(C) == np.ndarray, ('please provide an array')
+    assert C.ndim == 3, ('please provide a stack of surfaces, size=(k,m,n)')
+    if isinstance(metric, (list, tuple)):
+        return np.stack([get_correlation_metric_batch(C, metric=metr)
+                         for metr in metric], axis=1).astype(float)
+
+    # redistribute correlation surfaces to the different functions
+    if metric in ['peak_ratio']:
+        score = primary_peak_ratio_batch(C)
+    elif metric in ['peak_rms']:
+        score = peak_rms_ratio_batch(C)
+    elif metric in ['peak_ener']:
+        score = peak_corr_energy_batch(C)
+    elif metric in ['peak_nois', 'peak_noise']:
+        score = peak_to_noise_batch(C)
+    elif metric in ['peak_conf']:
+        score = peak_confidence_batch(C)
+    elif metric in ['peak_entr']:
+        score = entropy_corr_batch(C)
+    elif metric in ['peak_marg']:
+        score = primary_peak_margin_batch(C)
+    elif metric in ['peak_win']:
+        score = peak_winner_margin_batch(C)
+    elif metric in ['peak_num']:
+        score = num_of_peaks_batch(C)
+    else: # 'peak_abs'
+        score = np.argmax(C.reshape(C.shape[0], -1), axis=1)
+    return score
+
 def primary_peak_ratio(C):
     """ metric for uniqueness of the correlation estimate
     also known as, "Cross correlation peak ratio"
@@ -101,6 +160,32 @@ def primary_peak_ratio(C):
                     out=np.ones(1), where=val[1]!=0)
     return ppr
 
+def primary_peak_ratio_batch(C):
+    """ metric for uniqueness of a stack of correlation estimates
+
+    Parameters
+    ----------
+    C : numpy.array, size=(k,m,n), dtype=float
+        stack of correlation or similarity surfaces
+
+    Returns
+    --------
+    ppr : numpy.array, size=(k,), range={0..1}
+        peak ratio between primary and secondary peak
+
+    See Also
+    --------
+    primary_peak_ratio : the same for a single surface
+    """
+    from .matching_tools import get_peak_indices_batch
+
+    assert type(C) == np.ndarray, ('please provide an array')
+
+    _, val = get_peak_indices_batch(C, num_estimates=2)
+    ppr = np.divide(val[:,0], val[:,1],
+                    out=np.ones(C.shape[0]), where=val[:,1]!=0)
+    return ppr
+
 def primary_peak_margin(C):
     """ metric for dominance of the correlation estimate in relation to other
     candidates
@@ -133,6 +218,32 @@ def primary_peak_margin(C):
     ppm = val[0] - val[1]
     return ppm
 
+def primary_peak_margin_batch(C):
+    """ metric for dominance of a stack of correlation estimates in relation to
+    other candidates
+
+    Parameters
+    ----------
+    C : numpy.array, size=(k,m,n), dtype=float
+        stack of correlation or similarity surfaces
+
+    Returns
+    --------
+    ppm : numpy.array, size=(k,)
+        margin between primary and secondary peak
+
+    See Also
+    --------
+    primary_peak_margin : the same for a single surface
+    """
+    from .matching_tools import get_peak_indices_batch
+
+    assert type(C) == np.ndarray, ('please provide an array')
+
+    _, val = get_peak_indices_batch(C, num_estimates=2)
+    ppm = val[:,0] - val[:,1]
+    return ppm
+
 def peak_winner_margin(C):
     """ metric for dominance of the correlation estimate in relation to other
     candidates and their surrounding scores
@@ -161,6 +272,29 @@ def peak_winner_margin(C):
     pwm = primary_peak_margin(C)/np.sum(C)
     return pwm
 
+def peak_winner_margin_batch(C):
+    """ metric for dominance of a stack of correlation estimates in relation to
+    other candidates and their surrounding scores
+
+    Parameters
+    ----------
+    C : numpy.array, size=(k,m,n), dtype=float
+        stack of correlation or similarity surfaces
+
+    Returns
+    --------
+    pwm : numpy.array, size=(k,)
+        margin between primary and secondary peak
+
+    See Also
+    --------
+    peak_winner_margin : the same for a single surface
+    """
+    assert type(C) == np.ndarray, ('please provide an array')
+
+    pwm = primary_peak_margin_batch(C)/np.sum(C, axis=(1,2))
+    return pwm
+
 def num_of_peaks(C, filtering=True):
     """ metric for the uniqueness of a match
 
@@ -195,6 +329,40 @@ def num_of_peaks(C, filtering=True):
     nop = np.sum(peak_C)
     return nop
 
+def num_of_peaks_batch(C, filtering=True):
+    """ metric for the uniqueness of a stack of matches
+
+    Parameters
+    ----------
+    C : numpy.array, size=(k,m,n), dtype=float
+        stack of correlation or similarity surfaces
+    filtering : boolean
+        apply low-pass filtering, otherwise noise is also seen as a peak
+
+    Returns
+    --------
+    nop : numpy.array, size=(k,), dtype=integer
+        amount of peaks in each surface
+
+    See Also
+    --------
+    num_of_peaks : the same for a single surface
+
+    Notes
+    -----
+    A peak is an element that is not exceeded by its eight neighbours, thus
+    each element of a plateau is counted, though a flat surface has none.
+    """
+    assert type(C) == np.ndarray, ('please provide an array')
+
+    if filtering==True: # low pass filtering
+        C = C - high_pass_im(C, radius=3)
+
+    peak_C = ndimage.maximum_filter(C, size=(1,3,3), mode='nearest') == C
+    peak_C &= np.ptp(C, axis=(1,2))[:,np.newaxis,np.newaxis] > 0 # not flat
+    nop = np.sum(peak_C, axis=(1,2))
+    return nop
+
 def peak_rms_ratio(C):
     """ metric for uniqueness of the correlation estimate
     this is a similar metric as implemented in ROI_PAC [2]
@@ -227,6 +395,33 @@ def peak_rms_ratio(C):
     prmsr = np.divide( max_corr**2, C_rms)
     return prmsr
 
+def peak_rms_ratio_batch(C):
+    """ metric for uniqueness of a stack of correlation estimates
+
+    Parameters
+    ----------
+    C : numpy.array, size=(k,m,n), dtype=float
+        stack of correlation or similarity surfaces
+
+    Returns
+    --------
+    prmsr : numpy.array, size=(k,)
+        peak to root mean square ratio
+
+    See Also
+    --------
+    peak_rms_ratio : the same for a single surface
+    """
+    assert type(C) == np.ndarray, ('please provide an array')
+
+    max_corr = np.amax(C, axis=(1,2))
+    hlf_corr = np.divide( max_corr, 2)
+    noise = C<=hlf_corr[:,np.newaxis,np.newaxis]
+    C_rms = np.sqrt(np.sum(noise*C**2, axis=(1,2)) / np.sum(noise, axis=(1,2)))
+
+    prmsr = np.divide( max_corr**2, C_rms)
+    return prmsr
+
 def peak_corr_energy(C):
     """ metric for uniqueness of the correlation estimate,
     also known as, "signal to noise"
@@ -258,6 +453,30 @@ def peak_corr_energy(C):
     pce = np.divide(max_corr**2, E_c)
     return pce
 
+def peak_corr_energy_batch(C):
+    """ metric for uniqueness of a stack of correlation estimates
+
+    Parameters
+    ----------
+    C : numpy.array, size=(k,m,n), dtype=float
+        stack of correlation or similarity surfaces
+
+    Returns
+    --------
+    pce : numpy.array, size=(k,)
+        peak to correlation energy
+
+    See Also
+    --------
+    peak_corr_energy : the same for a single surface
+    """
+    assert type(C) == np.ndarray, ('please provide an array')
+
+    max_corr = np.amax(C, axis=(1,2))
+    E_c = np.sum(np.abs(C)**2, axis=(1,2))
+    pce = np.divide(max_corr**2, E_c)
+    return pce
+
 def peak_to_noise(C):
     """ metric for uniqueness of the correlation estimate
 
@@ -291,6 +510,34 @@ def peak_to_noise(C):
                    out=np.ones(1), where=mean_corr!=0)
     return snr
 
+def peak_to_noise_batch(C):
+    """ metric for uniqueness of a stack of correlation estimates
+
+    Parameters
+    ----------
+    C : numpy.array, size=(k,m,n), dtype=float
+        stack of correlation or similarity surfaces
+
+    Returns
+    --------
+    snr : numpy.array, size=(k,)
+        signal to noise ratio
+
+    See Also
+    --------
+    peak_to_noise : the same for a single surface
+    """
+    assert type(C) == np.ndarray, ('please provide an array')
+
+    C = C.reshape(C.shape[0], -1)
+    max_corr = np.amax(C, axis=1)
+    # mean of all other elements than the peak
+    mean_corr = (np.sum(C, axis=1) - max_corr) / (C.shape[1] - 1)
+    mean_corr = np.abs(mean_corr)
+    snr = np.divide(max_corr, mean_corr,
+                    out=np.ones(C.shape[0]), where=mean_corr!=0)
+    return snr
+
 def peak_confidence(C, radius=1):
     """ metric for steepness of a correlation peak
 
@@ -319,16 +566,51 @@ def peak_confidence(C, radius=1):
 
     assert type(C) == np.ndarray, ('please provide an array')
 
-    C_max = np.argmax(C)
-    ij = np.unravel_index(C_max, C.shape, order='F')
-    idx_2, idx_1 = ij[::-1]
+    idx_1, idx_2 = np.unravel_index(np.argmax(C), C.shape)
+    C_max = C[idx_1, idx_2]
 
     C_sub = get_template(C, idx_1, idx_2, radius).flatten()
 
-    C_mean, C_min = np.nanmean(C_sub), np.argmin(C_sub)
+    C_mean, C_min = np.nanmean(C_sub), np.nanmin(C_sub)
     q = np.divide(C_max - C_mean, C_mean - C_min)
     return q
 
+def peak_confidence_batch(C, radius=1):
+    """ metric for steepness of the peaks in a stack of correlation surfaces
+
+    Parameters
+    ----------
+    C : numpy.array, size=(k,m,n), dtype=float
+        stack of correlation or similarity surfaces
+    radius : integer, default=1
+        how far away should the sampling set be taken
+
+    Returns
+    --------
+    q : numpy.array, size=(k,)
+        confidence measure
+
+    See Also
+    --------
+    peak_confidence : the same for a single surface
+    """
+    assert type(C) == np.ndarray, ('please provide an array')
+
+    (k,m,n) = C.shape
+    C_max = np.argmax(C.reshape(k, -1), axis=1)
+    idx_1, idx_2 = np.unravel_index(C_max, (m,n))
+
+    # neighbourhood, which is clipped at the border, as in "get_template"
+    di, dj = np.mgrid[-radius:+radius+1, -radius:+radius+1]
+    sub_i = np.clip(idx_1[:,np.newaxis,np.newaxis] + di, 0, m-1)
+    sub_j = np.clip(idx_2[:,np.newaxis,np.newaxis] + dj, 0, n-1)
+    C_sub = C[np.arange(k)[:,np.newaxis,np.newaxis], sub_i, sub_j]
+
+    C_mean = np.nanmean(C_sub, axis=(1,2))
+    C_min = np.nanmin(C_sub, axis=(1,2))
+    q = np.divide(C[np.arange(k), idx_1, idx_2] - C_mean, C_mean - C_min)
+    return q
+
 def entropy_corr(C):
     """ metric for uniqueness of the correlation estimate
 
@@ -365,6 +647,50 @@ def entropy_corr(C):
                                               where=p!=0)))
     return disorder
 
+def entropy_corr_batch(C):
+    """ metric for uniqueness of a stack of correlation estimates
+
+    Parameters
+    ----------
+    C : numpy.array, size=(k,m,n), dtype=float
+        stack of correlation or similarity surfaces
+
+    Returns
+    --------
+    disorder : numpy.array, size=(k,)
+        entropy of the correlation surfaces
+
+    See Also
+    --------
+    entropy_corr : the same for a single surface
+
+    Notes
+    -----
+    The histograms of all surfaces are counted at once, by binning each
+    surface over its own range, and offsetting the bins of every surface.
+    """
+    assert type(C) == np.ndarray, ('please provide an array')
+
+    (k,m,n) = C.shape
+    C = C.reshape(k, -1)
+    sturges = 1.6 * (np.log2(m*n) + 1)
+    bins = int(np.ceil(sturges))
+
+    C_min, C_max = np.amin(C, axis=1), np.amax(C, axis=1)
+    C_rng = C_max - C_min
+    C_rng[C_rng == 0] = 1. # all in one bin, as for np.histogram
+    idx = np.floor((C - C_min[:,np.newaxis]) / C_rng[:,np.newaxis] * bins)
+    idx = np.clip(idx.astype(int), 0, bins-1) # the last bin includes the edge
+    idx += bins*np.arange(k)[:,np.newaxis]
+    values = np.bincount(idx.ravel(), minlength=k*bins).reshape(k, bins)
+
+    # normalize
+    p = np.divide(values, m*n)
+    # entropy calculation
+    disorder = - np.sum(np.multiply(p, np.log(p, out=np.zeros_like(p),
+                                              where=p!=0)), axis=1)
+    return disorder
+
 def hessian_spread(C, intI, intJ):
     """
 
@@ -428,6 +754,65 @@ def hessian_spread(C, intI, intJ):
     #V = np.array([[cov_ii, cov_ij],[cov_ij, cov_jj]])
     return cov_ii, cov_jj, cov_ij
 
+def hessian_spread_batch(C, intI, intJ):
+    """ estimate the co-variance of the peaks in a stack of correlation
+    surfaces, through their local curvature
+
+    Parameters
+    ----------
+    C : numpy.array, size=(k,m,n), dtype=float
+        stack of arrays with correlation values
+    intI : numpy.array, size=(k,), dtype=integer
+        location in rows of highest value in search space
+    intJ : numpy.array, size=(k,), dtype=integer
+        location in collumns of highest value in search space
+
+    Returns
+    -------
+    cov_ii : numpy.array, size=(k,)
+        first diagonal element of the co-variance matrix
+    cov_jj : numpy.array, size=(k,)
+        second diagonal element of the co-variance matrix
+    cov_ij : numpy.array, size=(k,)
+        off-diagonal element of the co-variance matrix
+
+    See Also
+    --------
+    hessian_spread : the same for a single surface
+    """
+    assert type(C) == np.ndarray, ('please provide an array')
+
+    # outside the surface is zero, as for a peak at the border
+    C = np.pad(C, ((0,0),(1,1),(1,1)))
+    k = np.arange(C.shape[0])
+    intI, intJ = np.asarray(intI).astype(int) + 1, \
+        np.asarray(intJ).astype(int) + 1
+
+    # local laplacian
+    dC_ii = -(C[k,intI-1,intJ] + C[k,intI+1,intJ] - 2*C[k,intI,intJ])
+    dC_jj = -(C[k,intI,intJ-1] + C[k,intI,intJ+1] - 2*C[k,intI,intJ])
+    dC_ij = (C[k,intI+1,intJ+1] + C[k,intI-1,intJ-1]) -\
+            (C[k,intI+1,intJ-1] -C[k,intI-1,intJ+1])
+
+    dC_ii /= 4
+    dC_jj /= 4
+    dC_ij /= 8
+
+    C_noise = np.maximum(1-C[k,intI,intJ], 0.)
+
+    psi = dC_ij**2 - dC_ii*dC_jj
+    denom = psi**2
+    cov_ii = np.divide(-C_noise * psi * dC_ii +
+                       C_noise**2 * (dC_ii**2 + dC_ij**2),
+                       denom)
+    cov_jj = np.divide(-C_noise * psi * dC_jj +
+                       C_noise**2 * (dC_jj**2 + dC_ij**2),
+                       denom)
+    cov_ij = np.divide((C_noise * psi -
+                       C_noise**2 * (dC_ii + dC_jj)) * dC_ij,
+                       denom)
+    return cov_ii, cov_jj, cov_ij
+
 def gauss_spread(C, intI, intJ, dI, dJ, est='dist'):
     """ estimate an oriented gaussian function through the vicinity of the
     correlation function
@@ -533,6 +918,97 @@ def gauss_spread(C, intI, intJ, dI, dJ, est='dist'):
         hess, frac = np.zeros((4)), 0
     return cov_ii, cov_jj, rho, hess, frac
 
+def gauss_spread_batch(C, intI, intJ, dI, dJ, est='dist'):
+    """ estimate oriented gaussian functions through the vicinity of the peaks
+    in a stack of correlation surfaces
+
+    Parametes
+    ---------
+    C : numpy.array, size=(k,m,n), dtype=float
+        stack of arrays with correlation values
+    intI, intJ : numpy.array, size=(k,), dtype=integer
+        location in rows and collumns of highest value in search space
+    dI, dJ : numpy.array, size=(k,), dtype=float
+        sub-pixel bias of top location along the row and collumn axis
+    est : string, default='dist'
+        - 'dist' do weighted least sqaures dependent on the distance from the
+          top location
+        otherwise : ordinary least squares
+
+    Returns
+    -------
+    cov_ii, cov_jj : numpy.array, size=(k,)
+        standard deviation of the vertical and horizontal axis
+    rho : numpy.array, size=(k,)
+        orientation of the Gaussian
+    hess : numpy.array, size=(k,4)
+        estimate of the least squares computation
+    frac : numpy.array, size=(k,)
+        scaling of the correlation peak
+
+    See Also
+    --------
+    gauss_spread : the same for a single surface
+
+    Notes
+    -----
+    All neighbourhoods are taken as 5x5 blocks, where elements that are not
+    used for a post get no weight, so all least squares problems are solved
+    at once.
+    """
+    assert type(C) == np.ndarray, ('please provide an array')
+
+    (k, m, n) = C.shape
+    C = C - np.mean(C, axis=(1,2), keepdims=True)
+    intI, intJ = np.asarray(intI).astype(int), np.asarray(intJ).astype(int)
+    dI, dJ = np.asarray(dI, dtype=float), np.asarray(dJ, dtype=float)
+
+    dub = np.where((np.minimum(intI, intJ) <= 1) | ((intI + 2) >= m) |
+                   ((intJ + 2) >= n), 1., 2.)[:,np.newaxis,np.newaxis]
+
+    # outside the surface is zero, as for a peak at the border
+    C = np.pad(C, ((0,0),(2,2),(2,2)))
+    I, J = np.mgrid[-2:+3, -2:+3]
+    P_sub = C[np.arange(k)[:,np.newaxis,np.newaxis],
+              intI[:,np.newaxis,np.newaxis] + 2 + I,
+              intJ[:,np.newaxis,np.newaxis] + 2 + J]
+    IN = np.logical_and(P_sub > 0,
+                        np.maximum(np.abs(I), np.abs(J)) <= dub)
+    I = I - dI[:,np.newaxis,np.newaxis]
+    J = J - dJ[:,np.newaxis,np.newaxis]
+
+    # normalize correlation score to probability function
+    frac = np.sum(P_sub*IN, axis=(1,2))
+    P_sub = np.divide(P_sub, frac[:,np.newaxis,np.newaxis],
+                      out=np.zeros_like(P_sub), where=IN)
+
+    A = np.stack((I**2, 2*I*J, J**2, np.ones_like(I)), axis=-1)
+    if est == 'dist':
+        W = (dub**2 - np.hypot(I, J)) / dub**2  # distance from top
+    else:
+        W = np.ones_like(I)
+    w = np.sqrt(np.maximum(W, 0)) * IN
+    Aw, yw = A * w[...,np.newaxis], P_sub * w
+
+    # least squares estimation of all posts at once
+    hess = np.linalg.pinv(Aw.reshape(k, -1, 4)) @ yw.reshape(k, -1, 1)
+    hess = hess[...,0]
+    # negative weights make the least squares fail, see "gauss_spread"
+    fail = np.any(np.logical_and(IN, W < 0), axis=(1,2))
+    hess[fail, :] = 0
+
+    # convert to parameters
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rho = (0.5 * hess[:,1]) / np.sqrt(hess[:,0] * hess[:,2])
+        cov_ii = 1 / (-2 * (1 - rho) * hess[:,0])
+        cov_jj = 1 / (-2 * (1 - rho) * hess[:,2])
+
+    # not enough data points
+    few = np.sum(IN, axis=(1,2)) <= 4
+    cov_ii[few], cov_jj[few], rho[few] = 0, 0, 0
+    hess[few, :], frac[few] = 0, 0
+    return cov_ii, cov_jj, rho, hess, frac
+
 def intensity_disparity(I1,I2):
     """
 
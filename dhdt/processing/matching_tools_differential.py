@@ -3,10 +3,11 @@ import warnings
 import numpy as np
 
 # image processing libraries
-from scipy import ndimage, interpolate
+from scipy import ndimage
 
-from ..preprocessing.image_transforms import mat_to_gray, histogram_equalization
-from ..processing.matching_tools import get_peak_indices
+from ..preprocessing.image_transforms import histogram_equalization
+from ..processing.matching_tools import get_peak_indices, get_hough_votes, \
+    refine_hough_peak
 from ..generic.filtering_statistical import make_2D_Gaussian
 from ..generic.handler_im import get_grad_filters, \
     nan_resistant_conv2, nan_resistant_diff2
@@ -86,7 +87,7 @@ def create_differential_data(I1,I2):
     return I_di, I_dj, I_dt
 
 def simple_optical_flow(I1, I2, window_size, sampleI, sampleJ,
-                        tau=1e-2, sigma=0.):  # processing
+                        tau=1e-8, sigma=0.):  # processing
     """ displacement estimation through optical flow
 
     Parameters
@@ -101,6 +102,9 @@ def simple_optical_flow(I1, I2, window_size, sampleI, sampleJ,
         grid with image coordinates, its vertical coordinate in a pixel system
     sampleJ: numpy.array, size=(k,l)
         grid with image coordinates, its horizontical coordinate
+    tau : float, default=1e-8
+        minimal eigenvalue of the structure tensor, see
+        "get_structure_tensor_flow"
     sigma: float
         smoothness for gaussian image blur
 
@@ -109,15 +113,15 @@ def simple_optical_flow(I1, I2, window_size, sampleI, sampleJ,
     Ugrd : numpy.array, size=(k,l)
         vertical displacement estimate, in "ij"-coordinate system
     Vgrd : numpy.array, size=(k,l)
-        vertical displacement estimate, in "ij"-coordinate system
+        horizontal displacement estimate, in "ij"-coordinate system
     Ueig : numpy.array, size=(k,l)
-        eigenvalue of system of equation for vertical estimate
+        largest eigenvalue of the structure tensor
     Veig : numpy.array, size=(k,l)
-        eigenvalue of system of equation for horizontal estimate
+        smallest eigenvalue of the structure tensor
 
     See Also
     --------
-    affine_optical_flow
+    dense_optical_flow, affine_optical_flow
 
     Notes
     -----
@@ -148,87 +152,223 @@ def simple_optical_flow(I1, I2, window_size, sampleI, sampleJ,
     .. [1] Lucas & Kanade, "An iterative image registration technique with an
        application to stereo vision", Proceedings of 7th international joint
        conference on artificial intelligence, 1981.
+
+    Example
+    -------
+    >>> import numpy as np
+    >>> from scipy import ndimage
+    >>> I1 = 1E3*ndimage.gaussian_filter(np.random.random((256,256)), 2)
+    >>> I2 = ndimage.shift(I1, (.4, -.3))
+    >>> i, j = np.mgrid[16:240:16, 16:240:16]
+    >>> U,V,_,_ = simple_optical_flow(I1, I2, 9, i, j)
+    >>> np.round(np.median(U), 2), np.round(np.median(V), 2)
+    (0.43, -0.32)
     """
     assert type(I1) == np.ndarray, ("please provide an array")
     assert type(I2) == np.ndarray, ("please provide an array")
 
     # check and initialize
-    if isinstance(sampleI, int):
-        sampleI = np.array([sampleI])
-    if isinstance(sampleJ, int):
-        sampleJ = np.array([sampleJ])
+    single = np.isscalar(sampleI)
+    sampleI, sampleJ = np.asarray(sampleI), np.asarray(sampleJ)
+    if sampleI.ndim>1:
+        assert sampleI.shape == sampleJ.shape
 
-    # if data range is bigger than 1, transform
-    if np.ptp(I1.flatten())>1:
-        I1 = mat_to_gray(I1)
-    if np.ptp(I1.flatten())>1:
-        I2 = mat_to_gray(I2)
+    # if data range is bigger than 1, transform both arrays with the same
+    # limits, as the temporal derivative needs comparable intensities
+    if np.maximum(np.ptp(I1), np.ptp(I2))>1:
+        I_min = np.minimum(np.min(I1), np.min(I2))
+        I_ptp = np.maximum(np.max(I1), np.max(I2)) - I_min
+        I1, I2 = (I1 - I_min) / I_ptp, (I2 - I_min) / I_ptp
 
     # smooth the image, so derivatives are not so steep
     if sigma!=0:
         I1 = ndimage.gaussian_filter(I1, sigma=sigma)
         I2 = ndimage.gaussian_filter(I2, sigma=sigma)
 
-    kernel_x = np.array(
-        [[-1., 1.],
-         [-1., 1.]]
-    ) * .25
-    kernel_y = np.array(
-         [[1., 1.],
-          [-1., -1.]]
-     ) * .25
-    kernel_t = np.array(
-        [[1., 1.],
-         [1., 1.]]
-    ) * .25
+    U, V, lambda_1, lambda_2 = get_structure_tensor_flow(
+        I1, I2, window_size, window='box', tau=tau)
 
-    fx = ndimage.convolve(I1, kernel_x)
-    fy = ndimage.convolve(I1, kernel_y)
-    ft = ndimage.convolve(I2, kernel_t) + ndimage.convolve(I1, -kernel_t)
+    Ugrd, Vgrd = U[sampleI, sampleJ], V[sampleI, sampleJ]
+    Ueig, Veig = lambda_1[sampleI, sampleJ], lambda_2[sampleI, sampleJ]
+    if single:
+        Ugrd, Vgrd, Ueig, Veig = Ugrd.item(), Vgrd.item(), \
+            Ueig.item(), Veig.item()
+    return Ugrd, Vgrd, Ueig, Veig
 
-    # grid or single estimation
-    if sampleI.ndim>1:
-        assert sampleI.shape == sampleJ.shape
-        Ugrd = np.zeros_like(sampleI, dtype="float")
-        Vgrd = np.zeros_like(sampleI, dtype="float")
-        Ueig,Veig = np.zeros_like(Ugrd), np.zeros_like(Ugrd)
+def get_structure_tensor_flow(I1, I2, window_size=5, window='box', tau=1e-8):
+    r""" estimate the displacement at every pixel, through the structure tensor
+    of its neighborhood, following Lucas & Kanade [1]
+
+    Parameters
+    ----------
+    I1 : numpy.array, size=(m,n)
+        array with intensities
+    I2 : numpy.array, size=(m,n)
+        array with intensities
+    window_size: integer, default=5
+        kernel size of the neighborhood
+    window : {'box' (default), 'gaussian'}
+        weighting of the neighborhood, where the full width at half maximum of
+        the Gaussian equals the window size
+    tau : float, default=1e-8
+        minimal eigenvalue of the structure tensor, below which the estimate is
+        set to zero, as the contrast is not sufficient in both directions
+
+    Returns
+    -------
+    U : numpy.array, size=(m,n)
+        vertical displacement estimate, in "ij"-coordinate system
+    V : numpy.array, size=(m,n)
+        horizontal displacement estimate, in "ij"-coordinate system
+    lambda_1, lambda_2 : numpy.array, size=(m,n)
+        largest and smallest eigenvalue of the structure tensor
+
+    See Also
+    --------
+    simple_optical_flow, dense_optical_flow
+
+    Notes
+    -----
+    The entries of the structure tensor and the mismatch vector are local
+    means of the products of the derivatives, thus all 2x2 systems of
+    equations are solved at once, through the determinant:
+
+        .. math:: \begin{bmatrix} u \\ v \end{bmatrix} =
+        - \begin{bmatrix}
+        \langle I_i I_i \rangle & \langle I_i I_j \rangle \\
+        \langle I_i I_j \rangle & \langle I_j I_j \rangle
+        \end{bmatrix}^{-1}
+        \begin{bmatrix}
+        \langle I_i I_t \rangle \\ \langle I_j I_t \rangle
+        \end{bmatrix}
+
+    The displacement is the one of the content, going from the first towards
+    the second image, thus I2(i+u,j+v) = I1(i,j).
+
+    References
+    ----------
+    .. [1] Lucas & Kanade, "An iterative image registration technique with an
+       application to stereo vision", Proceedings of 7th international joint
+       conference on artificial intelligence, 1981.
+    """
+    if window in ('gaussian'):
+        local_mean = ndimage.gaussian_filter
+        window_size = window_size / (2*np.sqrt(2*np.log(2))) # fwhm to sigma
     else:
-        Ugrd,Vgrd,Ueig,Veig = 0,0,0,0
-
-    # window_size should be odd
-    radius = np.floor(window_size / 2).astype('int')
-    for iIdx in np.arange(sampleI.size):
-        iIm = sampleI.flat[iIdx]
-        jIm = sampleJ.flat[iIdx]
-
-        if sampleI.ndim>1:
-            (iGrd, jGrd) = np.unravel_index(iIdx, sampleI.shape)
-
-        # get templates
-        Ix = fx[iIm - radius:iIm + radius + 1,
-                jIm - radius:jIm + radius + 1].flatten()
-        Iy = fy[iIm - radius:iIm + radius + 1,
-                jIm - radius:jIm + radius + 1].flatten()
-        It = ft[iIm - radius:iIm + radius + 1,
-                jIm - radius:jIm + radius + 1].flatten()
-
-        # look if variation is present
-        if np.std(It) != 0:
-            b = It  # get b here
-            A = np.stack((Ix, Iy), axis=1)  # get A here
-
-            # caluclate eigenvalues to see directional contrast distribution
-            epsilon = np.linalg.eigvals(np.matmul(A.T, A))
-            nu = np.matmul(np.linalg.pinv(A), -b)  # get velocity here
-
-            if sampleI.ndim>1:
-                Ugrd[iGrd,jGrd], Vgrd[iGrd,jGrd] = nu[0][0],nu[1][0]
-                Ueig[iGrd,jGrd], Veig[iGrd,jGrd] = epsilon[0],epsilon[1]
-            else:
-                Ugrd, Vgrd = nu[1][0], nu[0][0]
-                Ueig, Veig = epsilon[1], epsilon[0]
+        local_mean = ndimage.uniform_filter
+
+    # spatial derivatives of the mean image, and the temporal derivative
+    I_di, I_dj = np.gradient((I1 + I2) / 2)
+    I_dt = I2 - I1
+
+    S_ii = local_mean(I_di*I_di, window_size)
+    S_jj = local_mean(I_dj*I_dj, window_size)
+    S_ij = local_mean(I_di*I_dj, window_size)
+    b_i = local_mean(I_di*I_dt, window_size)
+    b_j = local_mean(I_dj*I_dt, window_size)
+
+    # closed form eigenvalues and inverse of the 2x2 systems
+    det = S_ii*S_jj - S_ij**2
+    half_tr = (S_ii + S_jj) / 2
+    disc = np.sqrt(np.maximum(half_tr**2 - det, 0))
+    lambda_1, lambda_2 = half_tr + disc, half_tr - disc
+
+    OK = lambda_2 > tau
+    det[~OK] = 1.
+    U = np.where(OK, -(S_jj*b_i - S_ij*b_j) / det, 0)
+    V = np.where(OK, -(S_ii*b_j - S_ij*b_i) / det, 0)
+    return U, V, lambda_1, lambda_2
+
+def dense_optical_flow(I1, I2, window_size=5, window='box', levels=0,
+                       iteration=1, tau=1e-8, sigma=0.,
+                       sampleI=None, sampleJ=None):
+    """ displacement estimation through optical flow, for every pixel of an
+    image, optionally over an image pyramid
 
-    return Ugrd, Vgrd, Ueig, Veig
+    Parameters
+    ----------
+    I1 : numpy.array, size=(m,n)
+        array with intensities
+    I2 : numpy.array, size=(m,n)
+        array with intensities
+    window_size: integer, default=5
+        kernel size of the neighborhood
+    window : {'box' (default), 'gaussian'}
+        weighting of the neighborhood
+    levels : integer, default=0
+        amount of times the imagery is halved, the estimate of a coarse level
+        is used to warp the second image at the finer level
+    iteration : integer, default=1
+        amount of warping and estimation steps at every level
+    tau : float, default=1e-8
+        minimal eigenvalue of the structure tensor
+    sigma: float, default=0.
+        smoothness for gaussian image blur
+    sampleI, sampleJ : numpy.array, size=(k,l), optional
+        grid with image coordinates, where the estimate is sampled, by default
+        the full resolution estimate is given
+
+    Returns
+    -------
+    U : numpy.array, size=(m,n) or (k,l)
+        vertical displacement estimate, in "ij"-coordinate system
+    V : numpy.array, size=(m,n) or (k,l)
+        horizontal displacement estimate, in "ij"-coordinate system
+    cond : numpy.array, size=(m,n) or (k,l)
+        condition number of the structure tensor at the finest level
+
+    See Also
+    --------
+    get_structure_tensor_flow, simple_optical_flow, affine_optical_flow
+
+    Example
+    -------
+    >>> import numpy as np
+    >>> from scipy import ndimage
+    >>> I1 = ndimage.gaussian_filter(np.random.random((256,256)), 2)
+    >>> I2 = ndimage.shift(I1, (.8, -1.6))
+    >>> U,V,cond = dense_optical_flow(I1, I2, window_size=9, levels=2)
+    >>> np.round(np.median(U), 1), np.round(np.median(V), 1)
+    (0.8, -1.6)
+    """
+    from .matching_tools import get_image_pyramid # combating import loops
+    assert type(I1) == np.ndarray, ("please provide an array")
+    assert type(I2) == np.ndarray, ("please provide an array")
+
+    I1, I2 = I1.astype(float), I2.astype(float)
+    if sigma!=0:
+        I1 = ndimage.gaussian_filter(I1, sigma=sigma)
+        I2 = ndimage.gaussian_filter(I2, sigma=sigma)
+
+    pyr_1 = get_image_pyramid(I1, levels)
+    pyr_2 = get_image_pyramid(I2, levels)
+
+    U, V = np.zeros_like(pyr_1[-1]), np.zeros_like(pyr_1[-1])
+    for level in range(levels, -1, -1):
+        I1, I2 = pyr_1[level], pyr_2[level]
+        (m,n) = I1.shape
+        grd_i, grd_j = np.mgrid[0:m, 0:n].astype(float)
+        if U.shape != (m,n): # upsample estimate of the coarser level
+            coords = [grd_i/2, grd_j/2]
+            U = 2*ndimage.map_coordinates(U, coords, order=1, mode='nearest')
+            V = 2*ndimage.map_coordinates(V, coords, order=1, mode='nearest')
+
+        C2 = ndimage.spline_filter(I2, order=3)
+        for _ in range(iteration):
+            I2_new = ndimage.map_coordinates(C2, [grd_i + U, grd_j + V],
+                                             order=3, mode='nearest',
+                                             prefilter=False)
+            dU, dV, lambda_1, lambda_2 = get_structure_tensor_flow(
+                I1, I2_new, window_size, window=window, tau=tau)
+            U += dU
+            V += dV
+
+    cond = np.divide(lambda_1, lambda_2, out=np.full_like(lambda_1, np.inf),
+                     where=lambda_2>0)
+    if sampleI is not None:
+        U, V = U[sampleI, sampleJ], V[sampleI, sampleJ]
+        cond = cond[sampleI, sampleJ]
+    return U, V, cond
 
 def affine_optical_flow(I1, I2, model='affine', iteration=10,
                         preprocessing=None, episolar=np.array([])):
@@ -328,6 +468,23 @@ def affine_optical_flow(I1, I2, model='affine', iteration=10,
                                 np.linspace(-(nI-1)/2, +(nI-1)/2, nI),
                                 indexing='ij')
     stk_ij = np.vstack( (grd_i.flatten(), grd_j.flatten()) ).T
+    # cubic B-spline coefficients, so the warping is a direct evaluation
+    C2 = ndimage.spline_filter(I2.astype(float), order=3)
+
+    # the Jacobian and Hessian are based upon the first image, hence these
+    # only change, when data drops out through the warping
+    grd_i, grd_j = grd_i.flatten(), grd_j.flatten()
+    if model in ('affine'):
+        W = W.flatten()
+        I_di, I_dj = I_di.flatten(), I_dj.flatten()
+        dWdp = np.array([
+                  I_di * grd_i,
+                  I_dj * grd_i,
+                  I_di * grd_j,
+                  I_dj * grd_j,
+                  I_di, I_dj])
+        W_dWdp = W * dWdp
+        H = W_dWdp @ dWdp.T
 
     # initialize iteration
     p = np.zeros((1,6), dtype=float)
@@ -338,36 +495,25 @@ def affine_optical_flow(I1, I2, model='affine', iteration=10,
         grd_new = np.matmul(Aff,
                             np.vstack((stk_ij.T,
                                        np.ones(mnI))))
-        new_i = np.reshape(grd_new[0,:], (mI, nI))
-        new_j = np.reshape(grd_new[1,:], (mI, nI))
+        new_i = np.reshape(grd_new[0,:], (mI, nI)) + (mI-1)/2
+        new_j = np.reshape(grd_new[1,:], (mI, nI)) + (nI-1)/2
 
         # construct new templates
-        try:
-            I2_new = interpolate.griddata(stk_ij, I2.flatten().T,
-                                          (new_i,new_j), method='cubic')
-            I2_new = ndimage.convolve(I2_new, make_2D_Gaussian((3,3), fwhm=3))
-        except:
-            print('different number of values and points')
+        I2_new = ndimage.map_coordinates(C2, [new_i, new_j], order=3,
+                                         mode='constant', cval=np.nan,
+                                         prefilter=False)
+        I2_new = ndimage.convolve(I2_new, make_2D_Gaussian((3,3), fwhm=3))
 
         I_dt_new = I2_new - I1
 
         # compose Jacobian and Hessian
-        grd_i, grd_j = grd_i.flatten(), grd_j.flatten()
         if model in ('affine', 'similarity'):
-            I_dt_new, W = I_dt_new.flatten(), W.flatten()
+            I_dt_new = I_dt_new.flatten()
             IN = ~np.isnan(I_dt_new)
-            I_di, I_dj = I_di.flatten(), I_dj.flatten()
 
             if model in ('affine'):
-                dWdp = np.array([
-                          I_di * grd_i,
-                          I_dj * grd_i,
-                          I_di * grd_j,
-                          I_dj * grd_j,
-                          I_di, I_dj])
-
-                A = (np.tile(W[IN],(6,1)) * dWdp[:,IN]) @ dWdp[:,IN].T
-                y = (np.tile(W[IN],(6,1)) * dWdp[:,IN]) @ (I_dt_new[IN] * W[IN])
+                A = H if np.all(IN) else W_dWdp[:,IN] @ dWdp[:,IN].T
+                y = W_dWdp[:,IN] @ (I_dt_new[IN] * W[IN])
             elif model in ():
                 dWdp = np.array([
                     (I_di * grd_i) - (I_di * grd_j),
@@ -420,7 +566,7 @@ def affine_optical_flow(I1, I2, model='affine', iteration=10,
 
 def hough_optical_flow(I1, I2, param_resol=100, sample_fraction=1,
                        num_estimates=1, max_amp=1,
-                       preprocessing=None):
+                       preprocessing=None, refine=0):
     """ estimating optical flow through the Hough transform
 
     Parameters
@@ -445,14 +591,22 @@ def hough_optical_flow(I1, I2, param_resol=100, sample_fraction=1,
             sensing imagery [2]
     num_estimates : integer
         amount of displacement estimates
+    refine : integer, default=0
+        amount of refinements of the voting space around a peak, see
+        "hough_sinus"
 
     Returns
     -------
     di,dj : float
-        sub-pixel displacement
+        sub-pixel displacement, in the convention of the frequency
+        correlators, thus I2(i-di,j-dj) = I1(i,j)
     score : float, range=0...1
         probability or amount of support for the estimate
 
+    See Also
+    --------
+    hough_sinus, .matching_tools_organization.get_displacement_sign
+
     References
     ----------
     .. [1] Fennema & Thompson, "Velocity determination in scenes containing
@@ -460,6 +614,17 @@ def hough_optical_flow(I1, I2, param_resol=100, sample_fraction=1,
        pp.301-317, 1979.
     .. [2] Guo & Lü, "Phase-shifting algorithm by use of Hough transform"
        Optics express vol.20(23) pp.26037-26049, 2012.
+
+    Example
+    -------
+    >>> import numpy as np
+    >>> from scipy import ndimage
+    >>> I1 = ndimage.gaussian_filter(np.random.random((64,64)), 2)
+    >>> I2 = ndimage.shift(I1, (.4, -.3))
+    >>> di,dj,_ = hough_optical_flow(I1, I2)
+
+    >>> assert(np.isclose(di, -.4, atol=.1))
+    >>> assert(np.isclose(dj, +.3, atol=.1))
     """
     assert type(I1) == np.ndarray, ("please provide an array")
     assert type(I2) == np.ndarray, ("please provide an array")
@@ -482,19 +647,24 @@ def hough_optical_flow(I1, I2, param_resol=100, sample_fraction=1,
     IN = np.logical_and(~np.logical_and(I_di == 0, I_dj == 0),
                         np.logical_or(Msk_1, Msk_2))
 
-    di, dj, score = hough_sinus(theta_G[IN], rho[IN],
-                                param_resol=param_resol,
-                                max_amp=max_amp,
-                                sample_fraction=sample_fraction,
-                                num_estimates=num_estimates,
-                                indexing='cartesian')
+    # the gradient angle is taken from the vertical axis, hence the cosine
+    # relates to the vertical and the sine to the horizontal displacement
+    v_H, u_H, score = hough_sinus(theta_G[IN], rho[IN],
+                                  param_resol=param_resol,
+                                  max_amp=max_amp,
+                                  sample_fraction=sample_fraction,
+                                  num_estimates=num_estimates,
+                                  indexing='cartesian', refine=refine)
+    # the coefficients follow the displacement of the content, while the
+    # estimate is given in the convention of the frequency correlators
+    di, dj = -v_H, -u_H
     # import matplotlib.pyplot as plt
     # plt.hexbin(theta_G[IN], rho[IN], extent=(-3.14, +3.14, -1, +1)), plt.show()
     return di,dj, score
 
 def hough_sinus(phi,rho,
                 param_resol=100, max_amp=1, sample_fraction=1,
-                num_estimates=1, indexing='polar'):
+                num_estimates=1, indexing='polar', refine=0):
     """ estimates parameters of sinus curve through the Hough transform
 
     Parameters
@@ -513,13 +683,21 @@ def hough_sinus(phi,rho,
         * > 1 : uses a random collection of the number specified
     num_estimates : integer
         amount of displacement estimates
+    indexing : {'polar', 'cartesian'}
+        parameterization of the estimate
+    refine : integer, default=0
+        amount of refinements of the voting space around a peak, each with a
+        four times smaller bin size
 
     Returns
     -------
     phi_H : float
-        estimated argument of the curve
+        estimated argument of the curve, when "indexing" is 'polar'
     rho_H : float
-        estimated amplitude of the curve
+        estimated amplitude of the curve, when "indexing" is 'polar'
+    v_H, u_H : float
+        estimated coefficients of the cosine and the sine, thus
+        rho = v_H*cos(phi) + u_H*sin(phi), when "indexing" is 'cartesian'
     score_H : float, range=0...1
         probability of support of the estimate
 
@@ -528,7 +706,7 @@ def hough_sinus(phi,rho,
     .. [1] Guo & Lü, "Phase-shifting algorithm by use of Hough transform"
        Optics express vol.20(23) pp.26037-26049, 2012.
     """
-    param_resol = param_resol.astype(int)
+    param_resol = int(param_resol)
     phi,rho = phi.flatten(), rho.flatten()
     sample_size = rho.size
     if sample_fraction==1:
@@ -542,16 +720,12 @@ def hough_sinus(phi,rho,
                                np.round(sample_size*sample_fraction).astype(np.int32),
                                replace=False)
 
-    (u,v) = np.meshgrid(np.linspace(-max_amp,+max_amp, param_resol),
-                        np.linspace(-max_amp,+max_amp, param_resol))
-    vote = np.zeros((param_resol, param_resol), dtype=np.float32)
-
-    for counter in idx:
-        diff = rho[counter] - \
-               (u*+np.sin(phi[counter]) +
-                v*+np.cos(phi[counter]))
-        # Gaussian weighting
-        vote += np.exp(-np.abs(diff*param_resol))
+    u = np.linspace(-max_amp,+max_amp, param_resol)
+    v = np.linspace(-max_amp,+max_amp, param_resol)
+    # rho = u*sin(phi) + v*cos(phi), with v along the rows of the voting space
+    A = np.stack((np.cos(phi[idx]), np.sin(phi[idx])), axis=1)
+    vote = get_hough_votes(A, rho[idx], v, u, weighting='laplace',
+                           scale=1/param_resol)
     # import matplotlib.pyplot as plt
     # plt.imshow(vote, extent=(-max_amp,+max_amp,-max_amp,+max_amp)), plt.show()
 
@@ -559,22 +733,21 @@ def hough_sinus(phi,rho,
     ind,score = get_peak_indices(vote, num_estimates=num_estimates)
     score /= sample_size # normalize
 
+    u_H, v_H = u[ind[:,1]], v[ind[:,0]]
+    spacing = (v[1]-v[0], u[1]-u[0])
+    for cnt,sc in enumerate(score):
+        if sc==0:
+            u_H[cnt], v_H[cnt] = 0, 0
+        elif refine>0:
+            v_H[cnt], u_H[cnt], _ = refine_hough_peak(
+                A, rho[idx], v_H[cnt], u_H[cnt], spacing, levels=refine,
+                weighting='laplace', scale=1/param_resol)
+
     if indexing in ('polar'):
-        rho_H, phi_H = np.zeros(num_estimates), np.zeros(num_estimates)
-        for cnt,sc in enumerate(score):
-            if sc!=0:
-                rho_H[cnt] = np.sqrt( u[ind[cnt,0]][ind[cnt,1]]**2 +
-                                 v[ind[cnt,0]][ind[cnt,1]]**2 )
-                phi_H[cnt] = np.arctan2(u[ind[cnt,0]][ind[cnt,1]],
-                                   v[ind[cnt,0]][ind[cnt,1]])
+        rho_H = np.hypot(u_H, v_H)
+        phi_H = np.arctan2(u_H, v_H)
         return phi_H, rho_H
     elif indexing in ('cartesian'):
-        u_H, v_H = np.zeros(num_estimates), np.zeros(num_estimates)
-        for cnt,sc in enumerate(score):
-            if sc!=0:
-                u_H[cnt] = u[ind[cnt,0]][ind[cnt,1]]
-                v_H[cnt] = v[ind[cnt,0]][ind[cnt,1]]
-
         # A_H = np.sqrt(u_H ** 2 + v_H ** 2)
         # phi_H = np.arctan2(u_H, v_H)
         # psi = np.linspace(-np.pi, +np.pi)
@@ -585,7 +758,7 @@ def hough_sinus(phi,rho,
         # plt.plot(psi, curv), plt.show()
         # plt.show(), plt.colorbar()
 
-        return u_H, v_H, score
+        return v_H, u_H, score
 # no_signals
 
 #todo episolar_optical_flow
@@ -1,11 +1,14 @@
 # general libraries
+import warnings
 import numpy as np
 from scipy import fftpack, ndimage
 
+from ..generic.handler_fft import fft, ifft, fft2, ifft2, rfft2, irfft2
 from ..generic.handler_im import get_grad_filters
 from .matching_tools import \
     reposition_templates_from_center, make_templates_same_size, \
-    get_integer_peak_location
+    get_integer_peak_location, make_template_batches_same_size, \
+    get_integer_peak_location_batch
 from .matching_tools_frequency_filters import \
     raised_cosine, thresh_masking, normalize_power_spectrum, gaussian_mask
 from .matching_tools_harmonic_functions import create_complex_fftpack_DCT
@@ -74,7 +77,7 @@ def cosi_corr(I1, I2, beta1=.35, beta2=.50, m=1e-4):
 
             for i in range(bands): # loop through all bands
                 I1bnd, I2bnd = I1sub[:,:,i], I2sub[:,:,i]
-                S1, S2 = np.fft.fft2(I1bnd), np.fft.fft2(I2bnd)
+                S1, S2 = fft2(I1bnd), fft2(I2bnd)
 
                 if i == 0:
                     Q = (W1*S1)*np.conj((W2*S2))
@@ -83,18 +86,18 @@ def cosi_corr(I1, I2, beta1=.35, beta2=.50, m=1e-4):
                     Q = (1/(i+1))*Q_b + (i/(i+1))*Q
         else:
             I1sub,I2sub = reposition_templates_from_center(I1,I2,di,dj)
-            S1, S2 = np.fft.fft2(I1sub), np.fft.fft2(I2sub)
+            S1, S2 = fft2(I1sub), fft2(I2sub)
 
             Q = (W1*S1)*np.conj((W2*S2))
 
         # transform back to spatial domain
-        C = np.real(np.fft.fftshift(np.fft.ifft2(Q)))
+        C = np.real(np.fft.fftshift(ifft2(Q)))
         ddi, ddj,_,_ = get_integer_peak_location(C)
         m_int = np.round(np.array([ddi, ddj])).astype(int)
-        if np.amax(abs(np.array([ddi, ddj])))<.5:
+        if (np.amax(abs(np.array([ddi, ddj])))<.5) or (trying==tries[-1]):
             break
-        else:
-            di,dj = m_int[0], m_int[1]
+        else: # the cross-spectrum is relative to the repositioned template
+            di,dj = di+m_int[0], dj+m_int[1]
 
     m0[0] += di
     m0[1] += dj
@@ -163,7 +166,7 @@ def cosine_corr(I1, I2):
         # C2 = create_complex_DCT(I2sub, Cc, Cs)
         Q = (C1)*np.conj(C2)
         Qn = normalize_power_spectrum(Q)
-        C = np.fft.fftshift(np.real(np.fft.ifft2(Qn)))
+        C = np.fft.fftshift(np.real(ifft2(Qn)))
     return C
 
 def masked_cosine_corr(I1, I2, M1, M2): #todo
@@ -301,7 +304,7 @@ def phase_only_corr(I1, I2):
         for i in range(bands): # loop through all bands
             I1bnd, I2bnd = I1sub[:,:,i], I2sub[:,:,i]
 
-            S1, S2 = np.fft.fft2(I1bnd), np.fft.fft2(I2bnd)
+            S1, S2 = fft2(I1bnd), fft2(I2bnd)
             W2 = np.divide(1, np.abs(I2bnd),
                            out=np.zeros_like(I2bnd), where=I2bnd!=0)
             if i == 0:
@@ -313,7 +316,7 @@ def phase_only_corr(I1, I2):
     else:
         I1sub,I2sub = make_templates_same_size(I1,I2)
 
-        S1, S2 = np.fft.fft2(I1sub), np.fft.fft2(I2sub)
+        S1, S2 = fft2(I1sub), fft2(I2sub)
 
         W2 = np.divide(1, np.abs(I2sub),
                        out=np.zeros_like(I2sub), where=I2sub!=0)
@@ -362,7 +365,7 @@ def projected_phase_corr(I1, I2, M1=np.array(()), M2=np.array(())):
         # windowing
         I_w = I_p*np.hamming(I_p.size)
         # Fourier transform
-        S = np.fft.fft(I_w)
+        S = fft(I_w)
         if axis==1:
             S = S.T
         return S
@@ -375,12 +378,12 @@ def projected_phase_corr(I1, I2, M1=np.array(()), M2=np.array(())):
     S1_m = project_spectrum(I1sub, M1, axis=0)
     S2_m = project_spectrum(I2sub, M2, axis=0)
     Q12_m = phase_corr_1d(S1_m, S2_m)
-    C_m = np.fft.fftshift(np.real(np.fft.ifft(Q12_m)))
+    C_m = np.fft.fftshift(np.real(ifft(Q12_m)))
 
     S1_n = project_spectrum(I1sub, M1, axis=1)
     S2_n = project_spectrum(I2sub, M2, axis=1)
     Q12_n = phase_corr_1d(S1_n, S2_n)
-    C_n = np.fft.fftshift(np.real(np.fft.ifft(Q12_n)))
+    C_n = np.fft.fftshift(np.real(ifft(Q12_n)))
 
     C = np.sqrt(np.outer(C_m, C_n))
     return C
@@ -506,7 +509,7 @@ def symmetric_phase_corr(I1, I2):
         for i in range(bands): # loop through all bands
             I1bnd, I2bnd = I1sub[:,:,i], I2sub[:,:,i]
 
-            S1, S2 = np.fft.fft2(I1bnd), np.fft.fft2(I2bnd)
+            S1, S2 = fft2(I1bnd), fft2(I2bnd)
             W2 = np.divided(1, np.sqrt(abs(S1))*np.sqrt(abs(S2)) )
             if i == 0:
                 Q = (S1)*np.conj((W2*S2))
@@ -517,7 +520,7 @@ def symmetric_phase_corr(I1, I2):
     else:
         I1sub,I2sub = make_templates_same_size(I1,I2)
 
-        S1, S2 = np.fft.fft2(I1sub), np.fft.fft2(I2sub)
+        S1, S2 = fft2(I1sub), fft2(I2sub)
         W2 = np.divide(1, np.sqrt(abs(I1sub))*np.sqrt(abs(I2sub)) )
 
         Q = (S1)*np.conj((W2*S2))
@@ -569,7 +572,7 @@ def amplitude_comp_corr(I1, I2, F_0=0.04):
         for i in range(bands): # loop through all bands
             I1bnd, I2bnd = I1sub[:,:,i], I2sub[:,:,i]
 
-            S1, S2 = np.fft.fft2(I1bnd), np.fft.fft2(I2bnd)
+            S1, S2 = fft2(I1bnd), fft2(I2bnd)
             s_0 = F_0 * np.amax(abs(S2))
 
             W = np.divide(1, abs(I2sub), \
@@ -586,7 +589,7 @@ def amplitude_comp_corr(I1, I2, F_0=0.04):
     else:
         I1sub,I2sub = make_templates_same_size(I1,I2)
 
-        S1, S2 = np.fft.fft2(I1sub), np.fft.fft2(I2sub)
+        S1, S2 = fft2(I1sub), fft2(I2sub)
         s_0 = F_0 * np.amax(abs(S2))
 
         W = np.divide(1, abs(I2sub), \
@@ -644,7 +647,7 @@ def robust_corr(I1, I2):
         I1p = 1/p**(1/3) * np.exp(1j*(2*p -1)*I1sub)
         I2p = 1/p**(1/3) * np.exp(1j*(2*p -1)*I2sub)
 
-        S1p, S2p = np.fft.fft2(I1p), np.fft.fft2(I2p)
+        S1p, S2p = fft2(I1p), fft2(I2p)
         if idx==0:
             Q = (S1p)*np.conj(S2p)
         else:
@@ -708,7 +711,7 @@ def gradient_corr(I1, I2):
             G1 = ndimage.convolve(I1bnd, H_x) + 1j*ndimage.convolve(I1bnd, H_y)
             G2 = ndimage.convolve(I2bnd, H_x) + 1j*ndimage.convolve(I2bnd, H_y)
 
-            S1, S2 = np.fft.fft2(G1), np.fft.fft2(G2)
+            S1, S2 = fft2(G1), fft2(G2)
 
             if i == 0:
                 Q = (S1)*np.conj(S2)
@@ -722,7 +725,7 @@ def gradient_corr(I1, I2):
         G1 = ndimage.convolve(I1sub, H_x) + 1j * ndimage.convolve(I1sub, H_y)
         G2 = ndimage.convolve(I2sub, H_x) + 1j * ndimage.convolve(I2sub, H_y)
 
-        S1, S2 = np.fft.fft2(G2), np.fft.fft2(G2)
+        S1, S2 = fft2(G2), fft2(G2)
 
         Q = (S1)*np.conj(S2)
     return Q
@@ -786,7 +789,7 @@ def normalized_gradient_corr(I1, I2):
             G1 /= np.max(G1)
             G2 /= np.max(G2)
 
-            S1, S2 = np.fft.fft2(G1), np.fft.fft2(G2)
+            S1, S2 = fft2(G1), fft2(G2)
 
             if i == 0:
                 Q = (S1)*np.conj(S2)
@@ -805,7 +808,7 @@ def normalized_gradient_corr(I1, I2):
         G1 /= np.max(G1)
         G2 /= np.max(G2)
 
-        S1, S2 = np.fft.fft2(G2), np.fft.fft2(G2)
+        S1, S2 = fft2(G2), fft2(G2)
 
         Q = (S1)*np.conj(S2)
     return Q
@@ -868,7 +871,7 @@ def orientation_corr(I1, I2):
             G2 = ndimage.convolve(I2bnd, H_x) + 1j*ndimage.convolve(I2bnd, H_y)
             G1,G2 = normalize_power_spectrum(G1),normalize_power_spectrum(G2)
 
-            S1, S2 = np.fft.fft2(G1), np.fft.fft2(G2)
+            S1, S2 = fft2(G1), fft2(G2)
             if i == 0:
                 Q = (S1)*np.conj(S2)
             else:
@@ -881,7 +884,7 @@ def orientation_corr(I1, I2):
         G2 = ndimage.convolve(I2sub, H_x) + 1j*ndimage.convolve(I2sub, H_y)
         G1, G2 = normalize_power_spectrum(G1), normalize_power_spectrum(G2)
 
-        S1, S2 = np.fft.fft2(G1), np.fft.fft2(G2)
+        S1, S2 = fft2(G1), fft2(G2)
 
         Q = (S1)*np.conj(S2)
     return Q
@@ -935,7 +938,7 @@ def windrose_corr(I1, I2):
         for i in range(bands): # loop through all bands
             I1bnd, I2bnd = I1sub[:,:,i], I2sub[:,:,i]
 
-            S1, S2 = np.sign(np.fft.fft2(I1bnd)), np.sign(np.fft.fft2(I2bnd))
+            S1, S2 = np.sign(fft2(I1bnd)), np.sign(fft2(I2bnd))
             if i == 0:
                 Q = (S1)*np.conj(S2)
             else:
@@ -944,7 +947,7 @@ def windrose_corr(I1, I2):
 
     else:
         I1sub,I2sub = make_templates_same_size(I1,I2)
-        S1, S2 = np.sign(np.fft.fft2(I1sub)), np.sign(np.fft.fft2(I2sub))
+        S1, S2 = np.sign(fft2(I1sub)), np.sign(fft2(I2sub))
 
         Q = (S1)*np.conj(S2)
     return Q
@@ -998,7 +1001,7 @@ def phase_corr(I1, I2):
         for i in range(bands): # loop through all bands
             I1bnd, I2bnd = I1sub[:,:,i], I2sub[:,:,i]
 
-            S1, S2 = np.fft.fft2(I1bnd), np.fft.fft2(I2bnd)
+            S1, S2 = fft2(I1bnd), fft2(I2bnd)
 
             if i == 0:
                 Q = (S1)*np.conj(S2)
@@ -1012,7 +1015,7 @@ def phase_corr(I1, I2):
     else:
         I1sub,I2sub = make_templates_same_size(I1,I2)
 
-        S1, S2 = np.fft.fft2(I1sub), np.fft.fft2(I2sub)
+        S1, S2 = fft2(I1sub), fft2(I2sub)
         Q = (S1)*np.conj(S2)
         Q = normalize_power_spectrum(Q)
     return Q
@@ -1065,7 +1068,7 @@ def gaussian_transformed_phase_corr(I1, I2):
         for i in range(bands): # loop through all bands
             I1bnd, I2bnd = I1sub[:,:,i], I2sub[:,:,i]
 
-            S1, S2 = np.fft.fft2(I1bnd), np.fft.fft2(I2bnd)
+            S1, S2 = fft2(I1bnd), fft2(I2bnd)
 
             if i == 0:
                 Q = (S1)*np.conj(S2)
@@ -1082,7 +1085,7 @@ def gaussian_transformed_phase_corr(I1, I2):
     else:
         I1sub,I2sub = make_templates_same_size(I1,I2)
 
-        S1, S2 = np.fft.fft2(I1sub), np.fft.fft2(I2sub)
+        S1, S2 = fft2(I1sub), fft2(I2sub)
         Q = (S1)*np.conj(S2)
         Q = normalize_power_spectrum(Q)
 
@@ -1134,7 +1137,7 @@ def upsampled_cross_corr(S1, S2, upsampling=2):
 #    Q = S1*conj(S2)
     Q = normalize_power_spectrum(S1)*np.conj(normalize_power_spectrum(S2))
 #    Q = normalize_power_spectrum(Q)
-    C = np.real(np.fft.ifft2(Q))
+    C = np.real(ifft2(Q))
 
     ij = np.unravel_index(np.argmax(C), C.shape, order='F')
     di, dj = ij[::-1]
@@ -1214,7 +1217,7 @@ def cross_corr(I1, I2):
         for i in range(bands): # loop through all bands
             I1bnd, I2bnd = I1sub[:,:,i], I2sub[:,:,i]
 
-            S1, S2 = np.fft.fft2(I1bnd), np.fft.fft2(I2bnd)
+            S1, S2 = fft2(I1bnd), fft2(I2bnd)
 
             if i == 0:
                 Q = (S1)*np.conj(S2)
@@ -1225,7 +1228,7 @@ def cross_corr(I1, I2):
     else:
         I1sub,I2sub = make_templates_same_size(I1,I2)
 
-        S1, S2 = np.fft.fft2(I1sub), np.fft.fft2(I2sub)
+        S1, S2 = fft2(I1sub), fft2(I2sub)
         Q = (S1)*np.conj(S2)
     return Q
 
@@ -1278,7 +1281,7 @@ def binary_orientation_corr(I1, I2):
         for i in range(bands): # loop through all bands
             I1bnd, I2bnd = I1sub[:,:,i], I2sub[:,:,i]
 
-            S1, S2 = np.fft.fft2(I1bnd), np.fft.fft2(I2bnd)
+            S1, S2 = fft2(I1bnd), fft2(I2bnd)
             W = np.sign(np.real(S2))
 
             if i == 0:
@@ -1290,7 +1293,7 @@ def binary_orientation_corr(I1, I2):
     else:
         I1sub,I2sub = make_templates_same_size(I1,I2)
 
-        S1, S2 = np.fft.fft2(I1sub), np.fft.fft2(I2sub)
+        S1, S2 = fft2(I1sub), fft2(I2sub)
         W = np.sign(np.real(S2))
 
         Q = (S1)*np.conj(W*S2)
@@ -1346,27 +1349,584 @@ def masked_corr(I1, I2, M1=np.array(()), M2=np.array(())):
     if M2.size==0 : M2 = np.ones_like(I2sub)
     M1sub,M2sub = make_templates_same_size(M1,M2)
 
-    # preparation
-    I1f, I2f = np.fft.fft2(I1sub), np.fft.fft2(I2sub)
-    M1f, M2f = np.fft.fft2(M1sub), np.fft.fft2(M2sub)
-
-    fF1F2 = np.fft.ifft2( I1f*np.conj(I2f) )
-    fM1M2 = np.fft.ifft2( M1f*np.conj(M2f) )
-    fM1F2 = np.fft.ifft2( M1f*np.conj(I2f) )
-    fF1M2 = np.fft.ifft2( I1f*np.conj(M2f) )
+    # preparation, all signals are real, hence half spectra are sufficient
+    mn = I1sub.shape
+    I1f, I2f = rfft2(I1sub), rfft2(I2sub)
+    M1f, M2f = rfft2(M1sub), rfft2(M2sub)
 
-    ff1M2 = np.fft.ifft2( np.fft.fft2(I1sub**2)*np.conj(M2f) )
-    fM1f2 = np.fft.ifft2( M1f*np.fft.fft2( np.flipud(I2sub**2) ) )
+    fF1F2 = irfft2(I1f*np.conj(I2f), s=mn)
+    fM1M2 = irfft2(M1f*np.conj(M2f), s=mn)
+    fM1F2 = irfft2(M1f*np.conj(I2f), s=mn)
+    fF1M2 = irfft2(I1f*np.conj(M2f), s=mn)
 
+    ff1M2 = irfft2(rfft2(I1sub**2)*np.conj(M2f), s=mn)
+    fM1f2 = irfft2(M1f*rfft2(np.flipud(I2sub**2)), s=mn)
 
     NCC_num = fF1F2 - \
         (np.divide(np.multiply( fF1M2, fM1F2 ), fM1M2,
                    out=np.zeros_like(fM1M2), where=fM1M2!=0))
     NCC_den_den = np.divide(fF1M2**2, fM1M2,
                             out=np.zeros_like(fM1M2), where=fM1M2!=0)
-    NCC_den = np.multiply(np.sqrt(ff1M2 - NCC_den_den ),
-                          np.sqrt(fM1f2 - NCC_den_den ))
+    NCC_den = np.multiply(np.emath.sqrt(ff1M2 - NCC_den_den),
+                          np.emath.sqrt(fM1f2 - NCC_den_den))
     NCC = np.divide(NCC_num, NCC_den,
                     out=np.zeros_like(NCC_den),
                     where=np.abs(NCC_den)!=0 )
     return np.real(NCC)
+
+# batched frequency correlators, working on stacks of templates
+def cosi_corr_batch(I1, I2, beta1=.35, beta2=.50, S1=None):
+    """ match stacks of templates through cosicorr
+
+    Parameters
+    ----------
+    I1 : numpy.array, size=(k,m,n)
+        stack of templates with intensities
+    I2 : numpy.array, size=(k,m,n) or (k,ms,ns)
+        stack of search templates with intensities
+    beta1 : float, default=0.35
+        roll-off factor of the raised cosine of the first template
+    beta2 : float, default=0.50
+        roll-off factor of the raised cosine of the second template
+    S1 : numpy.array, size=(k,m,n), dtype=complex, optional
+        spectra of the first stack, when these are already known, see
+        ".matching_tools_organization.get_reference_spectra_batch"
+
+    Returns
+    -------
+    Qn : numpy.array, size=(k,m,n), dtype=complex
+        stack of normalized cross-spectra
+    m0 : numpy.array, size=(k,2), dtype=integer
+        offset of the search templates, when these are larger
+
+    See Also
+    --------
+    cosi_corr : the same for a single template pair
+    """
+    assert isinstance(I1, np.ndarray), ('please provide an array')
+    assert isinstance(I2, np.ndarray), ('please provide an array')
+
+    (k, mt, nt) = I1.shape
+    (_, ms, ns) = I2.shape
+    W1 = raised_cosine(np.zeros((mt, nt)), beta1)
+    W2 = raised_cosine(np.zeros((mt, nt)), beta2)
+
+    _, I2sub = make_template_batches_same_size(I1, I2)
+    S1 = fft2(I1) if S1 is None else S1
+    Q = (W1*S1)*np.conj(W2*fft2(I2sub))
+    m0 = np.zeros((k, 2), dtype=int)
+
+    if I1.size != I2.size:  # refinement step to have more overlap
+        C = np.real(np.fft.fftshift(ifft2(Q), axes=(-2, -1)))
+        di, dj, _, _ = get_integer_peak_location_batch(C)
+        IN = np.logical_or(di != 0, dj != 0)
+
+        md, nd = (ms-mt)//2, (ns-nt)//2
+        if np.any(np.abs(di[IN]) > md) or np.any(np.abs(dj[IN]) > nd):
+            warnings.warn("part of the template will be out of the image" +
+                          "with this displacement estimate")
+        di, dj = np.clip(di[IN], -md, +md), np.clip(dj[IN], -nd, +nd)
+
+        # extract the repositioned search templates, all at once
+        i_sub = (ms//2 - mt//2 - di)[:, np.newaxis] + np.arange(mt)
+        j_sub = (ns//2 - nt//2 - dj)[:, np.newaxis] + np.arange(nt)
+        I2sub = I2[np.flatnonzero(IN)[:, np.newaxis, np.newaxis],
+                   i_sub[:, :, np.newaxis], j_sub[:, np.newaxis, :]]
+        Q[IN] = (W1*S1[IN])*np.conj(W2*fft2(I2sub))
+        m0[IN, 0], m0[IN, 1] = di, dj
+
+    Qn = normalize_power_spectrum(Q)
+    return Qn, m0
+
+def shift_cross_spectrum(Q, di, dj):
+    """ move the correlation peak of a cross-spectrum by an integer offset,
+    through a phase ramp
+
+    Parameters
+    ----------
+    Q : numpy.array, size=(m,n) or (k,m,n), dtype=complex
+        (stack of) cross-spectra
+    di, dj : {integer, numpy.array}, size=(k,)
+        offset of the correlation peak, for each cross-spectrum
+
+    Returns
+    -------
+    Q : numpy.array, size=(m,n) or (k,m,n), dtype=complex
+        (stack of) cross-spectra, with the offset included
+
+    See Also
+    --------
+    cosi_corr, cosi_corr_batch
+
+    Notes
+    -----
+    Correlators that reposition the search template, such as "cosi_corr",
+    give their cross-spectrum relative to this offset. Including the offset
+    gives a correlation peak relative to the center of the search template,
+    as for the other frequency correlators.
+    """
+    (m, n) = Q.shape[-2:]
+    di = np.asarray(di, dtype=float)[..., np.newaxis, np.newaxis]
+    dj = np.asarray(dj, dtype=float)[..., np.newaxis, np.newaxis]
+    F_i = np.fft.fftfreq(m)[:, np.newaxis]
+    F_j = np.fft.fftfreq(n)[np.newaxis, :]
+    return Q * np.exp(-2j*np.pi*(F_i*di + F_j*dj))
+
+def phase_only_corr_batch(I1, I2, S1=None):
+    """ match stacks of templates through phase only correlation
+
+    Parameters
+    ----------
+    I1 : numpy.array, size=(k,m,n)
+        stack of templates with intensities
+    I2 : numpy.array, size=(k,m,n) or (k,ms,ns)
+        stack of search templates with intensities
+    S1 : numpy.array, size=(k,m,n), dtype=complex, optional
+        spectra of the first stack, when these are already known, see
+        ".matching_tools_organization.get_reference_spectra_batch"
+
+    Returns
+    -------
+    Q : numpy.array, size=(k,m,n), dtype=complex
+        stack of cross-spectra
+
+    See Also
+    --------
+    phase_only_corr : the same for a single template pair
+    """
+    assert isinstance(I1, np.ndarray), ('please provide an array')
+    assert isinstance(I2, np.ndarray), ('please provide an array')
+
+    I1sub, I2sub = make_template_batches_same_size(I1, I2)
+    S1 = fft2(I1sub) if S1 is None else S1
+    S2 = fft2(I2sub)
+    W2 = np.divide(1, np.abs(I2sub),
+                   out=np.zeros_like(I2sub), where=I2sub != 0)
+    Q = (S1)*np.conj((W2*S2))
+    return Q
+
+def projected_phase_corr_batch(I1, I2, M1=np.array(()), M2=np.array(())):
+    """ match stacks of templates through their projections
+
+    Parameters
+    ----------
+    I1 : numpy.array, size=(k,m,n)
+        stack of templates with intensities
+    I2 : numpy.array, size=(k,m,n) or (k,ms,ns)
+        stack of search templates with intensities
+    M1 : numpy.array, size=(k,m,n), dtype={bool,float}
+        stack of masks, or weights, of the templates
+    M2 : numpy.array, size=(k,m,n) or (k,ms,ns), dtype={bool,float}
+        stack of masks, or weights, of the search templates
+
+    Returns
+    -------
+    C : numpy.array, size=(k,m,n), dtype=float
+        stack of correlation surfaces
+
+    See Also
+    --------
+    projected_phase_corr : the same for a single template pair
+    """
+    assert isinstance(I1, np.ndarray), ('please provide an array')
+    assert isinstance(I2, np.ndarray), ('please provide an array')
+
+    I1sub, I2sub = make_template_batches_same_size(I1, I2)
+    if M1.size == 0:
+        M1 = np.ones_like(I1sub)
+    if M2.size == 0:
+        M2 = np.ones_like(I1sub)
+    M1, M2 = make_template_batches_same_size(M1, M2)
+
+    def project_spectrum(I, M, axis=-1):
+        I_p = np.sum(I*M, axis=axis)  # projection
+        I_w = I_p*np.hamming(I_p.shape[-1])  # windowing
+        return fft(I_w)
+
+    Q12_m = project_spectrum(I1sub, M1, axis=-1) * \
+        np.conj(project_spectrum(I2sub, M2, axis=-1))
+    C_m = np.fft.fftshift(np.real(ifft(Q12_m)), axes=-1)
+
+    Q12_n = project_spectrum(I1sub, M1, axis=-2) * \
+        np.conj(project_spectrum(I2sub, M2, axis=-2))
+    C_n = np.fft.fftshift(np.real(ifft(Q12_n)), axes=-1)
+
+    C = np.sqrt(C_m[:, :, np.newaxis]*C_n[:, np.newaxis, :])
+    return C
+
+def symmetric_phase_corr_batch(I1, I2, S1=None):
+    """ match stacks of templates through symmetric phase only correlation
+
+    Parameters
+    ----------
+    I1 : numpy.array, size=(k,m,n)
+        stack of templates with intensities
+    I2 : numpy.array, size=(k,m,n) or (k,ms,ns)
+        stack of search templates with intensities
+    S1 : numpy.array, size=(k,m,n), dtype=complex, optional
+        spectra of the first stack, when these are already known, see
+        ".matching_tools_organization.get_reference_spectra_batch"
+
+    Returns
+    -------
+    Q : numpy.array, size=(k,m,n), dtype=complex
+        stack of cross-spectra
+
+    See Also
+    --------
+    symmetric_phase_corr : the same for a single template pair
+    """
+    assert isinstance(I1, np.ndarray), ('please provide an array')
+    assert isinstance(I2, np.ndarray), ('please provide an array')
+
+    I1sub, I2sub = make_template_batches_same_size(I1, I2)
+    S1 = fft2(I1sub) if S1 is None else S1
+    S2 = fft2(I2sub)
+    W2 = np.divide(1, np.sqrt(abs(I1sub))*np.sqrt(abs(I2sub)))
+    Q = (S1)*np.conj((W2*S2))
+    return Q
+
+def amplitude_comp_corr_batch(I1, I2, F_0=0.04, S1=None):
+    """ match stacks of templates through amplitude compensated phase
+    correlation
+
+    Parameters
+    ----------
+    I1 : numpy.array, size=(k,m,n)
+        stack of templates with intensities
+    I2 : numpy.array, size=(k,m,n) or (k,ms,ns)
+        stack of search templates with intensities
+    F_0 : float, default=4e-2
+        cut-off intensity in respect to maximum
+    S1 : numpy.array, size=(k,m,n), dtype=complex, optional
+        spectra of the first stack, when these are already known, see
+        ".matching_tools_organization.get_reference_spectra_batch"
+
+    Returns
+    -------
+    Q : numpy.array, size=(k,m,n), dtype=complex
+        stack of cross-spectra
+
+    See Also
+    --------
+    amplitude_comp_corr : the same for a single template pair
+    """
+    assert isinstance(I1, np.ndarray), ('please provide an array')
+    assert isinstance(I2, np.ndarray), ('please provide an array')
+
+    I1sub, I2sub = make_template_batches_same_size(I1, I2)
+    S1 = fft2(I1sub) if S1 is None else S1
+    S2 = fft2(I2sub)
+    s_0 = F_0 * np.amax(abs(S2), axis=(-2, -1), keepdims=True)
+
+    W = np.divide(1, abs(I2sub),
+                  out=np.zeros_like(I2sub), where=I2sub != 0)
+    A = np.divide(s_0, abs(I2sub)**2,
+                  out=np.zeros_like(I2sub), where=I2sub != 0)
+    W = np.where(abs(S2) > s_0, A, W)
+    Q = (S1)*np.conj((W*S2))
+    return Q
+
+def robust_corr_batch(I1, I2):
+    """ match stacks of templates through robust phase correlation
+
+    Parameters
+    ----------
+    I1 : numpy.array, size=(k,m,n)
+        stack of templates with intensities
+    I2 : numpy.array, size=(k,m,n) or (k,ms,ns)
+        stack of search templates with intensities
+
+    Returns
+    -------
+    Q : numpy.array, size=(k,m,n), dtype=complex
+        stack of cross-spectra
+
+    See Also
+    --------
+    robust_corr : the same for a single template pair
+    """
+    assert isinstance(I1, np.ndarray), ('please provide an array')
+    assert isinstance(I2, np.ndarray), ('please provide an array')
+
+    I1sub, I2sub = make_template_batches_same_size(I1, I2)
+    p_steps = 10**np.arange(0, 1, .5)
+    for idx, p in enumerate(p_steps):
+        I1p = 1/p**(1/3) * np.exp(1j*(2*p - 1)*I1sub)
+        I2p = 1/p**(1/3) * np.exp(1j*(2*p - 1)*I2sub)
+
+        S1p, S2p = fft2(I1p), fft2(I2p)
+        if idx == 0:
+            Q = (S1p)*np.conj(S2p)
+        else:
+            Q += (S1p)*np.conj(S2p)
+    return Q
+
+def orientation_corr_batch(I1, I2):
+    """ match stacks of templates through orientation correlation
+
+    Parameters
+    ----------
+    I1 : numpy.array, size=(k,m,n)
+        stack of templates with intensities
+    I2 : numpy.array, size=(k,m,n) or (k,ms,ns)
+        stack of search templates with intensities
+
+    Returns
+    -------
+    Q : numpy.array, size=(k,m,n), dtype=complex
+        stack of cross-spectra
+
+    See Also
+    --------
+    orientation_corr : the same for a single template pair
+    """
+    assert isinstance(I1, np.ndarray), ('please provide an array')
+    assert isinstance(I2, np.ndarray), ('please provide an array')
+
+    # a kernel with a singleton first axis, so templates do not interact
+    H_x, _ = get_grad_filters(ftype='kroon', tsize=3, order=1)
+    H_y = np.transpose(H_x)
+    H_x, H_y = H_x[np.newaxis, :, :], H_y[np.newaxis, :, :]
+
+    I1sub, I2sub = make_template_batches_same_size(I1, I2)
+    G1 = ndimage.convolve(I1sub, H_x) + 1j*ndimage.convolve(I1sub, H_y)
+    G2 = ndimage.convolve(I2sub, H_x) + 1j*ndimage.convolve(I2sub, H_y)
+    G1, G2 = normalize_power_spectrum(G1), normalize_power_spectrum(G2)
+
+    S1, S2 = fft2(G1), fft2(G2)
+    Q = (S1)*np.conj(S2)
+    return Q
+
+def windrose_corr_batch(I1, I2, S1=None):
+    """ match stacks of templates through windrose phase correlation
+
+    Parameters
+    ----------
+    I1 : numpy.array, size=(k,m,n)
+        stack of templates with intensities
+    I2 : numpy.array, size=(k,m,n) or (k,ms,ns)
+        stack of search templates with intensities
+    S1 : numpy.array, size=(k,m,n), dtype=complex, optional
+        spectra of the first stack, when these are already known, see
+        ".matching_tools_organization.get_reference_spectra_batch"
+
+    Returns
+    -------
+    Q : numpy.array, size=(k,m,n), dtype=complex
+        stack of cross-spectra
+
+    See Also
+    --------
+    windrose_corr : the same for a single template pair
+    """
+    assert isinstance(I1, np.ndarray), ('please provide an array')
+    assert isinstance(I2, np.ndarray), ('please provide an array')
+
+    I1sub, I2sub = make_template_batches_same_size(I1, I2)
+    S1 = fft2(I1sub) if S1 is None else S1
+    S1, S2 = np.sign(S1), np.sign(fft2(I2sub))
+    Q = (S1)*np.conj(S2)
+    return Q
+
+def phase_corr_batch(I1, I2, S1=None):
+    """ match stacks of templates through phase correlation
+
+    Parameters
+    ----------
+    I1 : numpy.array, size=(k,m,n)
+        stack of templates with intensities
+    I2 : numpy.array, size=(k,m,n) or (k,ms,ns)
+        stack of search templates with intensities
+    S1 : numpy.array, size=(k,m,n), dtype=complex, optional
+        spectra of the first stack, when these are already known, see
+        ".matching_tools_organization.get_reference_spectra_batch"
+
+    Returns
+    -------
+    Q : numpy.array, size=(k,m,n), dtype=complex
+        stack of cross-spectra
+
+    See Also
+    --------
+    phase_corr : the same for a single template pair
+
+    Example
+    -------
+    >>> import numpy as np
+    >>> from .matching_tools import get_integer_peak_location_batch
+    >>> from ..generic.test_tools import create_sample_image_pair
+
+    >>> im1,im2,ti,tj,_ = create_sample_image_pair(d=2**4, max_range=1)
+    >>> Q = phase_corr_batch(np.stack((im1, im1)), np.stack((im2, im2)))
+    >>> C = np.fft.fftshift(np.real(np.fft.ifft2(Q)), axes=(-2,-1))
+    >>> di,dj,_,_ = get_integer_peak_location_batch(C)
+    """
+    assert isinstance(I1, np.ndarray), ('please provide an array')
+    assert isinstance(I2, np.ndarray), ('please provide an array')
+
+    I1sub, I2sub = make_template_batches_same_size(I1, I2)
+    S1 = fft2(I1sub) if S1 is None else S1
+    S2 = fft2(I2sub)
+    Q = (S1)*np.conj(S2)
+    Q = normalize_power_spectrum(Q)
+    return Q
+
+def gaussian_transformed_phase_corr_batch(I1, I2, S1=None):
+    """ match stacks of templates through gaussian transformed phase
+    correlation
+
+    Parameters
+    ----------
+    I1 : numpy.array, size=(k,m,n)
+        stack of templates with intensities
+    I2 : numpy.array, size=(k,m,n) or (k,ms,ns)
+        stack of search templates with intensities
+    S1 : numpy.array, size=(k,m,n), dtype=complex, optional
+        spectra of the first stack, when these are already known, see
+        ".matching_tools_organization.get_reference_spectra_batch"
+
+    Returns
+    -------
+    Q : numpy.array, size=(k,m,n), dtype=complex
+        stack of cross-spectra
+
+    See Also
+    --------
+    gaussian_transformed_phase_corr : the same for a single template pair
+    """
+    assert isinstance(I1, np.ndarray), ('please provide an array')
+    assert isinstance(I2, np.ndarray), ('please provide an array')
+
+    I1sub, I2sub = make_template_batches_same_size(I1, I2)
+    S1 = fft2(I1sub) if S1 is None else S1
+    S2 = fft2(I2sub)
+    Q = (S1)*np.conj(S2)
+    Q = normalize_power_spectrum(Q)
+    M = gaussian_mask(Q[0])  # mask only depends upon the template size
+    Q = np.multiply(M, Q)
+    return Q
+
+def cross_corr_batch(I1, I2, S1=None):
+    """ match stacks of templates through cross correlation
+
+    Parameters
+    ----------
+    I1 : numpy.array, size=(k,m,n)
+        stack of templates with intensities
+    I2 : numpy.array, size=(k,m,n) or (k,ms,ns)
+        stack of search templates with intensities
+    S1 : numpy.array, size=(k,m,n), dtype=complex, optional
+        spectra of the first stack, when these are already known, see
+        ".matching_tools_organization.get_reference_spectra_batch"
+
+    Returns
+    -------
+    Q : numpy.array, size=(k,m,n), dtype=complex
+        stack of cross-spectra
+
+    See Also
+    --------
+    cross_corr : the same for a single template pair
+    """
+    assert isinstance(I1, np.ndarray), ('please provide an array')
+    assert isinstance(I2, np.ndarray), ('please provide an array')
+
+    I1sub, I2sub = make_template_batches_same_size(I1, I2)
+    S1 = fft2(I1sub) if S1 is None else S1
+    S2 = fft2(I2sub)
+    Q = (S1)*np.conj(S2)
+    return Q
+
+def binary_orientation_corr_batch(I1, I2, S1=None):
+    """ match stacks of templates through binary phase correlation
+
+    Parameters
+    ----------
+    I1 : numpy.array, size=(k,m,n)
+        stack of templates with intensities
+    I2 : numpy.array, size=(k,m,n) or (k,ms,ns)
+        stack of search templates with intensities
+    S1 : numpy.array, size=(k,m,n), dtype=complex, optional
+        spectra of the first stack, when these are already known, see
+        ".matching_tools_organization.get_reference_spectra_batch"
+
+    Returns
+    -------
+    Q : numpy.array, size=(k,m,n), dtype=complex
+        stack of cross-spectra
+
+    See Also
+    --------
+    binary_orientation_corr : the same for a single template pair
+    """
+    assert isinstance(I1, np.ndarray), ('please provide an array')
+    assert isinstance(I2, np.ndarray), ('please provide an array')
+
+    I1sub, I2sub = make_template_batches_same_size(I1, I2)
+    S1 = fft2(I1sub) if S1 is None else S1
+    S2 = fft2(I2sub)
+    W = np.sign(np.real(S2))
+    Q = (S1)*np.conj(W*S2)
+    return Q
+
+def masked_corr_batch(I1, I2, M1=np.array(()), M2=np.array(())):
+    """ match stacks of templates through masked normalized cross-correlation
+
+    Parameters
+    ----------
+    I1 : numpy.array, size=(k,m,n)
+        stack of templates with intensities
+    I2 : numpy.array, size=(k,m,n) or (k,ms,ns)
+        stack of search templates with intensities
+    M1 : numpy.array, size=(k,m,n), dtype=bool
+        stack of masks of the templates
+    M2 : numpy.array, size=(k,m,n) or (k,ms,ns), dtype=bool
+        stack of masks of the search templates
+
+    Returns
+    -------
+    NCC : numpy.array, size=(k,m,n), dtype=float
+        stack of correlation surfaces
+
+    See Also
+    --------
+    masked_corr : the same for a single template pair
+    """
+    assert isinstance(I1, np.ndarray), ('please provide an array')
+    assert isinstance(I2, np.ndarray), ('please provide an array')
+    assert isinstance(M1, np.ndarray), ('please provide an array')
+    assert isinstance(M2, np.ndarray), ('please provide an array')
+
+    # init
+    I1sub, I2sub = make_template_batches_same_size(I1, I2)
+    if M1.size == 0:
+        M1 = np.ones_like(I1sub)
+    if M2.size == 0:
+        M2 = np.ones_like(I2sub)
+    M1sub, M2sub = make_template_batches_same_size(M1, M2)
+
+    # preparation, all signals are real, hence half spectra are sufficient
+    mn = I1sub.shape[-2:]
+    I1f, I2f = rfft2(I1sub), rfft2(I2sub)
+    M1f, M2f = rfft2(M1sub), rfft2(M2sub)
+
+    fF1F2 = irfft2(I1f*np.conj(I2f), s=mn)
+    fM1M2 = irfft2(M1f*np.conj(M2f), s=mn)
+    fM1F2 = irfft2(M1f*np.conj(I2f), s=mn)
+    fF1M2 = irfft2(I1f*np.conj(M2f), s=mn)
+
+    ff1M2 = irfft2(rfft2(I1sub**2)*np.conj(M2f), s=mn)
+    fM1f2 = irfft2(M1f*rfft2(np.flip(I2sub**2, axis=-2)), s=mn)
+
+    NCC_num = fF1F2 - \
+        (np.divide(np.multiply(fF1M2, fM1F2), fM1M2,
+                   out=np.zeros_like(fM1M2), where=fM1M2 != 0))
+    NCC_den_den = np.divide(fF1M2**2, fM1M2,
+                            out=np.zeros_like(fM1M2), where=fM1M2 != 0)
+    NCC_den = np.multiply(np.emath.sqrt(ff1M2 - NCC_den_den),
+                          np.emath.sqrt(fM1f2 - NCC_den_den))
+    NCC = np.divide(NCC_num, NCC_den,
+                    out=np.zeros_like(NCC_den),
+                    where=np.abs(NCC_den) != 0)
+    return np.real(NCC)
@@ -8,10 +8,14 @@ from skimage.transform import radon
 from skimage.measure import ransac
 from sklearn.cluster import KMeans
 
+from ..generic.handler_cache import memoize_arrays
+from ..generic.handler_profiling import profiled
+from ..generic.handler_fft import rfft2, irfft2
 from ..generic.filtering_statistical import make_2D_Gaussian, mad_filtering
 from ..generic.handler_im import get_grad_filters
 
 # frequency preparation
+@profiled('perdecomp')
 def perdecomp(img):
     """calculate the periodic and smooth components of an image
        
@@ -69,21 +73,88 @@ def perdecomp(img):
         per[:,+0,:] = per[:,+0,:] +img[:,+0,:] -img[:,-1,:]
         per[:,-1,:] = per[:,-1,:] -img[:,+0,:] +img[:,-1,:]
     
-    fy = np.cos( 2*np.pi*( np.arange(0,m) )/m )
-    fx = np.cos( 2*np.pi*( np.arange(0,n) )/n )
-
-    Fx = np.repeat(fx[np.newaxis,:],m,axis=0)
-    Fy = np.repeat(fy[:,np.newaxis],n,axis=1)
-    Fx[0,0] = 0
+    H = perdecomp_filter(m, n)
     if img.ndim==3:
-        Fx = np.repeat(Fx[:,:,np.newaxis], b, axis=2)
-        Fy = np.repeat(Fy[:,:,np.newaxis], b, axis=2)
-        cor = np.real( np.fft.ifftn( np.fft.fft2(per) *.5/ (2-Fx-Fy)))
+        cor = irfft2(rfft2(per, axes=(0, 1)) * H[..., np.newaxis],
+                     s=(m, n), axes=(0, 1))
     else:
-        cor = np.real( np.fft.ifft2( np.fft.fft2(per) *.5/ (2-Fx-Fy)))
+        cor = irfft2(rfft2(per) * H, s=(m, n))
+    per = img-cor
+    return per, cor
+
+@profiled('perdecomp')
+def perdecomp_batch(img):
+    """calculate the periodic and smooth components of a stack of templates
+
+    Parameters
+    ----------
+    img : numpy.array, size=(k,m,n)
+        stack of arrays with intensities
+
+    Returns
+    -------
+    per : numpy.array, size=(k,m,n)
+        periodic components
+    cor : numpy.array, size=(k,m,n)
+        smooth components
+
+    See Also
+    --------
+    perdecomp : the same for a single array
+    """
+    assert isinstance(img, np.ndarray), ("please provide an array")
+    assert img.ndim == 3, ("please provide a stack of arrays, size=(k,m,n)")
+
+    # don't need to process empty arrays
+    if 0 in img.shape:
+        return img, np.zeros_like(img)
+
+    img = img.astype(float)
+    (_, m, n) = img.shape
+    per = np.zeros_like(img)
+
+    per[:, +0, :] = +img[:, 0, :] - img[:, -1, :]
+    per[:, -1, :] = -per[:, 0, :]
+
+    per[:, :, +0] = per[:, :, +0] + img[:, :, +0] - img[:, :, -1]
+    per[:, :, -1] = per[:, :, -1] - img[:, :, +0] + img[:, :, -1]
+
+    H = perdecomp_filter(m, n)
+
+    # the transforms run over the last two axes, thus all at once
+    cor = irfft2(rfft2(per) * H, s=(m, n))
     per = img-cor
     return per, cor
 
+@memoize_arrays
+def perdecomp_filter(m, n):
+    """ create the filter that gives the smooth component of an image, see
+    "perdecomp"
+
+    Parameters
+    ----------
+    m, n : integer
+        dimensions of the image
+
+    Returns
+    -------
+    H : numpy.array, size=(m,n//2+1), dtype=float
+        half of the spectral filter, as it is real and symmetric
+
+    See Also
+    --------
+    perdecomp, perdecomp_batch
+    """
+    fy = np.cos(2*np.pi*(np.arange(0, m))/m)
+    fx = np.cos(2*np.pi*(np.arange(0, n))/n)
+
+    Fx = np.repeat(fx[np.newaxis, :], m, axis=0)
+    Fy = np.repeat(fy[:, np.newaxis], n, axis=1)
+    Fx[0, 0] = 0
+
+    H = .5 / (2-Fx-Fy)
+    return H[:, :n//2+1]
+
 def normalize_power_spectrum(Q):
     """transform spectrum to complex vectors with unit length 
        
@@ -112,6 +183,7 @@ def normalize_power_spectrum(Q):
     Qn = np.divide(Q, abs(Q), out=np.zeros_like(Q), where=Q!=0)
     return Qn
 
+@memoize_arrays
 def make_fourier_grid(Q, indexing='ij', system='radians'):
     """
     The four quadrants of the coordinate system of the discrete Fourier 
@@ -196,6 +268,7 @@ def make_fourier_grid(Q, indexing='ij', system='radians'):
     return F_1, F_2
     
 # frequency matching filters
+@memoize_arrays
 def raised_cosine(I, beta=0.35):
     """ raised cosine filter
     
@@ -254,6 +327,7 @@ def raised_cosine(I, beta=0.35):
     W[selec] = Hamm[selec]
     return W 
 
+@memoize_arrays
 def hamming_window(I):
     """ create hanning filter
     
@@ -279,6 +353,7 @@ def hamming_window(I):
     W = np.fft.fftshift(W)
     return W 
 
+@memoize_arrays
 def hanning_window(I):
     """ create hanning filter
     
@@ -304,6 +379,7 @@ def hanning_window(I):
     W = np.fft.fftshift(W)
     return W 
 
+@memoize_arrays
 def blackman_window(I):
     """ create blackman filter
     
@@ -329,6 +405,7 @@ def blackman_window(I):
     W = np.fft.fftshift(W)
     return W 
 
+@memoize_arrays
 def kaiser_window(I, beta=14.):
     """ create kaiser filter
     
@@ -359,6 +436,7 @@ def kaiser_window(I, beta=14.):
     W = np.fft.fftshift(W)
     return W 
 
+@memoize_arrays
 def low_pass_rectancle(I, r=0.50):
     """ create hard low-pass filter
     
@@ -392,6 +470,7 @@ def low_pass_rectancle(I, r=0.50):
     W = np.logical_and(np.abs(Fx)<=r, np.abs(Fy)<=r) 
     return W 
 
+@memoize_arrays
 def low_pass_pyramid(I, r=0.50):
     """ create low-pass filter with pyramid shape
     
@@ -425,6 +504,7 @@ def low_pass_pyramid(I, r=0.50):
     W = np.fft.fftshift(W/np.max(W))
     return W
 
+@memoize_arrays
 def low_pass_bell(I, r=0.50):
     """ create low-pass filter with a bell shape
     
@@ -459,6 +539,7 @@ def low_pass_bell(I, r=0.50):
     W = np.fft.fftshift(W/np.max(W))
     return W
 
+@memoize_arrays
 def low_pass_circle(I, r=0.50):
     """ create hard low-pass filter
     
@@ -486,6 +567,7 @@ def low_pass_circle(I, r=0.50):
     return W
 
 
+@memoize_arrays
 def low_pass_ellipse(I, r1=0.50, r2=0.50):
     """ create hard low-pass filter
 
@@ -515,6 +597,7 @@ def low_pass_ellipse(I, r1=0.50, r2=0.50):
     W = R <= r1
     return W
 
+@memoize_arrays
 def high_pass_circle(I, r=0.50):
     """ create hard high-pass filter
     
@@ -541,6 +624,7 @@ def high_pass_circle(I, r=0.50):
     W = R>=r
     return W
 
+@memoize_arrays
 def cosine_bell(I):
     """ cosine bell filter
     
@@ -638,6 +722,37 @@ def thresh_masking(S, m=1e-4, s=10):
     M = ndimage.median_filter(M, size=(s,s))
     return M
 
+def thresh_masking_batch(S, m=1e-4, s=10):
+    """ mask significant intensities in a stack of spectra
+
+    Parameters
+    ----------
+    S : numpy.array, size=(k,m,n), dtype=complex
+        stack of spectra
+    m : float, default=1e-4
+        cut-off intensity in respect to the maximum of each spectrum
+    s : integer, default=10
+        kernel size of the median filter
+
+    Returns
+    -------
+    M : numpy.array, size=(k,m,n), dtype=bool
+        stack of frequency masks
+
+    See Also
+    --------
+    thresh_masking : the same for a single spectrum
+    """
+    assert isinstance(S, np.ndarray), ("please provide an array")
+    assert S.ndim == 3, ("please provide a stack of arrays, size=(k,m,n)")
+    S_bar = np.abs(S)
+    th = np.max(S_bar, axis=(1, 2), keepdims=True)*m
+
+    # compose filter, the kernel does not extend over the stack
+    M = S_bar > th
+    M = ndimage.median_filter(M, size=(1, s, s))
+    return M
+
 def adaptive_masking(S, m=.9):
     """ mark significant intensities in spectrum
     
@@ -676,6 +791,7 @@ def adaptive_masking(S, m=.9):
     M = NLS>mean_NLS
     return M
 
+@memoize_arrays
 def gaussian_mask(S):
     """ mask significant intensities in spectrum
     
@@ -115,4 +115,40 @@ def local_coherence(Q, ds=1):
         # if the spectrum is normalized, then no division is needed
         C += Q * np.conj(Q_step)
     C = np.abs(C) / np.sum(IN)
-    return C
\ No newline at end of file
+    return C
+def local_coherence_batch(Q, ds=1):
+    """ estimate the local coherence of a stack of spectra
+
+    Parameters
+    ----------
+    Q : numpy.array, size=(k,m,n), dtype=complex
+        stack of cross-spectra, with centered coordinate frame
+    ds : integer, default=1
+        kernel radius to describe the neighborhood
+
+    Returns
+    -------
+    M : numpy.array, size=(k,m,n), dtype=float
+        vector coherence from no to ideal, i.e.: 0...1
+
+    See Also
+    --------
+    local_coherence : the same for a single spectrum
+    """
+    assert isinstance(Q, np.ndarray), ("please provide an array")
+    assert Q.ndim == 3, ("please provide a stack of arrays, size=(k,m,n)")
+
+    diam = 2*ds + 1
+    (isteps, jsteps) = np.meshgrid(np.linspace(-ds, +ds, diam, dtype=int),
+                                   np.linspace(-ds, +ds, diam, dtype=int))
+    IN = np.ones(diam**2, dtype=bool)
+    IN[diam**2 // 2] = False
+    isteps, jsteps = isteps.flatten()[IN], jsteps.flatten()[IN]
+
+    # as in "local_coherence", the steps are applied to each flattened array
+    Q_flat = Q.reshape(Q.shape[0], -1)
+    C = np.zeros_like(Q_flat)
+    for istep, jstep in zip(isteps, jsteps):
+        C += Q_flat * np.conj(np.roll(Q_flat, istep + jstep, axis=1))
+    C = np.abs(C) / np.sum(IN)
+    return C.reshape(Q.shape)
@@ -14,7 +14,8 @@ from ..preprocessing.shadow_transforms import pca
 from .matching_tools_frequency_filters import \
     raised_cosine, thresh_masking, normalize_power_spectrum, \
     make_fourier_grid
-from .matching_tools_frequency_metrics import local_coherence
+from .matching_tools_frequency_metrics import \
+    local_coherence, local_coherence_batch
 
 def phase_jac(Q, m, W=np.array([]),
               F1=np.array([]), F2=np.array([]), rank=2): # wip
@@ -262,7 +263,6 @@ def phase_tpss(Q, W, m, p=1e-4, l=4, j=5, n=3): #wip
             m -= alpha*dg
             #else:
             #    m -= alpha*dg
-            print('di:{:+.4f}'.format(m[0])+' dj:{:+.4f}'.format(m[1]))
             k += 1
 
         # optimize weighting matrix
@@ -649,6 +649,347 @@ def phase_weighted_pca(Q, W): #todo
         di, dj = 0, 0
     return di, dj
 
+# batched phase plane estimators, working on stacks of cross-spectra
+def cross_spectrum_to_angle_batch(Q, W=None):
+    """ transform a stack of cross-spectra to a list of phase angles, that is
+    shared by all the cross-spectra
+
+    Parameters
+    ----------
+    Q : numpy.array, size=(k,m,n), dtype=complex
+        stack of cross-spectra
+    W : numpy.array, size=(k,m,n), dtype=boolean
+        stack of weighting matrices, indicating which data is correct
+
+    Returns
+    -------
+    F : numpy.array, size=(m*n,2), dtype=float
+        coordinates of the spectrum, in normalized ranges, i.e: -1 ... +1
+    Y : numpy.array, size=(k,m*n), dtype=float
+        angles, in normalized ranges, i.e: -1 ... +1
+    W : numpy.array, size=(k,m*n), dtype=float
+        weights of each angle, in a range of 0...1
+
+    See Also
+    --------
+    dhdt.generic.test_tools.cross_spectrum_to_coordinate_list
+    """
+    (k, m, n) = Q.shape
+    F1, F2 = make_fourier_grid(np.zeros((m, n)), indexing='ij',
+                               system='unit')
+    F = np.stack((F1.flatten(), F2.flatten()), axis=1)
+
+    Y = np.fft.fftshift(np.angle(Q) / np.pi, axes=(1, 2)).reshape(k, -1)
+    if W is None:
+        W = np.ones_like(Y)
+    else:
+        W = (W.reshape(k, -1) == 1).astype(float)
+    return F, Y, W
+
+def phase_lsq_batch(Q, W=None):
+    """get phase plane of a stack of cross-spectra through least squares
+    plane fitting
+
+    Parameters
+    ----------
+    Q : numpy.array, size=(k,m,n), dtype=complex
+        stack of normalized cross-spectra
+    W : numpy.array, size=(k,m,n), dtype=boolean
+        stack of weighting matrices, indicating which data is correct
+
+    Returns
+    -------
+    di,dj : numpy.array, size=(k,), dtype=float
+        sub-pixel displacements
+
+    See Also
+    --------
+    phase_lsq : the same for a single cross-spectrum
+
+    Notes
+    -----
+    All normal equations are build at once, hence every plane is estimated
+    from the same coordinate list.
+    """
+    assert isinstance(Q, np.ndarray), ("please provide an array")
+    assert Q.ndim == 3, ("please provide a stack of arrays, size=(k,m,n)")
+
+    F, Y, W = cross_spectrum_to_angle_batch(Q, W)
+    M = np.einsum('kp,pi,pj->kij', W, F, F)
+    V = np.einsum('kp,pi,kp->ki', W, F, Y)
+
+    plane_normal = np.squeeze(np.linalg.pinv(M) @ V[..., np.newaxis], axis=2)
+    di, dj = 2*plane_normal[:, 0], 2*plane_normal[:, 1]
+    return di, dj
+
+def phase_pca_batch(Q, W=None):
+    """get phase plane of a stack of cross-spectra through principle
+    component analysis
+
+    Parameters
+    ----------
+    Q : numpy.array, size=(k,m,n), dtype=complex
+        stack of normalized cross-spectra
+    W : numpy.array, size=(k,m,n), dtype=boolean
+        stack of weighting matrices, indicating which data is correct
+
+    Returns
+    -------
+    di,dj : numpy.array, size=(k,), dtype=float
+        sub-pixel displacements
+
+    See Also
+    --------
+    phase_pca : the same for a single cross-spectrum
+    """
+    assert isinstance(Q, np.ndarray), ("please provide an array")
+    assert Q.ndim == 3, ("please provide a stack of arrays, size=(k,m,n)")
+
+    F, Y, W = cross_spectrum_to_angle_batch(Q, W)
+    X = np.concatenate((np.broadcast_to(F, Y.shape + (2,)),
+                        Y[..., np.newaxis]), axis=2)
+    covar = np.einsum('kp,kpi,kpj->kij', W, X, X)
+    covar /= (np.sum(W, axis=1) - 1)[:, np.newaxis, np.newaxis]
+
+    # the covariance is symmetric, thus the eigenvalues are sorted
+    _, eigen_vecs = np.linalg.eigh(covar)
+    e3 = eigen_vecs[..., 0]  # normal vector
+    di, dj = -2*e3[:, 0]/e3[:, -1], -2*e3[:, 1]/e3[:, -1]
+    return di, dj
+
+def phase_slope_1d_batch(t, rad=.1):
+    """ estimate the slope and intercept for a collection of one-dimensional
+    signals
+
+    Parameters
+    ----------
+    t : numpy.array, size=(k,m), dtype=complex
+        angle values
+    rad : float, range=(0.0,0.5)
+        radial inclusion, seen from the center
+
+    Returns
+    -------
+    x_hat : numpy.array, size=(2,k)
+        estimated slopes and intercepts
+
+    See Also
+    --------
+    phase_slope_1d : the same for a single signal
+    """
+    m = t.shape[1]
+    idx_sub = np.arange(np.ceil((0.5-rad)*m),
+                        np.ceil((0.5+rad)*m)+1).astype(int)
+    y_ang = np.unwrap(np.angle(t[:, idx_sub]), axis=1)
+    A = np.vstack([idx_sub-1, np.ones((len(idx_sub)))]).T
+    x_hat = np.linalg.lstsq(A, y_ang.T, rcond=None)[0]
+    return x_hat
+
+def phase_svd_batch(Q, W, rad=0.1):
+    """get phase plane of a stack of cross-spectra through single value
+    decomposition
+
+    Parameters
+    ----------
+    Q : numpy.array, size=(k,m,m), dtype=complex
+        stack of cross-spectra
+    W : numpy.array, size=(k,m,m), dtype=float
+        stack of weighting matrices
+    rad : float, range=(0.0,0.5)
+        radial inclusion, seen from the center
+
+    Returns
+    -------
+    di,dj : numpy.array, size=(k,), dtype=float
+        sub-pixel displacements
+
+    See Also
+    --------
+    phase_svd : the same for a single cross-spectrum
+    """
+    assert isinstance(Q, np.ndarray), ("please provide an array")
+    assert isinstance(W, np.ndarray), ("please provide an array")
+    assert Q.ndim == 3, ("please provide a stack of arrays, size=(k,m,n)")
+
+    rad = np.minimum(rad, 0.5)
+    (k, m, n) = Q.shape
+    try:  # decompose all at once
+        u, s, v = np.linalg.svd(np.fft.fftshift(W*Q, axes=(1, 2)))
+    except np.linalg.LinAlgError:
+        # fall back to one at a time, so only the failing ones are set to zero
+        di, dj = np.zeros(k), np.zeros(k)
+        for count in range(k):
+            di[count], dj[count] = phase_svd(Q[count], W[count], rad=rad)
+        return di, dj
+
+    # only the first element is used
+    t_m = v[:, 0, :]*s[:, 0, np.newaxis]
+    t_n = u[..., 0]*s[:, 0, np.newaxis]
+
+    d_n = phase_slope_1d_batch(t_n, rad)
+    d_m = phase_slope_1d_batch(t_m, rad)
+
+    di = -d_n[0]*n / (2*np.pi)
+    dj = -d_m[0]*m / (2*np.pi)
+    return di, dj
+
+def phase_difference_1d_batch(Q, W=None, axis=0):
+    """get displacements from a stack of phase planes along one axis through
+    differencing
+
+    Parameters
+    ----------
+    Q : numpy.array, size=(k,m,n), dtype=complex
+        stack of normalized cross-spectra
+    W : numpy.array, size=(k,m,n), dtype=boolean
+        stack of weighting matrices
+    axis : {0,1}
+        axis of the displacement
+
+    Returns
+    -------
+    dj : numpy.array, size=(k,), dtype=float
+        sub-pixel displacements
+
+    See Also
+    --------
+    phase_difference_1d : the same for a single cross-spectrum
+    """
+    if axis == 0:
+        Q = np.transpose(Q, axes=(0, 2, 1))
+    (k, m, n) = Q.shape
+
+    # estimate period, the step is taken along the flattened arrays
+    Q_dj = np.roll(Q.reshape(k, -1), 1, axis=1).reshape(Q.shape)
+    Delta_dj = np.angle(np.multiply(np.conj(Q), Q_dj))/np.pi
+    if W is None:
+        # find coherent data
+        C = local_coherence_batch(normalize_power_spectrum(Q), ds=1)
+        C_dj = np.roll(C.reshape(k, -1), 1, axis=1).reshape(C.shape)
+        C = np.minimum(C, C_dj)
+        W = C > np.quantile(C, 0.9, axis=(1, 2), keepdims=True)
+
+    dj = np.nanmedian(np.where(W, Delta_dj, np.nan), axis=(1, 2))*(m//2)
+    return dj
+
+def phase_difference_batch(Q, W=None):
+    """get displacements from a stack of phase planes through neighbouring
+    vector difference
+
+    Parameters
+    ----------
+    Q : numpy.array, size=(k,m,n), dtype=complex
+        stack of normalized cross-spectra
+    W : numpy.array, size=(k,m,n), dtype=boolean
+        stack of weighting matrices
+
+    Returns
+    -------
+    di,dj : numpy.array, size=(k,), dtype=float
+        sub-pixel displacements
+
+    See Also
+    --------
+    phase_difference : the same for a single cross-spectrum
+    """
+    assert isinstance(Q, np.ndarray), ("please provide an array")
+    assert Q.ndim == 3, ("please provide a stack of arrays, size=(k,m,n)")
+
+    di = phase_difference_1d_batch(Q, W, axis=0)
+    dj = phase_difference_1d_batch(Q, W, axis=1)
+    return di, dj
+
+def phase_tpss_batch(Q, W, m, p=1e-4, l=4, j=5, n=3):
+    """get phase planes of a stack of cross-spectra through two point step
+    size iteration
+
+    Parameters
+    ----------
+    Q : numpy.array, size=(k,m,n), dtype=complex
+        stack of cross-spectra
+    W : numpy.array, size=(k,m,n), dtype=float
+        stack of weighting matrices
+    m : numpy.array, size=(k,2)
+        initial displacement estimates
+    p : float, default=1e4
+        closing error threshold
+    l : integer, default=4
+        number of refinements in iteration
+    j : integer, default=5
+        number of sub routines during an estimation
+    n : integer, default=3
+        mask convergence factor
+
+    Returns
+    -------
+    m : numpy.array, size=(k,2)
+        sub-pixel displacements
+    snr: numpy.array, size=(k,)
+        signal-to-noise ratios
+
+    See Also
+    --------
+    phase_tpss : the same for a single cross-spectrum
+
+    Notes
+    -----
+    All estimates are iterated together, while the ones that have converged
+    are held fixed, until every estimate has converged or the maximum amount
+    of iterations is reached.
+    """
+    assert isinstance(Q, np.ndarray), ("please provide an array")
+    assert isinstance(W, np.ndarray), ("please provide an array")
+    assert Q.ndim == 3, ("please provide a stack of arrays, size=(k,m,n)")
+    s = 1.
+
+    Q = normalize_power_spectrum(Q)
+    W = W.astype(float)
+    F1, F2 = make_fourier_grid(Q[0], indexing='ij')
+
+    def summed_jacobian(Q, W, m):  # see "phase_jac"
+        F_m = F1*m[:, 0, np.newaxis, np.newaxis] + \
+            F2*m[:, 1, np.newaxis, np.newaxis]
+        dXY = 1 - np.real(Q)*np.cos(F_m) + np.imag(Q)*np.sin(F_m)
+        return np.stack((np.sum(2*W*F1*dXY, axis=(1, 2)),
+                         np.sum(2*W*F2*dXY, axis=(1, 2))), axis=1)
+
+    # initialize
+    m = np.array(m, dtype=float).reshape(-1, 2)
+    m_min = m + np.array([-.1, -.1])
+    g_min = summed_jacobian(Q, W, m_min)
+
+    for i in range(l):
+        active = np.ones(m.shape[0], dtype=bool)
+        for k in range(1, j+1):
+            idx = np.flatnonzero(active)
+            g = summed_jacobian(Q[idx], W[idx], m[idx])
+
+            # difference
+            dm, dg = m[idx] - m_min[idx], g - g_min[idx]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                alpha = np.sum(dm*dm, axis=1)/(s*np.sum(dm*dg, axis=1))
+
+            # hold the converged estimates
+            done = np.all(np.abs(dm) <= p, axis=1) | (k >= j)
+            active[idx[done]] = False
+            if not np.any(active):
+                break
+            idx, g, dg, alpha = idx[~done], g[~done], dg[~done], alpha[~done]
+
+            # update
+            m_min[idx], g_min[idx] = m[idx], g
+            m[idx] -= alpha[:, np.newaxis]*dg
+
+        # optimize weighting matrix
+        F_m = F1*m[:, 1, np.newaxis, np.newaxis] + \
+            F2*m[:, 0, np.newaxis, np.newaxis]
+        C = np.cos(F_m) - 1j*np.sin(F_m)
+        dXY = np.abs(np.multiply(W, (Q-C)**2))
+        W = W*(1-(dXY/4))**n
+    snr = np.zeros(m.shape[0])
+    m = -1*m
+    return m, snr
+
 # from skimage.measure
 def ransac(data, model_class, min_samples, residual_threshold,
            is_data_valid=None, is_model_valid=None,
@@ -890,6 +1231,160 @@ def ransac(data, model_class, min_samples, residual_threshold,
 
     return best_model, best_inliers
 
+def get_phase_plane_hypotheses(data, idx, params_bound=0):
+    """ fit phase planes through pairs of samples, for all integer cycles of
+    the wrapped phase at once
+
+    Parameters
+    ----------
+    data : numpy.array, size=(N,3)
+        coordinate list with the vertical and horizontal frequency, and the
+        phase angle, in cycles
+    idx : numpy.array, size=(T,2), dtype=integer
+        indices of the sample pairs
+    params_bound : integer, default=0
+        bound of the parameter space, when zero the phase is not unwrapped
+
+    Returns
+    -------
+    params : numpy.array, size=(K,2)
+        slopes of the phase planes, within the bound
+    trial : numpy.array, size=(K,), dtype=integer
+        index of the sample pair a plane is fitted through
+
+    See Also
+    --------
+    ransac_phase_plane
+    """
+    A, y = data[idx, 0:2], data[idx, -1]  # (T,2,2) and (T,2)
+    det = A[:, 0, 0]*A[:, 1, 1] - A[:, 0, 1]*A[:, 1, 0]
+    OK = np.abs(det) > 1E-9  # pairs on a line through the origin are futile
+    A, y, det, trial = A[OK], y[OK], det[OK], np.flatnonzero(OK)
+
+    # closed form inverse of all 2x2 systems
+    A_inv = np.stack((np.stack((A[:, 1, 1], -A[:, 0, 1]), axis=-1),
+                      np.stack((-A[:, 1, 0], A[:, 0, 0]), axis=-1)),
+                     axis=1) / det[:, np.newaxis, np.newaxis]
+
+    # create multitudes of cycles
+    cycle = np.mgrid[-params_bound:+params_bound+1,
+                     -params_bound:+params_bound+1].reshape(2, -1).T
+    Y = y[:, np.newaxis, :] + cycle[np.newaxis, :, :]  # (T,H,2)
+    params = np.einsum('tij,thj->thi', A_inv, Y)
+
+    if params_bound != 0:
+        IN = np.all(np.abs(params) <= params_bound, axis=-1)
+    else:
+        IN = np.ones(params.shape[:2], dtype=bool)
+    trial = np.broadcast_to(trial[:, np.newaxis], IN.shape)[IN]
+    return params[IN], trial
+
+def ransac_phase_plane(data, residual_threshold=.05, max_trials=1000,
+                       params_bound=0, stop_probability=.99,
+                       random_state=None, batch_size=2**22):
+    """ fit a wrapped phase plane through random sampling and consensus, where
+    the hypotheses are drawn, fitted and scored in batches
+
+    Parameters
+    ----------
+    data : numpy.array, size=(N,3)
+        coordinate list with the vertical and horizontal frequency, and the
+        phase angle, in cycles
+    residual_threshold : float, default=.05, unit=cycles
+        maximum phase difference for a sample to be classified as an inlier
+    max_trials : integer, default=1000
+        maximum amount of sample pairs
+    params_bound : integer, default=0
+        bound of the parameter space, see "get_phase_plane_hypotheses"
+    stop_probability : float, range=0...1, default=.99
+        stop when at least one outlier-free pair is drawn with this
+        probability, given the inlier ratio of the best plane so far
+    random_state : {None, integer, numpy.random.Generator}
+        seed or generator of the random sampling
+    batch_size : integer, default=2**22
+        amount of residuals that are evaluated at once, to bound the memory
+
+    Returns
+    -------
+    params : numpy.array, size=(2,)
+        slope of the phase plane, refined by least squares on the inliers
+    inliers : numpy.array, size=(N,), dtype=bool
+        classification of the samples
+
+    See Also
+    --------
+    ransac : the generic implementation, one trial at a time
+    phase_ransac
+
+    Notes
+    -----
+    All sample pairs are drawn at once, while the trials are processed in
+    chunks. After each chunk the amount of trials needed is updated, see [1],
+    so the search stops early when a plane with many inliers is found. The
+    score of a plane is its amount of inliers, while ties are broken by the
+    sum of the squared residuals, truncated at the threshold.
+
+    References
+    ----------
+    .. [1] Fischler & Bolles. "Random sample consensus: a paradigm for model
+       fitting with applications to image analysis and automated cartography"
+       Communications of the ACM vol.24(6) pp.381-395, 1981.
+    """
+    assert isinstance(data, np.ndarray), ('please provide an array')
+    rng = np.random.default_rng(random_state)
+    N = data.shape[0]
+    if N < 2:
+        raise ValueError('At least two vectors needed.')
+
+    # draw all pairs at once, the second sample differs from the first
+    idx_1 = rng.integers(0, N, size=max_trials)
+    idx_2 = np.mod(idx_1 + rng.integers(1, N, size=max_trials), N)
+    idx = np.stack((idx_1, idx_2), axis=1)
+
+    F = data[:, 0:2].astype(np.float32)
+    Q = data[:, -1].astype(np.float32)
+
+    best_params, best_num, best_sum = None, 0, np.inf
+    trials_needed, chunk, start = max_trials, 32, 0
+    while start < np.minimum(trials_needed, max_trials):
+        params, _ = get_phase_plane_hypotheses(data, idx[start:start+chunk],
+                                               params_bound)
+        start += chunk
+        chunk = 2*chunk
+
+        # score all hypotheses against all samples, in blocks
+        step = np.maximum(batch_size // N, 1)
+        for b in range(0, params.shape[0], step):
+            P = params[b:b+step]
+            Res = P.astype(np.float32) @ F.T  # (K,N)
+            np.subtract(Q, Res, out=Res)
+            Res -= np.rint(Res)  # phase wrapping
+            np.abs(Res, out=Res)
+            num = np.sum(Res < residual_threshold, axis=1)
+            np.minimum(Res, residual_threshold, out=Res)
+            res_sum = np.einsum('ij,ij->i', Res, Res)
+
+            best = np.lexsort((res_sum, -num))[0]
+            if (num[best] > best_num) or \
+                    ((num[best] == best_num) and (res_sum[best] < best_sum)):
+                best_params = P[best]
+                best_num, best_sum = num[best], res_sum[best]
+        if best_num > 0:
+            trials_needed = _dynamic_max_trials(best_num, N, 2,
+                                                stop_probability)
+
+    if best_params is None:
+        warnings.warn('No inliers found. Model not fitted')
+        return np.zeros(2)*np.nan, np.zeros(N, dtype=bool)
+
+    # estimate final model using all inliers, through the unwrapped phase
+    Q_hat = data[:, 0:2] @ best_params
+    res = np.remainder(data[:, -1] - Q_hat + .5, 1) - .5
+    inliers = np.abs(res) < residual_threshold
+    params = np.linalg.lstsq(data[inliers, 0:2], Q_hat[inliers] + res[inliers],
+                             rcond=None)[0]
+    return params, inliers
+
 class BaseModel(object):
     def __init__(self):
         self.params = None
@@ -1058,7 +1553,8 @@ class SawtoothModel(BaseModel):
             Q_hat = np.remainder(Q_hat+.5,1)-.5
         return Q_hat
 
-def phase_ransac(data, max_displacement=0, precision_threshold=.05):
+def phase_ransac(data, max_displacement=0, precision_threshold=.05,
+                 max_trials=1000, stop_probability=.99, random_state=0):
     """robustly fit plane using RANSAC algorithm
 
     find slope of the phase plane through
@@ -1070,6 +1566,17 @@ def phase_ransac(data, max_displacement=0, precision_threshold=.05):
         normalized cross spectrum
     or     numpy.array, size=(m*n,3), dtype=complex
         coordinate list with complex cross-sprectum at last
+    max_displacement : integer, default=0
+        bound of the displacement, by default half the template size
+    precision_threshold : float, default=.05, unit=cycles
+        maximum phase difference of an inlier
+    max_trials : integer, default=1000
+        maximum amount of sample pairs
+    stop_probability : float, range=0...1, default=.99
+        confidence to stop the sampling early, see "ransac_phase_plane"
+    random_state : {None, integer, numpy.random.Generator}, default=0
+        seed or generator of the sampling, by default the same samples are
+        drawn every call, so the outcome is reproducible
 
     Returns
     -------
@@ -1080,7 +1587,7 @@ def phase_ransac(data, max_displacement=0, precision_threshold=.05):
 
     See Also
     --------
-    phase_lsq, phase_svd, phase_hough, phase_pca
+    phase_lsq, phase_svd, phase_hough, phase_pca, ransac_phase_plane
 
     References
     ----------
@@ -1099,7 +1606,7 @@ def phase_ransac(data, max_displacement=0, precision_threshold=.05):
 
     >>> im1,im2,ti,tj,_ = create_sample_image_pair(d=2**5, max_range=1)
     >>> Q = phase_corr(im1, im2)
-    >>> di,dj,_,_ = phase_ransac(Q)
+    >>> di,dj = phase_ransac(Q)
 
     >>> assert(np.isclose(ti, di, atol=.2))
     >>> assert(np.isclose(tj, dj, atol=.2))
@@ -1109,51 +1616,106 @@ def phase_ransac(data, max_displacement=0, precision_threshold=.05):
     # what type of data? either list of coordinates or a cross-spectral matrix
     if data.shape[0]==data.shape[1]:
         (m,n) = data.shape
-        Fx,Fy = make_fourier_grid(np.zeros((m,n)))
-        Fx,Fy = np.fft.fftshift(Fx), np.fft.fftshift(Fy)
+        # frequencies in cycles per pixel, as the phase is in cycles
+        F1,F2 = make_fourier_grid(np.zeros((m,n)), system='normalized')
+        F1,F2 = np.fft.fftshift(F1), np.fft.fftshift(F2)
         Q = np.fft.fftshift(np.angle(data) / (2*np.pi))
 
         if max_displacement==0:
             max_displacement = m//2
-        data = np.vstack((Fy.flatten(),
-                          Fx.flatten(),
+        data = np.vstack((F1.flatten(),
+                          F2.flatten(),
                           Q.flatten() )).T
 
-    ransac_model, inliers = ransac(data, SawtoothModel, #PlaneModel,
-                                   min_samples=int(2),
-                                   residual_threshold=precision_threshold,
-                                   max_trials=int(1e3),
-                                   params_bounds=max_displacement)
+    params, inliers = ransac_phase_plane(
+        data, residual_threshold=precision_threshold,
+        max_trials=int(max_trials), params_bound=max_displacement,
+        stop_probability=stop_probability, random_state=random_state)
 #    IN = np.reshape(inliers, (m,n)) # what data is within error bounds
 
-    di = ransac_model.params[0]
-    dj = ransac_model.params[1]
+    # the plane slope points from the second towards the first template
+    di, dj = -params[0], -params[1]
     return di, dj
 
 def phase_hough(data, max_displacement=64, param_spacing=1, sample_fraction=1.,
-                W=np.array([])):
+                W=np.array([]), precision_threshold=.05, voting='cauchy',
+                num_estimates=1, refine=2):
+    """get phase plane of cross-spectrum through a Hough transform
+
+    Parameters
+    ----------
+    data : numpy.array, size=(m,n), dtype=complex or size=(k,3)
+        cross spectrum, or a list of coordinates, with the normalized
+        frequencies and the phase angle in cycles
+    max_displacement : float, default=64
+        extent of the voting space, by default half the template size
+    param_spacing : float, default=1
+        cell size of the voting space, in pixels
+    sample_fraction : float, range=0...1
+        fraction of the data that votes
+    W : numpy.array, size=(m,n), optional
+        when given, the samples with the highest weight are used, instead of a
+        random selection
+    precision_threshold : float, default=.05, unit=cycles
+        scale of the weighting of the residuals, or the threshold for hard
+        voting
+    voting : {'cauchy' (default), 'laplace', 'hard', 'sparse'}
+        weighting of the votes, where 'sparse' counts the cells within the
+        threshold, by only visiting the cells along the lines of a sample.
+        It gives the same votes as 'hard', though as the phase is cyclic,
+        'hard' is faster, see ".matching_tools.get_hough_votes_sparse"
+    num_estimates : integer, default=1
+        amount of displacement estimates
+    refine : integer, default=2
+        amount of refinements of the voting space around a peak, each with a
+        four times smaller cell size
+
+    Returns
+    -------
+    di,dj : {float, numpy.array}
+        sub-pixel displacement, an array of size=(num_estimates,) when more
+        estimates are asked for
+
+    See Also
+    --------
+    phase_ransac, phase_svd, .matching_tools.get_hough_votes
+
+    Example
+    -------
+    >>> import numpy as np
+    >>> from ..generic.test_tools import create_sample_image_pair
+
+    >>> im1,im2,ti,tj,_ = create_sample_image_pair(d=2**5, max_range=1)
+    >>> Q = phase_corr(im1, im2)
+    >>> di,dj = phase_hough(Q)
+
+    >>> assert(np.isclose(ti, di, atol=.2))
+    >>> assert(np.isclose(tj, dj, atol=.2))
+    """
+    from .matching_tools import get_hough_votes, get_hough_votes_sparse, \
+        refine_hough_peak, get_peak_indices # combating import loops
     assert type(data)==np.ndarray, ('please provide an array')
 
     # what type of data? either list of coordinates or a cross-spectral matrix
     if data.shape[0]==data.shape[1]:
         (m,n) = data.shape
-        Fx,Fy = make_fourier_grid(np.zeros((m,n)))
-        Fx,Fy = np.fft.fftshift(Fx), np.fft.fftshift(Fy)
+        # frequencies in cycles per pixel, as the phase is in cycles
+        F1,F2 = make_fourier_grid(np.zeros((m,n)), system='normalized')
+        F1,F2 = np.fft.fftshift(F1), np.fft.fftshift(F2)
         Q = np.fft.fftshift(np.angle(data) / (2*np.pi))
 
         if max_displacement==64:
             max_displacement = m//2
-        data = np.vstack((Fx.flatten(),
-                          Fy.flatten(),
+        data = np.vstack((F1.flatten(),
+                          F2.flatten(),
                           Q.flatten() )).T
+        if W.size!=0:
+            W = np.fft.fftshift(W)
 
     # create voting space
-    (dj,di) = np.meshgrid(np.arange(-max_displacement, \
-                                    +max_displacement + param_spacing, \
-                                    param_spacing),
-                          np.arange(-max_displacement, \
-                                    +max_displacement + param_spacing, \
-                                    param_spacing))
+    di = np.arange(-max_displacement, +max_displacement + param_spacing,
+                   param_spacing, dtype=float)
+    dj = di.copy()
 
     # create population that can vote
     sample_size = data.shape[0]
@@ -1164,23 +1726,30 @@ def phase_hough(data, max_displacement=64, param_spacing=1, sample_fraction=1.,
                                np.round(sample_size*sample_fraction).astype(np.int32),
                                replace=False)
     else: # use weights to select sampling
-        idx = np.flip(np.argsort(data[:,-1]))
+        idx = np.flip(np.argsort(W.flatten()))
         idx = idx[0:np.round(sample_size*sample_fraction).astype(np.int32)]
+    A, y = data[idx,:2], data[idx,-1]
 
-    #vote = np.zeros_like(di, dtype=np.int32)
-    vote = np.zeros_like(di, dtype=np.float32)
-    for counter in idx:
-        angle_diff = data[counter,-1] - \
-            (np.remainder((data[counter,0]*dj + data[counter,1]*di)+.5,1)-.5)
-
-        vote += 1 / (1 + (angle_diff/(.1*np.std(angle_diff)))**2) # cauchy weighting
-        # hard threshold
-        # vote += (np.abs(angle_diff) <= .1).astype(np.int32)
-
-
-    (i_hough,j_hough) = np.unravel_index(np.argmax(vote), di.shape)
-    di_hough,dj_hough = di[i_hough,j_hough], dj[i_hough,j_hough]
-
+    if voting in ('sparse'):
+        vote = get_hough_votes_sparse(A, y, di, dj,
+                                      threshold=precision_threshold, wrap=True)
+        voting = 'hard'
+    else:
+        vote = get_hough_votes(A, y, di, dj, weighting=voting,
+                               scale=precision_threshold, wrap=True)
+
+    ind,_ = get_peak_indices(vote, num_estimates=num_estimates)
+    di_hough, dj_hough = di[ind[:,0]], dj[ind[:,1]]
+    for cnt in range(num_estimates*np.sign(refine)):
+        di_hough[cnt], dj_hough[cnt], _ = refine_hough_peak(
+            A, y, di_hough[cnt], dj_hough[cnt],
+            (param_spacing, param_spacing), levels=refine,
+            weighting=voting, scale=precision_threshold, wrap=True)
+
+    # the plane slope points from the second towards the first template
+    di_hough, dj_hough = -di_hough, -dj_hough
+    if num_estimates==1:
+        return di_hough[0], dj_hough[0]
     return di_hough, dj_hough
 
 def phase_radon(Q, coord_system='ij'):
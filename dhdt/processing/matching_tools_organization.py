@@ -2,25 +2,39 @@
 
 import numpy as np
 
+from ..generic.handler_fft import fft2, ifft2
 from .matching_tools_frequency_filters import \
-    perdecomp, thresh_masking
+    perdecomp, perdecomp_batch, thresh_masking, thresh_masking_batch
 from .matching_tools_frequency_correlators import \
     cosi_corr, phase_only_corr, symmetric_phase_corr, amplitude_comp_corr, \
     orientation_corr, phase_corr, cross_corr, masked_cosine_corr, \
     binary_orientation_corr, masked_corr, robust_corr, windrose_corr, \
     gaussian_transformed_phase_corr, upsampled_cross_corr, \
-    projected_phase_corr
+    projected_phase_corr, cosi_corr_batch, phase_only_corr_batch, \
+    symmetric_phase_corr_batch, amplitude_comp_corr_batch, \
+    orientation_corr_batch, phase_corr_batch, cross_corr_batch, \
+    binary_orientation_corr_batch, masked_corr_batch, robust_corr_batch, \
+    windrose_corr_batch, gaussian_transformed_phase_corr_batch, \
+    projected_phase_corr_batch, shift_cross_spectrum
 from .matching_tools_frequency_subpixel import \
     phase_tpss, phase_svd, phase_radon, phase_hough, phase_ransac, \
-    phase_weighted_pca, phase_pca, phase_lsq, phase_difference
+    phase_weighted_pca, phase_pca, phase_lsq, phase_difference, \
+    phase_tpss_batch, phase_svd_batch, phase_pca_batch, phase_lsq_batch, \
+    phase_difference_batch
 from .matching_tools_spatial_correlators import \
     normalized_cross_corr, sum_sq_diff, sum_sad_diff, cumulative_cross_corr, \
-    maximum_likelihood, weighted_normalized_cross_correlation
+    maximum_likelihood, weighted_normalized_cross_correlation, \
+    sum_sq_diff_batch, sum_sad_diff_batch, maximum_likelihood_batch
 from .matching_tools_spatial_subpixel import \
     get_top_gaussian, get_top_parabolic, get_top_moment, \
     get_top_mass, get_top_centroid, get_top_blais, get_top_ren, \
     get_top_birchfield, get_top_equiangular, get_top_triangular, \
-    get_top_esinc, get_top_paraboloid, get_top_2d_gaussian
+    get_top_esinc, get_top_paraboloid, get_top_2d_gaussian, \
+    get_top_gaussian_batch, get_top_parabolic_batch, get_top_moment_batch, \
+    get_top_mass_batch, get_top_centroid_batch, get_top_blais_batch, \
+    get_top_ren_batch, get_top_birchfield_batch, \
+    get_top_equiangular_batch, get_top_triangular_batch, \
+    get_top_esinc_batch, get_top_paraboloid_batch, get_top_2d_gaussian_batch
 from .matching_tools_differential import \
     affine_optical_flow, hough_optical_flow
 
@@ -48,6 +62,16 @@ def list_frequency_correlators():
                        'proj_phas', 'phas_corr']
     return correlator_list
 
+def list_reference_spectrum_correlators():
+    """ list the abbreviations of the frequency correlators, that only need
+    the spectra of the reference templates, thus these spectra can be computed
+    once and be re-used, see "get_reference_spectra_batch"
+    """
+    correlator_list = ['cosi_corr', 'phas_only', 'symm_phas', 'ampl_comp',
+                       'bina_phas', 'wind_corr', 'gaus_phas', 'cros_corr',
+                       'phas_corr']
+    return correlator_list
+
 def list_spatial_correlators():
     """ list the abbreviations of the different implemented correlators, being:
         norm_corr - normalized cross correlation
@@ -56,9 +80,23 @@ def list_spatial_correlators():
         sad_diff - sum of absolute differences
         max_like - phase correlation
         wght_corr - weighted normalized cross correlation
+        dens_corr - dense normalized cross correlation, for all posts at once
     """
     correlator_list = ['norm_corr', 'cumu_corr', 'sq_diff', 'sad_diff',
-                       'max_like', 'wght_corr']
+                       'max_like', 'wght_corr', 'dens_corr']
+    return correlator_list
+
+def list_batch_spatial_correlators():
+    """ list the abbreviations of the spatial correlators, that can work on
+    stacks of templates, see "match_translation_of_two_batches"
+
+    Notes
+    -----
+    The correlation surfaces of the whole stack are computed at once, thus
+    not template by template, see "sum_sq_diff_batch", "sum_sad_diff_batch"
+    and "maximum_likelihood_batch".
+    """
+    correlator_list = ['sq_diff', 'sad_diff', 'max_like']
     return correlator_list
 
 def list_differential_correlators():
@@ -105,6 +143,35 @@ def list_peak_estimators():
                   'gauss_2', 'parab_2', 'optical_flow']
     return subpix_list
 
+def get_displacement_sign(correlator):
+    """ get the sign that turns the displacement given by a correlator into
+    the convention of the spatial correlators, where the position in the
+    second image is the center of its template plus the displacement
+
+    Parameters
+    ----------
+    correlator : string
+        abbreviation of the correlator
+
+    Returns
+    -------
+    sign : {-1, +1}
+        multiplier of the displacement
+
+    See Also
+    --------
+    list_frequency_correlators, list_spatial_correlators
+
+    Notes
+    -----
+    The frequency correlators, with a peak or a phase plane estimator, give
+    the displacement of the second template with the opposite sign. This is
+    also the case for the Hough based optical flow, see
+    ".matching_tools_differential.hough_optical_flow".
+    """
+    opposite = list_frequency_correlators() + ['hough_opt_flw']
+    return -1 if correlator in opposite else +1
+
 # todo: include masks
 def estimate_translation_of_two_subsets(I1, I2, M1, M2, correlator='lucas_kan',
                                         **kwargs):
@@ -173,7 +240,8 @@ def match_translation_of_two_subsets(I1_sub,I2_sub,correlator,subpix,
     if correlator in frequency_based:
         # frequency correlator
         if correlator in ['cosi_corr']:
-            Q = cosi_corr(I1_sub, I2_sub)[0]
+            Q, _, m0 = cosi_corr(I1_sub, I2_sub)
+            Q = shift_cross_spectrum(Q, m0[0], m0[1])
         elif correlator in ['phas_corr']:
             Q = phase_corr(I1_sub, I2_sub)
         elif correlator in ['phas_only']:
@@ -186,7 +254,7 @@ def match_translation_of_two_subsets(I1_sub,I2_sub,correlator,subpix,
             Q = orientation_corr(I1_sub, I2_sub)
         elif correlator in ['mask_corr']:
             C = masked_corr(I1_sub, I2_sub, M1_sub, M2_sub)
-            if subpix in phase_based: Q = np.fft.fft2(C)
+            if subpix in phase_based: Q = fft2(C)
         elif correlator in ['bina_phas']:
             Q = binary_orientation_corr(I1_sub, I2_sub)
         elif correlator in ['wind_corr']:
@@ -201,25 +269,160 @@ def match_translation_of_two_subsets(I1_sub,I2_sub,correlator,subpix,
             Q = robust_corr(I1_sub, I2_sub)
         elif correlator in ['proj_phas']:
             C = projected_phase_corr(I1_sub, I2_sub, M1_sub, M2_sub)
-            if subpix in phase_based: Q = np.fft.fft2(C)
+            if subpix in phase_based: Q = fft2(C)
         if (subpix in peak_based) and ('Q' in locals()):
-            C = np.fft.fftshift(np.real(np.fft.ifft2(Q)))
+            C = np.fft.fftshift(np.real(ifft2(Q)))
     else:
         # spatial correlator
-        if correlator in ['norm_corr']:
+        if correlator in ['norm_corr', 'dens_corr']:
             C = normalized_cross_corr(I1_sub, I2_sub)
         elif correlator in ['cumu_corr']:
             C = cumulative_cross_corr(I1_sub, I2_sub)
         elif correlator in ['sq_diff']:
             C = -1 * sum_sq_diff(I1_sub, I2_sub)
         elif correlator in ['sad_diff']:
-            C = sum_sad_diff(I1_sub, I2_sub)
+            C = -1 * sum_sad_diff(I1_sub, I2_sub)
         elif correlator in ['max_like']:
             C = maximum_likelihood(I1_sub, I2_sub)
         elif correlator in ['wght_corr']:
             C = weighted_normalized_cross_correlation(I1_sub, I2_sub)
         if subpix in phase_based:
-            Q = np.fft.fft2(C)
+            Q = fft2(C)
+
+    if (subpix in peak_based) or (subpix is None):
+        return C
+    else:
+        return Q
+
+def get_reference_spectra_batch(I1_sub):
+    """ get the spectra of a stack of reference templates, as these are used
+    by the batched frequency correlators
+
+    Parameters
+    ----------
+    I1_sub : numpy.array, size=(k,m,n)
+        stack of templates with intensities
+
+    Returns
+    -------
+    S1_sub : numpy.array, size=(k,m,n), dtype=complex
+        stack of spectra of the periodic component of the templates
+
+    See Also
+    --------
+    list_reference_spectrum_correlators, match_translation_of_two_batches
+    """
+    assert isinstance(I1_sub, np.ndarray), ('please provide an array')
+    return fft2(perdecomp_batch(I1_sub)[0])
+
+def match_translation_of_two_batches(I1_sub, I2_sub, correlator, subpix,
+                                     M1_sub=np.array(()),
+                                     M2_sub=np.array(()),
+                                     S1_sub=None):
+    """ match stacks of templates through a frequency correlator, where all
+    templates are transformed at once, or through a spatial correlator that
+    works on stacks
+
+    Parameters
+    ----------
+    I1_sub : numpy.array, size=(k,m,n)
+        stack of templates with intensities
+    I2_sub : numpy.array, size=(k,m,n) or (k,ms,ns)
+        stack of search templates with intensities
+    correlator : string
+        abbreviation of the frequency correlator, see
+        "list_frequency_correlators", though 'upsp_corr' is not supported, or
+        of the spatial correlator, see "list_batch_spatial_correlators"
+    subpix : string
+        method used to estimate the sub-pixel location, see
+        "list_peak_estimators" or "list_phase_estimators"
+    M1_sub : numpy.array, size=(k,m,n), dtype=bool
+        stack of masks of the templates
+    M2_sub : numpy.array, size=(k,m,n) or (k,ms,ns), dtype=bool
+        stack of masks of the search templates
+    S1_sub : numpy.array, size=(k,m,n), dtype=complex, optional
+        stack of spectra of the templates, when these are already known, see
+        "get_reference_spectra_batch". This is only possible for the
+        correlators given by "list_reference_spectrum_correlators"
+
+    Returns
+    -------
+    QC : numpy.array, size=(k,m,n)
+        stack of correlation surfaces, or cross-spectra, dependent on the
+        sub-pixel estimator
+
+    See Also
+    --------
+    match_translation_of_two_subsets : the same for a single template pair
+    """
+    assert isinstance(I1_sub, np.ndarray), ('please provide an array')
+    assert isinstance(I2_sub, np.ndarray), ('please provide an array')
+    assert I1_sub.ndim == 3, ('please provide a stack of templates')
+
+    frequency_based = [c for c in list_frequency_correlators()
+                       if c not in ['upsp_corr']]
+    spatial_based = list_batch_spatial_correlators()
+    phase_based = list_phase_estimators()
+    peak_based = list_peak_estimators()
+
+    assert (correlator in frequency_based) or (correlator in spatial_based), \
+        ('please provide a valid correlation method. it can be one of the ' +
+         f'following: { {*frequency_based, *spatial_based} }')
+
+    if correlator in spatial_based:
+        if correlator in ['sq_diff']:
+            C = -1 * sum_sq_diff_batch(I1_sub, I2_sub)
+        elif correlator in ['sad_diff']:
+            C = -1 * sum_sad_diff_batch(I1_sub, I2_sub)
+        elif correlator in ['max_like']:
+            C = maximum_likelihood_batch(I1_sub, I2_sub)
+        if subpix in phase_based:
+            return fft2(C)
+        return C
+
+    if S1_sub is not None:
+        assert (correlator in list_reference_spectrum_correlators()), \
+            ('this correlator can not make use of given spectra')
+
+    # reduce edge effects in frequency space
+    if S1_sub is None:
+        I1_sub = perdecomp_batch(I1_sub)[0]
+    I2_sub = perdecomp_batch(I2_sub)[0]
+
+    if correlator in ['cosi_corr']:
+        Q, m0 = cosi_corr_batch(I1_sub, I2_sub, S1=S1_sub)
+        Q = shift_cross_spectrum(Q, m0[:, 0], m0[:, 1])
+    elif correlator in ['phas_corr']:
+        Q = phase_corr_batch(I1_sub, I2_sub, S1=S1_sub)
+    elif correlator in ['phas_only']:
+        Q = phase_only_corr_batch(I1_sub, I2_sub, S1=S1_sub)
+    elif correlator in ['symm_phas']:
+        Q = symmetric_phase_corr_batch(I1_sub, I2_sub, S1=S1_sub)
+    elif correlator in ['ampl_comp']:
+        Q = amplitude_comp_corr_batch(I1_sub, I2_sub, S1=S1_sub)
+    elif correlator in ['orie_corr']:
+        Q = orientation_corr_batch(I1_sub, I2_sub)
+    elif correlator in ['mask_corr']:
+        C = masked_corr_batch(I1_sub, I2_sub, M1_sub, M2_sub)
+        if subpix in phase_based:
+            Q = fft2(C)
+    elif correlator in ['bina_phas']:
+        Q = binary_orientation_corr_batch(I1_sub, I2_sub, S1=S1_sub)
+    elif correlator in ['wind_corr']:
+        Q = windrose_corr_batch(I1_sub, I2_sub, S1=S1_sub)
+    elif correlator in ['gaus_phas']:
+        Q = gaussian_transformed_phase_corr_batch(I1_sub, I2_sub,
+                                                  S1=S1_sub)
+    elif correlator in ['cros_corr']:
+        Q = cross_corr_batch(I1_sub, I2_sub, S1=S1_sub)
+    elif correlator in ['robu_corr']:
+        Q = robust_corr_batch(I1_sub, I2_sub)
+    elif correlator in ['proj_phas']:
+        C = projected_phase_corr_batch(I1_sub, I2_sub, M1_sub, M2_sub)
+        if subpix in phase_based:
+            Q = fft2(C)
+    if ((subpix in peak_based) or (subpix is None)) and ('Q' in locals()):
+        C = np.fft.fftshift(np.real(ifft2(Q)), axes=(-2, -1))
 
     if (subpix in peak_based) or (subpix is None):
         return C
@@ -260,9 +463,9 @@ def estimate_subpixel(QC, subpix, m0=np.zeros((1,2))):
         elif subpix in ['esinc']:
             ddi,ddj,_,_= get_top_esinc(QC, ds=1, top=m0)
         elif subpix in ['gauss_2']:
-            ddi,ddj,_,_= get_top_2d_gaussian(QC, ds=1, top=m0)
-        elif subpix in ['parab_2t']:
-            ddi,ddj,_,_= get_top_paraboloid(QC, ds=1, top=m0)
+            ddi,ddj,_,_= get_top_2d_gaussian(QC, top=m0)
+        elif subpix in ['parab_2']:
+            ddi,ddj,_,_= get_top_paraboloid(QC, top=m0)
 
     elif subpix in phase_based: #cross-spectrum
         if subpix in ['tpss']:
@@ -289,3 +492,82 @@ def estimate_subpixel(QC, subpix, m0=np.zeros((1,2))):
             ddi,ddj = phase_difference(QC)
 
     return ddi, ddj
+
+def estimate_subpixel_batch(QC, subpix, m0=np.zeros((0, 2))):
+    """ estimate the sub-pixel displacements of a stack of correlation
+    surfaces or cross-spectra
+
+    Parameters
+    ----------
+    QC : numpy.array, size=(k,m,n)
+        stack of correlation surfaces, or cross-spectra, dependent on the
+        sub-pixel estimator
+    subpix : string
+        method used to estimate the sub-pixel location, see
+        "list_peak_estimators" or "list_phase_estimators"
+    m0 : numpy.array, size=(k,2)
+        integer location of the peaks, with regard to the center
+
+    Returns
+    -------
+    ddi, ddj : numpy.array, size=(k,), dtype=float
+        sub-pixel displacements
+
+    See Also
+    --------
+    estimate_subpixel : the same for a single surface or cross-spectrum
+
+    Notes
+    -----
+    The peak estimators and the phase plane estimators "tpss", "svd", "pca",
+    "lsq" and "diff" work on the whole stack at once, other estimators are
+    applied to one surface at a time.
+    """
+    assert isinstance(QC, np.ndarray), ('please provide an array')
+    assert QC.ndim == 3, ('please provide a stack of arrays, size=(k,m,n)')
+    phase_based = list_phase_estimators()
+    peak_based = list_peak_estimators()
+    assert ((subpix in phase_based) or (subpix in peak_based)), \
+        ('please provide a valid subpixel method.' +
+         'it can be one of the following:' +
+         f' { {*peak_based,*phase_based} }')
+
+    batch_based = {'gauss_1': get_top_gaussian_batch,
+                   'parab_1': get_top_parabolic_batch,
+                   'moment': get_top_moment_batch,
+                   'mass': get_top_mass_batch,
+                   'centroid': get_top_centroid_batch,
+                   'blais': get_top_blais_batch,
+                   'ren': get_top_ren_batch,
+                   'birch': get_top_birchfield_batch,
+                   'eqang': get_top_equiangular_batch,
+                   'trian': get_top_triangular_batch,
+                   'esinc': get_top_esinc_batch,
+                   'gauss_2': get_top_2d_gaussian_batch,
+                   'parab_2': get_top_paraboloid_batch}
+    if subpix in batch_based:
+        ddi, ddj, _, _ = batch_based[subpix](QC, top=m0)
+        return ddi, ddj
+
+    k = QC.shape[0]
+    if m0.size == 0:
+        m0 = np.zeros((k, 2))
+    if subpix in ['tpss']:
+        W = thresh_masking_batch(QC)
+        m, _ = phase_tpss_batch(QC, W, m0)
+        return m[:, 0], m[:, 1]
+    elif subpix in ['svd']:
+        W = thresh_masking_batch(QC)
+        return phase_svd_batch(QC, W)
+    elif subpix in ['pca']:
+        return phase_pca_batch(QC)
+    elif subpix in ['lsq']:
+        return phase_lsq_batch(QC)
+    elif subpix in ['diff']:
+        return phase_difference_batch(QC)
+
+    ddi, ddj = np.zeros(k), np.zeros(k)
+    for count in range(k):
+        ddi[count], ddj[count] = estimate_subpixel(QC[count], subpix,
+                                                   m0=m0[count])
+    return ddi, ddj
@@ -3,11 +3,133 @@ import numpy as np
 
 # image processing libraries
 from skimage.feature import match_template
-from skimage.util import view_as_windows
 from scipy import ndimage
 
+from ..generic.handler_fft import rfft2, irfft2
 from ..preprocessing.image_transforms import mat_to_gray
 
+# sums over templates, shared by the correlators
+def get_integral_image(I):
+    """ create a summed-area table, where every element holds the sum of all
+    elements above and left of it
+
+    Parameters
+    ----------
+    I : numpy.array, size=(m,n) or size=(k,m,n)
+        array with intensities, or a stack of these
+
+    Returns
+    -------
+    S : numpy.array, size=(m+1,n+1) or size=(k,m+1,n+1), dtype=float
+        summed-area table, with a leading row and column of zeros
+
+    See Also
+    --------
+    get_window_sums
+    """
+    S = np.zeros(I.shape[:-2] + (I.shape[-2]+1, I.shape[-1]+1),
+                 dtype=np.float64)
+    np.cumsum(np.cumsum(I, axis=-2, dtype=np.float64), axis=-1,
+              out=S[..., 1:, 1:])
+    return S
+
+def get_window_sums(S, size):
+    """ get the sums of all windows within an array, through its summed-area
+    table
+
+    Parameters
+    ----------
+    S : numpy.array, size=(m+1,n+1) or size=(k,m+1,n+1), dtype=float
+        summed-area table, see "get_integral_image"
+    size : tuple, size=(2,)
+        dimension of the windows
+
+    Returns
+    -------
+    sums : numpy.array, size=(m-size[0]+1,n-size[1]+1), dtype=float
+        sum of each window, located at its upper left corner
+    """
+    (h, w) = size
+    return S[..., h:, w:] - S[..., :-h, w:] - S[..., h:, :-w] + \
+        S[..., :-h, :-w]
+
+def get_valid_correlation(K, I):
+    """ correlate an array with a kernel, through the Fourier domain, only at
+    the positions where the kernel is fully within the array
+
+    Parameters
+    ----------
+    K : numpy.array, size=(m,n) or size=(b,m,n)
+        kernel, or a stack of kernels
+    I : numpy.array, size=(k,l) or size=(b,k,l)
+        array with intensities, or a stack of these
+
+    Returns
+    -------
+    C : numpy.array, size=(k-m+1,l-n+1) or size=(b,k-m+1,l-n+1)
+        correlation, located at the upper left corner of the kernel
+
+    Notes
+    -----
+    The correlation is circular, though at the valid positions the kernel
+    does not wrap around the array, hence no padding is needed.
+    """
+    (m, n), (k, l) = K.shape[-2:], I.shape[-2:]
+    C = irfft2(rfft2(I) * np.conj(rfft2(K, s=(k, l))), s=(k, l))
+    return C[..., :k-m+1, :l-n+1]
+
+def sum_over_windows(func, I1, I2, block_size=2**16):
+    """ apply a function on a template and all windows of a search space, and
+    sum its outcome over each window
+
+    Parameters
+    ----------
+    func : function
+        elementwise function, with the template and a block of windows as
+        arguments
+    I1 : numpy.array, size=(m,n) or size=(k,m,n)
+        image with intensities (template), or a stack of these
+    I2 : numpy.array, size=(ms,ns) or size=(k,ms,ns)
+        image with intensities (search space), or a stack of these
+    block_size : integer, default=2**16
+        amount of elements that are processed at once, so the windows that
+        are looked at stay within the cache
+
+    Returns
+    -------
+    C : numpy.array, size=(ms-m+1,ns-n+1) or size=(k,ms-m+1,ns-n+1)
+        sum of each window
+
+    Notes
+    -----
+    The windows are a strided view upon the search space, thus only a block
+    of rows is materialized at the same time. For stacks, such a block
+    spans several templates, while the template is broadcasted over its
+    windows.
+    """
+    single = I1.ndim == 2
+    if single:
+        I1, I2 = I1[np.newaxis], I2[np.newaxis]
+    T = I1[:, np.newaxis, np.newaxis]
+    view = np.lib.stride_tricks.sliding_window_view(I2, I1.shape[-2:],
+                                                    axis=(-2, -1))
+    (b, k, l) = view.shape[:3]
+    C = np.zeros((b, k, l), dtype=np.float64)
+
+    row_size = l * I1.shape[-2] * I1.shape[-1]
+    if k*row_size <= block_size: # several templates at once
+        posts, rows = block_size // (k*row_size), k
+    else:
+        posts, rows = 1, int(np.maximum(1, block_size // row_size))
+    for p in range(0, b, posts):
+        for i in range(0, k, rows):
+            C[p:p+posts, i:i+rows] = np.sum(
+                func(T[p:p+posts], view[p:p+posts, i:i+rows]),
+                axis=(-2, -1))
+    if single:
+        C = C[0]
+    return C
+
 # spatial pattern matching functions
 def normalized_cross_corr(I1, I2):
     """ simple normalized cross correlation
@@ -71,18 +193,55 @@ def sum_sq_diff(I1, I2):
     -------
     ssd : numpy.array
         dissimilarity surface, ssd: sum of squared differnce
+
+    See Also
+    --------
+    sum_sq_diff_batch : the same for stacks of templates
+
+    Notes
+    -----
+    The squared difference is expanded into the energy of the search window,
+    the cross correlation and the energy of the template. These come from a
+    summed-area table and the Fourier transform, respectively.
     """
-    
-    t_size = I1.shape
-    y = np.lib.stride_tricks.as_strided(I2,
-                    shape=(I2.shape[0] - t_size[0] + 1,
-                           I2.shape[1] - t_size[1] + 1,) +
-                          t_size,
-                    strides=I2.strides * 2)
-    ssd = np.einsum('ijkl,kl->ij', y, I1)
+    # the difference does not change by a common offset, which is removed to
+    # reduce round-off errors in the expansion
+    offset = np.mean(I2)
+    I1, I2 = I1.astype(np.float64) - offset, I2.astype(np.float64) - offset
+
+    ssd = get_valid_correlation(I1, I2)
+    ssd *= - 2
+    ssd += get_window_sums(get_integral_image(I2**2), I1.shape)
+    ssd += np.sum(I1**2)
+    return ssd
+
+def sum_sq_diff_batch(I1, I2):
+    """ sum of squared difference correlation, for stacks of templates
+
+    Parameters
+    ----------
+    I1 : numpy.array, size=(k,m,n)
+        stack of images with intensities (templates)
+    I2 : numpy.array, size=(k,ms,ns)
+        stack of images with intensities (search spaces)
+
+    Returns
+    -------
+    ssd : numpy.array, size=(k,ms-m+1,ns-n+1)
+        stack of dissimilarity surfaces
+
+    See Also
+    --------
+    sum_sq_diff : the same for a single template pair
+    """
+    assert I1.ndim == 3, ('please provide a stack of arrays, size=(k,m,n)')
+    offset = np.mean(I2, axis=(1, 2), keepdims=True)
+    I1, I2 = I1.astype(np.float64) - offset, I2.astype(np.float64) - offset
+
+    ssd = get_valid_correlation(I1, I2)
     ssd *= - 2
-    ssd += np.einsum('ijkl, ijkl->ij', y, y)
-    ssd += np.einsum('ij, ij', I1, I1)
+    ssd += get_window_sums(get_integral_image(I2**2), I1.shape[-2:])
+    ssd += np.sum(I1**2, axis=(1, 2))[:, np.newaxis, np.newaxis]
     return ssd
 
 def sum_sad_diff(I1, I2):
@@ -99,15 +258,37 @@ def sum_sad_diff(I1, I2):
     -------
     sad : numpy.array
         dissimilarity surface, sad: sum of absolute difference
+
+    See Also
+    --------
+    sum_sad_diff_batch : the same for stacks of templates
     """
-    
-    t_size = I1.shape
-    y = np.lib.stride_tricks.as_strided(I2,
-                    shape=(I2.shape[0] - t_size[0] + 1,
-                           I2.shape[1] - t_size[1] + 1,) +
-                          t_size,
-                    strides=I2.strides * 2)
-    sad = np.einsum('ijkl,kl->ij', y, I1)
+    sad = sum_over_windows(lambda T, V: np.abs(V - T),
+                           I1.astype(np.float64), I2.astype(np.float64))
+    return sad
+
+def sum_sad_diff_batch(I1, I2):
+    """ sum of absolute difference correlation, for stacks of templates
+
+    Parameters
+    ----------
+    I1 : numpy.array, size=(k,m,n)
+        stack of images with intensities (templates)
+    I2 : numpy.array, size=(k,ms,ns)
+        stack of images with intensities (search spaces)
+
+    Returns
+    -------
+    sad : numpy.array, size=(k,ms-m+1,ns-n+1)
+        stack of dissimilarity surfaces
+
+    See Also
+    --------
+    sum_sad_diff : the same for a single template pair
+    """
+    assert I1.ndim == 3, ('please provide a stack of arrays, size=(k,m,n)')
+    sad = sum_over_windows(lambda T, V: np.abs(V - T),
+                           I1.astype(np.float64), I2.astype(np.float64))
     return sad
 
 # maximum likelihood
@@ -116,10 +297,10 @@ def maximum_likelihood_func(I2,I1):
     I1, I2 = I1.flatten(), I2.flatten()
 
     I12 = I1+I2
-    num = np.log(I2, where= I2>0) + \
-          np.log(I1, where= I1>0) - \
-          2*np.log(I12, where= I12>0) - \
-          np.log(I1, where= I1>0)
+    num = np.log(I2, where= I2>0, out=np.zeros_like(I2)) + \
+          np.log(I1, where= I1>0, out=np.zeros_like(I1)) - \
+          2*np.log(I12, where= I12>0, out=np.zeros_like(I12)) - \
+          np.log(I1, where= I1>0, out=np.zeros_like(I1))
     ml = np.divide(num, I1.size,
                    out=np.zeros_like(num), where= num>0)
     return np.sum(ml)
@@ -139,6 +320,17 @@ def maximum_likelihood(I1,I2):
     C : float
         texture correspondence surface
 
+    See Also
+    --------
+    maximum_likelihood_batch : the same for stacks of templates
+
+    Notes
+    -----
+    The likelihood of every window is evaluated at once, see
+    "maximum_likelihood_func" for its formulation. The search space is
+    extended by reflection, so the surface has the same size as the search
+    space.
+
     References
     ----------
     .. [1] Erten et al. "Glacier velocity monitoring by maximum likelihood
@@ -146,9 +338,68 @@ def maximum_likelihood(I1,I2):
        vol.47(2) pp.394--405, 2009.
     """
     I1, I2 = mat_to_gray(I1), mat_to_gray(I2)
+    C = get_likelihood_surface(I1, I2)
+    return C
+
+def maximum_likelihood_batch(I1, I2):
+    """ maximum likelihood texture tracking, for stacks of templates
+
+    Parameters
+    ----------
+    I1 : numpy.array, size=(k,m,n)
+        stack of images with intensities (templates)
+    I2 : numpy.array, size=(k,ms,ns)
+        stack of images with intensities (search spaces)
+
+    Returns
+    -------
+    C : numpy.array, size=(k,ms,ns)
+        stack of texture correspondence surfaces
 
-    C = ndimage.generic_filter(I2, maximum_likelihood_func,
-                               size=I1.shape, extra_keywords = {'I1':I1})
+    See Also
+    --------
+    maximum_likelihood : the same for a single template pair
+    """
+    assert I1.ndim == 3, ('please provide a stack of arrays, size=(k,m,n)')
+
+    def stack_to_gray(I): # as "mat_to_gray", though for each array
+        I = I.astype(np.float64)
+        I_min = np.min(I, axis=(1, 2), keepdims=True)
+        I_ptp = np.ptp(I, axis=(1, 2), keepdims=True)
+        return np.divide(I - I_min, I_ptp, out=np.zeros_like(I),
+                         where=I_ptp != 0)
+
+    C = get_likelihood_surface(stack_to_gray(I1), stack_to_gray(I2))
+    return C
+
+def get_likelihood_surface(I1, I2):
+    """ evaluate the likelihood of every window, see "maximum_likelihood"
+
+    Parameters
+    ----------
+    I1 : numpy.array, size=(m,n) or size=(k,m,n), range=0...1
+        image with intensities (template), or a stack of these
+    I2 : numpy.array, size=(ms,ns) or size=(k,ms,ns), range=0...1
+        image with intensities (search space), or a stack of these
+
+    Returns
+    -------
+    C : numpy.array, size=(ms,ns) or size=(k,ms,ns)
+        texture correspondence surface, or a stack of these
+    """
+    (m, n) = I1.shape[-2:]
+
+    def likelihood(T, V):  # see "maximum_likelihood_func"
+        V_T = V + T
+        num = np.log(V, where=V > 0, out=np.zeros_like(V)) - \
+            2*np.log(V_T, where=V_T > 0, out=np.zeros_like(V_T))
+        return np.maximum(num, 0) / (m*n)
+
+    # the same boundary and origin as ndimage.generic_filter
+    pad_width = ((0, 0),)*(I2.ndim-2) + \
+        ((m//2, m - m//2 - 1), (n//2, n - n//2 - 1))
+    I2 = np.pad(I2, pad_width, mode='symmetric')
+    C = sum_over_windows(likelihood, I1, I2)
     C[C>1.4] = 0
     return C
 
@@ -187,61 +438,46 @@ def weighted_normalized_cross_correlation(I1,I2,W1=None,W2=None):
     if np.all(W1==1) and np.all(W1==1): return normalized_cross_corr(I1, I2)
 
     # normalize weighting matrices
-    W1[np.isnan(W1)], W2[np.isnan(W2)] = 0, 0
+    W1 = np.where(np.isnan(W1), 0, W1).astype(np.float64)
+    W2 = np.where(np.isnan(W2), 0, W2).astype(np.float64)
     W1, W2 = np.divide(W1,np.sum(W1)), np.divide(W2,np.sum(W2))
+    I1, I2 = I1.astype(np.float64), I2.astype(np.float64)
+
+    # all sums over the templates are done through summed-area tables or
+    # correlations in the Fourier domain, hence no stacks of templates are
+    # made, and the memory stays within the size of the search space
+    def window_sum(A):
+        return get_window_sums(get_integral_image(A), (m1, n1))
 
     M1,M2 = W1!=0, W2!=0
-    # calculate sample population
-    view_M2 = view_as_windows(M2, (m1, n1), 1)
-    # amount of elements present in each template
-    elem_M2 = np.sum(np.sum(view_M2,axis=-2),axis=-1).astype(np.float64)
-    elem_M1 = np.sum(np.sum(M1)).astype(np.float64)
-
-    view_M1 = np.repeat(np.repeat(M1[np.newaxis, np.newaxis, :],
-                                  view_M2.shape[0], axis=0),
-                        view_M2.shape[1], axis=1)
-    view_M12 = np.logical_and(view_M1, view_M2)
-    # elements that overlap
-    elem_M12 = np.sum(np.sum(view_M12, axis=-2), axis=-1).astype(np.float64)
-    del view_M12, view_M1, view_M2
+    # calculate sample population, amount of elements present in each
+    # template and the elements that overlap
+    elem_M2 = window_sum(M2)
+    elem_M1 = np.sum(M1).astype(np.float64)
+    elem_M12 = np.round(get_valid_correlation(M1.astype(np.float64),
+                                              M2.astype(np.float64)))
 
     # calculate weighted means
-    view_I2 = view_as_windows(I2, (m1,n1), 1)
-    view_W2 = view_as_windows(W2, (m1,n1), 1)
-    (m2,n2,_,_) = view_I2.shape
-
-    wght_mu2 = np.sum(np.sum(np.multiply(view_W2, view_I2),axis=-2),axis=-1)
-    wght_mu2 = np.squeeze(wght_mu2)
+    wght_mu2 = window_sum(W2*I2)
     wght_mu1 = np.sum(W1.flatten()*I1.flatten())
+    sum_view_W2 = window_sum(W2)
+    sum_view_W2 = np.divide(1, sum_view_W2, where=sum_view_W2!=0,
+                            out=np.zeros_like(sum_view_W2))
 
     # calculate weighted co-variances
-    wght_var_1 = np.abs(I1 - wght_mu1)
-    wght_var_W1 = np.multiply(wght_var_1, W1)
-    wght_var_2 = (view_I2 - np.tile(wght_mu2[:,:,np.newaxis,np.newaxis],
-                                    (1,1,m1,n1)))
-    del view_I2
-    sum_view_W2 = np.sum(np.sum(view_W2,
-                                axis=-2), axis=-1)
-    sum_view_W2_stack = np.tile(sum_view_W2[:,:,np.newaxis,np.newaxis],
-                                (1,1,m1,n1))
-    wght_var_W2 = np.divide(
-        np.multiply(view_W2, wght_var_2),
-        sum_view_W2_stack,
-        where=sum_view_W2_stack!=0, out=np.zeros_like(sum_view_W2_stack))
-    del sum_view_W2_stack, view_W2
-    wght_var_W1_stack = np.repeat(np.repeat(wght_var_W1[np.newaxis,np.newaxis,:],
-                                            m2, axis=0), n2, axis=1)
+    wght_var_W1 = np.multiply(np.abs(I1 - wght_mu1), W1)
 
     # put terms together
-    wght_cov_12 = np.sum(np.sum(np.multiply(wght_var_W1_stack,
-                                            wght_var_W2),
-                                axis=-2), axis=-1)
+    wght_cov_12 = get_valid_correlation(wght_var_W1, W2*I2) - \
+        wght_mu2*get_valid_correlation(wght_var_W1, W2)
+    wght_cov_12 *= sum_view_W2
     wght_cov_12 = np.divide(wght_cov_12, elem_M12,
                             where=elem_M12!=0,
                             out=np.zeros_like(elem_M12))
-    del wght_var_W1_stack
 
-    wght_cov_22 = np.sum(np.sum(wght_var_W2**2,axis=-2),axis=-1)
+    wght_cov_22 = window_sum((W2*I2)**2) - \
+        2*wght_mu2*window_sum(W2**2*I2) + wght_mu2**2*window_sum(W2**2)
+    wght_cov_22 *= sum_view_W2**2
     wght_cov_22 = np.divide(wght_cov_22, elem_M2,
                             where=elem_M2>=2,
                             out=np.ones_like(elem_M2))
@@ -257,6 +493,117 @@ def weighted_normalized_cross_correlation(I1,I2,W1=None,W2=None):
     support = elem_M12/(m1*n1)
     return wncc, support
 
+# dense spatial pattern matching, for a collection of posts at once
+def normalized_cross_corr_dense(I1, I2, i1, j1, i2, j2,
+                                temp_radius=7, search_radius=22,
+                                batch_size=1024):
+    """ zero-normalized cross correlation for a collection of posts, where
+    the local means and variances come from summed-area tables, and the
+    numerators are calculated through the Fourier transform of whole stacks
+
+    Parameters
+    ----------
+    I1 : numpy.array, size=(m,n)
+        array with intensities, where the templates are taken from
+    I2 : numpy.array, size=(m,n)
+        array with intensities, where the search spaces are taken from
+    i1, j1 : numpy.array, size=(k,), dtype=integer
+        image coordinates of the template centers in the first array
+    i2, j2 : numpy.array, size=(k,), dtype=integer
+        image coordinates of the search space centers in the second array
+    temp_radius : integer, default=7
+        amount of pixels from the center of the template
+    search_radius : integer, default=22
+        amount of pixels from the center of the search space
+    batch_size : integer, default=1024
+        amount of posts that are processed at once
+
+    Returns
+    -------
+    C : numpy.array, size=(k,2*(search_radius-temp_radius)+1,
+                           2*(search_radius-temp_radius)+1), dtype=float
+        stack of correlation surfaces, range=-1...+1
+
+    See Also
+    --------
+    normalized_cross_corr : the same for a single template pair
+
+    Notes
+    -----
+    The surfaces are the same as given by "normalized_cross_corr", though
+    neighbouring search spaces share their local sums, as these come from the
+    same summed-area table. This table is made for every batch, and only
+    covers the search spaces of that batch. Hence, when the posts are ordered
+    along the rows of the image, the tables span strips of the image.
+    Furthermore, the numerators of a whole batch are computed by one
+    transform, instead of a transform for every template pair.
+
+    The centers should be given for padded arrays, so all templates and
+    search spaces are within the arrays, see
+    .matching_tools.pad_images_and_filter_coord_list
+
+    Example
+    -------
+    >>> import numpy as np
+    >>> I1, I2 = np.random.random((2, 2**8, 2**8))
+    >>> i, j = np.mgrid[32:224:16, 32:224:16]
+    >>> i, j = i.flatten(), j.flatten()
+    >>> C = normalized_cross_corr_dense(I1, I2, i, j, i, j,
+    ...                                 temp_radius=7, search_radius=22)
+    >>> C_0 = normalized_cross_corr(I1[i[0]-7:i[0]+8, j[0]-7:j[0]+8],
+    ...                             I2[i[0]-22:i[0]+23, j[0]-22:j[0]+23])
+    >>> assert np.allclose(C[0], C_0)
+    """
+    assert isinstance(I1, np.ndarray), ('please provide an array')
+    assert isinstance(I2, np.ndarray), ('please provide an array')
+    assert I1.ndim == 2, ('please provide a single band')
+    assert I2.ndim == 2, ('please provide a single band')
+    assert temp_radius <= search_radius, ('given search radius is too small')
+
+    t_size, s_size = 2*temp_radius+1, 2*search_radius+1
+    c_size = s_size - t_size + 1
+    i1, j1 = np.asarray(i1, dtype=int), np.asarray(j1, dtype=int)
+    i2, j2 = np.asarray(i2, dtype=int), np.asarray(j2, dtype=int)
+    view1 = np.lib.stride_tricks.sliding_window_view(I1, (t_size, t_size))
+
+    k = i1.size
+    C = np.zeros((k, c_size, c_size), dtype=np.float64)
+    for start in range(0, k, batch_size):
+        idx = np.arange(start, np.minimum(start+batch_size, k))
+
+        # templates with zero mean
+        T = view1[i1[idx]-temp_radius, j1[idx]-temp_radius].astype(np.float64)
+        T -= np.mean(T, axis=(1, 2), keepdims=True)
+        T_ssd = np.sum(T**2, axis=(1, 2))
+
+        # summed-area tables of the region spanned by the search spaces, the
+        # mean is removed to reduce round-off errors
+        i_ul, j_ul = i2[idx]-search_radius, j2[idx]-search_radius
+        i_min, j_min = np.min(i_ul), np.min(j_ul)
+        I2_sub = I2[i_min:np.max(i_ul)+s_size,
+                    j_min:np.max(j_ul)+s_size].astype(np.float64)
+        I2_sub -= np.mean(I2_sub)
+        S1, S2 = get_integral_image(I2_sub), get_integral_image(I2_sub**2)
+        win_sum = get_window_sums(S1, (t_size, t_size))
+        win_std = get_window_sums(S2, (t_size, t_size)) - \
+            win_sum**2/(t_size**2)
+        win_std = np.sqrt(np.maximum(win_std, 0))
+        i_w, j_w = i_ul-i_min, j_ul-j_min
+
+        # numerators through the circular correlation, which has no overlap
+        # with the wrapped part for the valid positions
+        W = np.lib.stride_tricks.sliding_window_view(
+            I2_sub, (s_size, s_size))[i_w, j_w]
+        num = irfft2(rfft2(W) * np.conj(rfft2(T, s=(s_size, s_size))),
+                     s=(s_size, s_size))[:, :c_size, :c_size]
+
+        denom = np.lib.stride_tricks.sliding_window_view(
+            win_std, (c_size, c_size))[i_w, j_w] * \
+            np.sqrt(T_ssd)[:, np.newaxis, np.newaxis]
+        C[idx] = np.divide(num, denom, where=denom > np.finfo(float).eps,
+                           out=np.zeros_like(num))
+    return C
+
 # weighted sum of differences
 # sum of robust differences, see Li_03
 # least squares matching
\ No newline at end of file
@@ -4,7 +4,8 @@ import numpy as np
 # image processing libraries
 from scipy.optimize import fsolve
 
-from .matching_tools import get_integer_peak_location
+from .matching_tools import \
+    get_integer_peak_location, get_integer_peak_location_batch
 
 def is_estimate_away_from_border(C, i, j, ds=1):
     over_border = (np.abs(i)+ds >= (C.shape[0]+1) // 2) or \
@@ -173,14 +174,14 @@ def get_top_gaussian(C, top=np.array([])):
     di += C.shape[0]//2 # using a central coordinate system
     dj += C.shape[1]//2
 
-    if not is_estimate_away_from_border:
+    if not is_estimate_away_from_border(C, i_int, j_int):
         return 0,0, i_int,j_int
 
     # estimate sub-pixel along each axis
     ddi = (np.log(C[di+1,dj]) - np.log(C[di-1,dj])) / \
-        2*( (2*np.log(C[di,dj])) -np.log(C[di-1,dj]) -np.log(C[di+1,dj]))
+        (2*( (2*np.log(C[di,dj])) -np.log(C[di-1,dj]) -np.log(C[di+1,dj])))
     ddj = (np.log(C[di,dj+1]) - np.log(C[di,dj-1])) / \
-        2*( (2*np.log(C[di,dj])) -np.log(C[di,dj-1]) -np.log(C[di,dj+1]))
+        (2*( (2*np.log(C[di,dj])) -np.log(C[di,dj-1]) -np.log(C[di,dj+1])))
 
     return ddi,ddj, i_int,j_int
 
@@ -220,7 +221,7 @@ def get_top_centroid(C, top=np.array([])):
     di += C.shape[0]//2 # using a central coordinate system
     dj += C.shape[1]//2
 
-    if not is_estimate_away_from_border:
+    if not is_estimate_away_from_border(C, i_int, j_int):
         return 0,0, i_int,j_int
 
     # estimate sub-pixel along each axis
@@ -270,7 +271,7 @@ def get_top_mass(C, top=np.array([])):
     di += C.shape[0]//2 # using a central coordinate system
     dj += C.shape[1]//2
 
-    if not is_estimate_away_from_border: # estimate sub-pixel along each axis
+    if not is_estimate_away_from_border(C, i_int, j_int):
         return 0,0, i_int,j_int
 
     ddi = (C[di+1,dj] - C[di-1,dj]) / \
@@ -316,7 +317,7 @@ def get_top_blais(C, top=np.array([])):
     di += C.shape[0]//2 # using a central coordinate system
     dj += C.shape[1]//2
 
-    if not is_estimate_away_from_border:
+    if not is_estimate_away_from_border(C, i_int, j_int, ds=3):
         return 0,0, i_int,j_int
 
     # estimate sub-pixel along each axis
@@ -378,14 +379,14 @@ def get_top_parabolic(C, top=np.array([])):
     di += C.shape[0]//2 # using a central coordinate system
     dj += C.shape[1]//2
 
-    if not is_estimate_away_from_border:
+    if not is_estimate_away_from_border(C, i_int, j_int):
         return 0,0, i_int,j_int
 
     # estimate sub-pixel along each axis
     ddi = (C[di+1,dj] - C[di-1,dj]) / \
-        2*( (2*C[di,dj]) -C[di-1,dj] -C[di+1,dj])
+        (2*( (2*C[di,dj]) -C[di-1,dj] -C[di+1,dj]))
     ddj = (C[di,dj+1] - C[di,dj-1]) / \
-        2*( (2*C[di,dj]) -C[di,dj-1] -C[di,dj+1])
+        (2*( (2*C[di,dj]) -C[di,dj-1] -C[di,dj+1]))
 
     return ddi,ddj, i_int,j_int
 
@@ -426,18 +427,18 @@ def get_top_equiangular(C, top=np.array([])):
     di += C.shape[0]//2 # using a central coordinate system
     dj += C.shape[1]//2
 
-    if not is_estimate_away_from_border: # estimate sub-pixel along each axis
+    if not is_estimate_away_from_border(C, i_int, j_int):
         return 0,0, i_int,j_int
     # estimate sub-pixel along each axis
     if C[di+1,dj]<C[di-1,dj]:
-        ddi = .5* (C[di+1,dj]-C[di-1,dj])/(C[di,dj]-C[di-1,dj])
-    else:
         ddi = .5* (C[di+1,dj]-C[di-1,dj])/(C[di,dj]-C[di+1,dj])
+    else:
+        ddi = .5* (C[di+1,dj]-C[di-1,dj])/(C[di,dj]-C[di-1,dj])
 
     if C[di,dj+1]<C[di,dj-1]:
-        ddj = .5* (C[di,dj+1]-C[di,dj-1])/(C[di,dj]-C[di,dj-1])
-    else:
         ddj = .5* (C[di,dj+1]-C[di,dj-1])/(C[di,dj]-C[di,dj+1])
+    else:
+        ddj = .5* (C[di,dj+1]-C[di,dj-1])/(C[di,dj]-C[di,dj-1])
 
     return ddi,ddj, i_int,j_int
 
@@ -477,7 +478,7 @@ def get_top_birchfield(C, top=np.array([])):
     di += C.shape[0]//2 # using a central coordinate system
     dj += C.shape[1]//2
 
-    if not is_estimate_away_from_border: # estimate sub-pixel along each axis
+    if not is_estimate_away_from_border(C, i_int, j_int):
         return 0,0, i_int,j_int
 
     # estimate sub-pixel along each axis
@@ -530,7 +531,7 @@ def get_top_ren(C, top=np.array([])):
     di += C.shape[0]//2 # using a central coordinate system
     dj += C.shape[1]//2
 
-    if not is_estimate_away_from_border:
+    if not is_estimate_away_from_border(C, i_int, j_int):
         return 0, 0, i_int, j_int
 
     # estimate sub-pixel along each axis
@@ -577,7 +578,7 @@ def get_top_triangular(C, top=np.array([])):
     di += C.shape[0]//2 # using a central coordinate system
     dj += C.shape[1]//2
 
-    if not is_estimate_away_from_border:
+    if not is_estimate_away_from_border(C, i_int, j_int):
         return 0, 0, i_int, j_int
 
     # estimate sub-pixel along each axis
@@ -629,30 +630,24 @@ def get_top_esinc(C, ds=1, top=np.array([])):
     di += C.shape[0]//2 # using a central coordinate system
     dj += C.shape[1]//2
 
-    if not is_estimate_away_from_border:
+    if not is_estimate_away_from_border(C, i_int, j_int):
         return 0, 0, i_int, j_int
 
     # estimate sub-pixel per axis
     Cj = C[di,dj-ds:dj+ds+1].ravel()
     def funcJ(x):
         a, b, c = x
-        return [(Cj[0] - a*np.exp(-(b*(-1-c))**2)* \
-                 ( np.sin(np.pi*(-1-c))/ np.pi*(-1-c)) )**2,
-                (Cj[1] - a*np.exp(-(b*(+0-c))**2)* \
-                 ( np.sin(np.pi*(+0-c))/ np.pi*(+0-c)) )**2,
-                (Cj[2] - a*np.exp(-(b*(+1-c))**2)* \
-                 ( np.sin(np.pi*(+1-c))/ np.pi*(+1-c)) )**2]
+        return [(Cj[0] - a*np.exp(-(b*(-1-c))**2)*np.sinc(-1-c))**2,
+                (Cj[1] - a*np.exp(-(b*(+0-c))**2)*np.sinc(+0-c))**2,
+                (Cj[2] - a*np.exp(-(b*(+1-c))**2)*np.sinc(+1-c))**2]
     _,_,jC = fsolve(funcJ, (1.0, 1.0, 0.1))
 
     Ci = C[di-ds:di+ds+1,dj].ravel()
     def funcI(x):
         a, b, c = x
-        return [(Ci[0] - a*np.exp(-(b*(-1-c))**2)*
-                 ( np.sin(np.pi*(-1-c))/ np.pi*(-1-c)) )**2,
-                (Ci[1] - a*np.exp(-(b*(+0-c))**2)*
-                 ( np.sin(np.pi*(+0-c))/ np.pi*(+0-c)) )**2,
-                (Ci[2] - a*np.exp(-(b*(+1-c))**2)*
-                 ( np.sin(np.pi*(+1-c))/ np.pi*(+1-c)) )**2]
+        return [(Ci[0] - a*np.exp(-(b*(-1-c))**2)*np.sinc(-1-c))**2,
+                (Ci[1] - a*np.exp(-(b*(+0-c))**2)*np.sinc(+0-c))**2,
+                (Ci[2] - a*np.exp(-(b*(+1-c))**2)*np.sinc(+1-c))**2]
     _,_,iC = fsolve(funcI, (1.0, 1.0, 0.1))
 
     return iC,jC, i_int,j_int
@@ -698,7 +693,7 @@ def get_top_2d_gaussian(C, top=np.array([])):
     di += C.shape[0]//2 # using a central coordinate system
     dj += C.shape[1]//2
 
-    if not is_estimate_away_from_border:
+    if not is_estimate_away_from_border(C, i_int, j_int):
         return 0,0, i_int,j_int
 
     # estimate sub-pixel along both axis
@@ -755,24 +750,580 @@ def get_top_paraboloid(C, top=np.array([])):
     di += C.shape[0]//2 # using a central coordinate system
     dj += C.shape[1]//2
 
-    if not is_estimate_away_from_border:
+    if not is_estimate_away_from_border(C, i_int, j_int):
         return 0, 0, i_int, j_int
 
-    # estimate sub-pixel per axis
+    # fit a paraboloid through the peak, its four neighbours and its highest
+    # diagonal neighbour
     a_1 = C[di+0,dj+0]
     a_2,a_3 = C[di+1,dj+0], C[di-1,dj+0]
-    a_4,a_5 = C[di+1,dj+0], C[di-1,dj+0]
+    a_4,a_5 = C[di+0,dj+1], C[di+0,dj-1]
 
-    a_6 = np.max(np.array([C[di+1,dj+1], C[di-1,dj+1], \
-                          C[di+1,dj-1], C[di-1,dj-1]]))
+    s_i, s_j = np.array([+1, -1, +1, -1]), np.array([+1, +1, -1, -1])
+    idx = np.argmax(C[di+s_i,dj+s_j])
+    a_6, s_i, s_j = C[di+s_i[idx],dj+s_j[idx]], s_i[idx], s_j[idx]
 
-    a = a_6 + a_1 - a_2 - a_4
-    b = a_4 + a_5 - a_1 - a_1
-    c = a_2 + a_3 - a_1 - a_1
+    b_i, b_j = (a_2-a_3)/2, (a_4-a_5)/2
+    c_ii, c_jj = (a_2+a_3)/2 - a_1, (a_4+a_5)/2 - a_1
+    c_ij = (a_6 - a_1 - b_i*s_i - b_j*s_j - c_ii - c_jj) * s_i*s_j
 
-    ddj = (-a*(a_4-a_5) + b*(a_2-a_3)) / \
-        ((2*a*a) - (2*b*c))
-    ddi = (-a*(a_2-a_3) + b*(a_4-a_5)) / \
-        ((2*a*a) - (2*b*c))
+    ddi = ((c_ij*b_j) - (2*c_jj*b_i)) / ((4*c_ii*c_jj) - (c_ij**2))
+    ddj = ((c_ij*b_i) - (2*c_ii*b_j)) / ((4*c_ii*c_jj) - (c_ij**2))
 
     return ddi,ddj, i_int,j_int
+
+# batched sub-pixel localization, working on stacks of correlation surfaces
+def is_estimate_away_from_border_batch(C, i, j, ds=1):
+    """ check if the neighbourhoods of the peaks are within the surfaces
+
+    Parameters
+    ----------
+    C : numpy.array, size=(k,m,n)
+        stack of similarity surfaces
+    i, j : numpy.array, size=(k,), dtype=integer
+        location of the peaks, with regard to the center of the surfaces
+    ds : integer, default=1
+        radius of the neighbourhood
+
+    Returns
+    -------
+    IN : numpy.array, size=(k,), dtype=bool
+        the neighbourhood is within the surface
+
+    See Also
+    --------
+    is_estimate_away_from_border : the same for a single surface
+    """
+    return np.logical_and(np.abs(i)+ds < (C.shape[1]+1) // 2,
+                          np.abs(j)+ds < (C.shape[2]+1) // 2)
+
+def get_peak_neighbourhood_batch(C, i, j, ds=1):
+    """ get the neighbourhoods around the peaks of a stack of surfaces
+
+    Parameters
+    ----------
+    C : numpy.array, size=(k,m,n)
+        stack of similarity surfaces
+    i, j : numpy.array, size=(k,), dtype=integer
+        location of the peaks, with regard to the center of the surfaces
+    ds : integer, default=1
+        radius of the neighbourhood
+
+    Returns
+    -------
+    Csub : numpy.array, size=(k,2*ds+1,2*ds+1)
+        neighbourhoods, where the peak is at the center. Neighbours outside
+        the surface are taken from its border, see also
+        "is_estimate_away_from_border_batch"
+    """
+    (k, m, n) = C.shape
+    i_sub = np.clip(m//2 + i[:, np.newaxis] + np.arange(-ds, +ds+1), 0, m-1)
+    j_sub = np.clip(n//2 + j[:, np.newaxis] + np.arange(-ds, +ds+1), 0, n-1)
+    Csub = C[np.arange(k)[:, np.newaxis, np.newaxis],
+             i_sub[:, :, np.newaxis], j_sub[:, np.newaxis, :]]
+    return Csub
+
+def get_top_moment_batch(C, ds=1, top=np.array([])):
+    """ find location of highest score through the moment of the peak, for a
+    stack of similarity surfaces
+
+    Parameters
+    ----------
+    C : numpy.array, size=(k,m,n)
+        stack of similarity surfaces
+    ds : integer, default=1
+        size of the radius to use neighboring information
+    top : numpy.array, size=(k,2), dtype=integer
+        location of the maximum score of each surface
+
+    Returns
+    -------
+    ddi, ddj : numpy.array, size=(k,), dtype=float
+        estimated subpixel location of the peaks
+    i_int, j_int : numpy.array, size=(k,), dtype=integer
+        location of highest score
+
+    See Also
+    --------
+    get_top_moment : the same for a single surface
+    """
+    if top.size == 0:  # find highest score
+        di, dj, _, _ = get_integer_peak_location_batch(C)
+    else:
+        di, dj = top[:, 0].astype(int), top[:, 1].astype(int)
+    IN = is_estimate_away_from_border_batch(C, di, dj, ds)
+    (subJ, subI) = np.meshgrid(np.linspace(-ds, +ds, 2*ds+1),
+                               np.linspace(-ds, +ds, 2*ds+1))
+    subI, subJ = subI.ravel(), subJ.ravel()
+    idx_mid = int(np.floor((2.*ds+1)**2/2))
+
+    Csub = get_peak_neighbourhood_batch(C, di, dj, ds).reshape(di.size, -1)
+    Csub = Csub - (np.sum(Csub, axis=1, keepdims=True) -
+                   Csub[:, idx_mid, np.newaxis]) / (Csub.shape[1]-1)
+    Csub = np.where(Csub > 0, Csub, 0)
+
+    C_sum = np.sum(Csub, axis=1)
+    ddi, ddj = np.divide(Csub @ subI, C_sum), np.divide(Csub @ subJ, C_sum)
+    ddi, ddj = np.where(IN, ddi, 0), np.where(IN, ddj, 0)
+    return ddi, ddj, di, dj
+
+def get_top_1d_batch(C, top=np.array([]), ds=1):
+    """ get the neighbours along each axis, around the peaks of a stack of
+    similarity surfaces, as used by the one dimensional estimators
+
+    Parameters
+    ----------
+    C : numpy.array, size=(k,m,n)
+        stack of similarity surfaces
+    top : numpy.array, size=(k,2), dtype=integer
+        location of the maximum score of each surface
+    ds : integer, default=1
+        amount of neighbours on each side
+
+    Returns
+    -------
+    C_i, C_j : numpy.array, size=(k,2*ds+1), dtype=float
+        scores along the vertical and horizontal axis, centered at the peak
+    IN : numpy.array, size=(k,), dtype=bool
+        the neighbourhood is within the surface
+    di, dj : numpy.array, size=(k,), dtype=integer
+        location of highest score
+    """
+    if top.size == 0:  # find highest score
+        di, dj, _, _ = get_integer_peak_location_batch(C)
+    else:
+        di, dj = top[:, 0].astype(int), top[:, 1].astype(int)
+    IN = is_estimate_away_from_border_batch(C, di, dj, ds)
+    Csub = get_peak_neighbourhood_batch(C, di, dj, ds)
+    C_i, C_j = Csub[:, :, ds], Csub[:, ds, :]
+    return C_i, C_j, IN, di, dj
+
+def get_top_gaussian_batch(C, top=np.array([])):
+    """ find location of highest score through 1D gaussian fit, for a stack of
+    similarity surfaces
+
+    Parameters
+    ----------
+    C : numpy.array, size=(k,m,n)
+        stack of similarity surfaces
+    top : numpy.array, size=(k,2), dtype=integer
+        location of the maximum score of each surface
+
+    Returns
+    -------
+    ddi, ddj : numpy.array, size=(k,), dtype=float
+        estimated subpixel location of the peaks
+    i_int, j_int : numpy.array, size=(k,), dtype=integer
+        location of highest score
+
+    See Also
+    --------
+    get_top_gaussian : the same for a single surface
+    """
+    C_i, C_j, IN, di, dj = get_top_1d_batch(C, top)
+    L_i, L_j = np.log(C_i), np.log(C_j)
+    ddi = (L_i[:, 2] - L_i[:, 0]) / (2*(2*L_i[:, 1] - L_i[:, 0] - L_i[:, 2]))
+    ddj = (L_j[:, 2] - L_j[:, 0]) / (2*(2*L_j[:, 1] - L_j[:, 0] - L_j[:, 2]))
+    ddi, ddj = np.where(IN, ddi, 0), np.where(IN, ddj, 0)
+    return ddi, ddj, di, dj
+
+def get_top_centroid_batch(C, top=np.array([])):
+    """ find location of highest score through 1D centroid fit, for a stack of
+    similarity surfaces
+
+    Parameters
+    ----------
+    C : numpy.array, size=(k,m,n)
+        stack of similarity surfaces
+    top : numpy.array, size=(k,2), dtype=integer
+        location of the maximum score of each surface
+
+    Returns
+    -------
+    ddi, ddj : numpy.array, size=(k,), dtype=float
+        estimated subpixel location of the peaks
+    i_int, j_int : numpy.array, size=(k,), dtype=integer
+        location of highest score
+
+    See Also
+    --------
+    get_top_centroid : the same for a single surface
+    """
+    C_i, C_j, IN, di, dj = get_top_1d_batch(C, top)
+    ddi = (C_i @ np.array([-1., 0., +1.])) / np.sum(C_i, axis=1)
+    ddj = (C_j @ np.array([-1., 0., +1.])) / np.sum(C_j, axis=1)
+    ddi, ddj = np.where(IN, ddi, 0), np.where(IN, ddj, 0)
+    return ddi, ddj, di, dj
+
+def get_top_mass_batch(C, top=np.array([])):
+    """ find location of highest score through 1D center of mass, for a stack
+    of similarity surfaces
+
+    Parameters
+    ----------
+    C : numpy.array, size=(k,m,n)
+        stack of similarity surfaces
+    top : numpy.array, size=(k,2), dtype=integer
+        location of the maximum score of each surface
+
+    Returns
+    -------
+    ddi, ddj : numpy.array, size=(k,), dtype=float
+        estimated subpixel location of the peaks
+    i_int, j_int : numpy.array, size=(k,), dtype=integer
+        location of highest score
+
+    See Also
+    --------
+    get_top_mass : the same for a single surface
+    """
+    C_i, C_j, IN, di, dj = get_top_1d_batch(C, top)
+    ddi = (C_i[:, 2] - C_i[:, 0]) / np.sum(C_i, axis=1)
+    ddj = (C_j[:, 2] - C_j[:, 0]) / np.sum(C_j, axis=1)
+    ddi, ddj = np.where(IN, ddi, 0), np.where(IN, ddj, 0)
+    return ddi, ddj, di, dj
+
+def get_top_blais_batch(C, top=np.array([])):
+    """ find location of highest score through forth order filter, for a stack
+    of similarity surfaces
+
+    Parameters
+    ----------
+    C : numpy.array, size=(k,m,n)
+        stack of similarity surfaces
+    top : numpy.array, size=(k,2), dtype=integer
+        location of the maximum score of each surface
+
+    Returns
+    -------
+    ddi, ddj : numpy.array, size=(k,), dtype=float
+        estimated subpixel location of the peaks
+    i_int, j_int : numpy.array, size=(k,), dtype=integer
+        location of highest score
+
+    See Also
+    --------
+    get_top_blais : the same for a single surface
+    """
+    def blais_along_axis(V):
+        # V has the neighbours at -3...+3, thus the peak is at position 3
+        g_0 = V[:, 1] + V[:, 2] - V[:, 4] - V[:, 5]
+        g_p = V[:, 2] + V[:, 3] - V[:, 5] - V[:, 6]
+        g_m = V[:, 0] + V[:, 1] - V[:, 3] - V[:, 4]
+        return np.where(V[:, 4] > V[:, 2],
+                        g_0/(g_0 - g_p), (g_m/(g_m - g_0)) - 1)
+
+    C_i, C_j, IN, di, dj = get_top_1d_batch(C, top, ds=3)
+    ddi, ddj = blais_along_axis(C_i), blais_along_axis(C_j)
+    ddi, ddj = np.where(IN, ddi, 0), np.where(IN, ddj, 0)
+    return ddi, ddj, di, dj
+
+def get_top_parabolic_batch(C, top=np.array([])):
+    """ find location of highest score through 1D parabolic fit, for a stack
+    of similarity surfaces
+
+    Parameters
+    ----------
+    C : numpy.array, size=(k,m,n)
+        stack of similarity surfaces
+    top : numpy.array, size=(k,2), dtype=integer
+        location of the maximum score of each surface
+
+    Returns
+    -------
+    ddi, ddj : numpy.array, size=(k,), dtype=float
+        estimated subpixel location of the peaks
+    i_int, j_int : numpy.array, size=(k,), dtype=integer
+        location of highest score
+
+    See Also
+    --------
+    get_top_parabolic : the same for a single surface
+    """
+    C_i, C_j, IN, di, dj = get_top_1d_batch(C, top)
+    ddi = (C_i[:, 2] - C_i[:, 0]) / (2*(2*C_i[:, 1] - C_i[:, 0] - C_i[:, 2]))
+    ddj = (C_j[:, 2] - C_j[:, 0]) / (2*(2*C_j[:, 1] - C_j[:, 0] - C_j[:, 2]))
+    ddi, ddj = np.where(IN, ddi, 0), np.where(IN, ddj, 0)
+    return ddi, ddj, di, dj
+
+def get_top_equiangular_batch(C, top=np.array([])):
+    """ find location of highest score along each axis by equiangular line,
+    for a stack of similarity surfaces
+
+    Parameters
+    ----------
+    C : numpy.array, size=(k,m,n)
+        stack of similarity surfaces
+    top : numpy.array, size=(k,2), dtype=integer
+        location of the maximum score of each surface
+
+    Returns
+    -------
+    ddi, ddj : numpy.array, size=(k,), dtype=float
+        estimated subpixel location of the peaks
+    i_int, j_int : numpy.array, size=(k,), dtype=integer
+        location of highest score
+
+    See Also
+    --------
+    get_top_equiangular : the same for a single surface
+    """
+    def equiangular_along_axis(V):
+        V_low = np.minimum(V[:, 0], V[:, 2])
+        return .5 * (V[:, 2] - V[:, 0]) / (V[:, 1] - V_low)
+
+    C_i, C_j, IN, di, dj = get_top_1d_batch(C, top)
+    ddi, ddj = equiangular_along_axis(C_i), equiangular_along_axis(C_j)
+    ddi, ddj = np.where(IN, ddi, 0), np.where(IN, ddj, 0)
+    return ddi, ddj, di, dj
+
+def get_top_birchfield_batch(C, top=np.array([])):
+    """ find location of highest score along each axis, for a stack of
+    similarity surfaces
+
+    Parameters
+    ----------
+    C : numpy.array, size=(k,m,n)
+        stack of similarity surfaces
+    top : numpy.array, size=(k,2), dtype=integer
+        location of the maximum score of each surface
+
+    Returns
+    -------
+    ddi, ddj : numpy.array, size=(k,), dtype=float
+        estimated subpixel location of the peaks
+    i_int, j_int : numpy.array, size=(k,), dtype=integer
+        location of highest score
+
+    See Also
+    --------
+    get_top_birchfield : the same for a single surface
+    """
+    def birchfield_along_axis(V):
+        I_m, I_p = .5*(V[:, 0] + V[:, 1]), .5*(V[:, 2] + V[:, 1])
+        I_min = np.minimum(np.minimum(I_m, I_p), V[:, 1])
+        I_max = np.maximum(np.maximum(I_m, I_p), V[:, 1])
+        # swapped, since Birchfield uses dissimilarity
+        return np.maximum(np.maximum(0, I_max - V[:, 1]), V[:, 1] - I_min)
+
+    C_i, C_j, IN, di, dj = get_top_1d_batch(C, top)
+    ddi, ddj = birchfield_along_axis(C_i), birchfield_along_axis(C_j)
+    ddi, ddj = np.where(IN, ddi, 0), np.where(IN, ddj, 0)
+    return ddi, ddj, di, dj
+
+def get_top_ren_batch(C, top=np.array([])):
+    """ find location of highest score, for a stack of similarity surfaces
+
+    Parameters
+    ----------
+    C : numpy.array, size=(k,m,n)
+        stack of similarity surfaces
+    top : numpy.array, size=(k,2), dtype=integer
+        location of the maximum score of each surface
+
+    Returns
+    -------
+    ddi, ddj : numpy.array, size=(k,), dtype=float
+        estimated subpixel location of the peaks
+    i_int, j_int : numpy.array, size=(k,), dtype=integer
+        location of highest score
+
+    See Also
+    --------
+    get_top_ren : the same for a single surface
+    """
+    C_i, C_j, IN, di, dj = get_top_1d_batch(C, top)
+    D_i, D_j = C_i[:, 2] - C_i[:, 0], C_j[:, 2] - C_j[:, 0]
+    ddi = np.sign(D_i) / (1 + (C_i[:, 1] / np.abs(D_i)))
+    ddj = np.sign(D_j) / (1 + (C_j[:, 1] / np.abs(D_j)))
+    ddi, ddj = np.where(IN, ddi, 0), np.where(IN, ddj, 0)
+    return ddi, ddj, di, dj
+
+def get_top_triangular_batch(C, top=np.array([])):
+    """ find location of highest score through triangular fit, for a stack of
+    similarity surfaces
+
+    Parameters
+    ----------
+    C : numpy.array, size=(k,m,n)
+        stack of similarity surfaces
+    top : numpy.array, size=(k,2), dtype=integer
+        location of the maximum score of each surface
+
+    Returns
+    -------
+    ddi, ddj : numpy.array, size=(k,), dtype=float
+        estimated subpixel location of the peaks
+    i_int, j_int : numpy.array, size=(k,), dtype=integer
+        location of highest score
+
+    See Also
+    --------
+    get_top_triangular : the same for a single surface
+    """
+    def triangular_along_axis(V):
+        I_min = np.minimum(V[:, 0], V[:, 2])
+        I_max = np.maximum(V[:, 0], V[:, 2])
+        I_sign = 2*(V[:, 2] > V[:, 0]) - 1
+        return I_sign * (1 - (I_max - I_min)/(V[:, 1] - I_min))
+
+    C_i, C_j, IN, di, dj = get_top_1d_batch(C, top)
+    ddi, ddj = triangular_along_axis(C_i), triangular_along_axis(C_j)
+    ddi, ddj = np.where(IN, ddi, 0), np.where(IN, ddj, 0)
+    return ddi, ddj, di, dj
+
+def get_top_esinc_batch(C, ds=1, top=np.array([]), n_grid=101):
+    """ find location of highest score using exponential esinc function, for
+    a stack of similarity surfaces
+
+    Parameters
+    ----------
+    C : numpy.array, size=(k,m,n)
+        stack of similarity surfaces
+    ds : integer, default=1
+        amount of neighbours on each side
+    top : numpy.array, size=(k,2), dtype=integer
+        location of the maximum score of each surface
+    n_grid : integer, default=101
+        amount of candidate locations within [-.5, +.5]
+
+    Returns
+    -------
+    ddi, ddj : numpy.array, size=(k,), dtype=float
+        estimated subpixel location of the peaks
+    i_int, j_int : numpy.array, size=(k,), dtype=integer
+        location of highest score
+
+    See Also
+    --------
+    get_top_esinc : the same for a single surface
+
+    Notes
+    -----
+    The function a*exp(-(b*(x-c))**2)*sinc(x-c) is fitted in a least squares
+    sense. For given width "b" and location "c" the amplitude "a" has a closed
+    form, hence the best fitting location is found on a grid of candidates
+    for all surfaces at once, and refined by parabolic interpolation.
+    """
+    x = np.arange(-ds, +ds+1)
+    b_grid = np.linspace(0, 2, 21)
+    c_grid = np.linspace(-.5, +.5, n_grid)
+    c_step = c_grid[1] - c_grid[0]
+    B, Cc = np.meshgrid(b_grid, c_grid, indexing='ij')
+    B, Cc = B.ravel(), Cc.ravel()
+    F = np.exp(-(B[:, np.newaxis]*(x - Cc[:, np.newaxis]))**2) * \
+        np.sinc(x - Cc[:, np.newaxis])
+
+    def esinc_along_axis(V):
+        # residual of the least squares fit, with an optimal amplitude
+        VF = V @ F.T
+        R = np.sum(V**2, axis=1, keepdims=True) - \
+            VF**2 / np.sum(F**2, axis=1)
+        R = R.reshape(V.shape[0], b_grid.size, c_grid.size)
+        ib, ic = np.unravel_index(np.argmin(R.reshape(V.shape[0], -1),
+                                            axis=1), R.shape[1:])
+        k = np.arange(V.shape[0])
+        r_m = R[k, ib, np.maximum(ic-1, 0)]
+        r_0 = R[k, ib, ic]
+        r_p = R[k, ib, np.minimum(ic+1, c_grid.size-1)]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            dc = (r_m - r_p) / (2*(r_m - 2*r_0 + r_p))
+        dc = np.clip(np.nan_to_num(dc), -.5, +.5)
+        return c_grid[ic] + dc*c_step
+
+    C_i, C_j, IN, di, dj = get_top_1d_batch(C, top, ds=ds)
+    ddi, ddj = esinc_along_axis(C_i), esinc_along_axis(C_j)
+    ddi, ddj = np.where(IN, ddi, 0), np.where(IN, ddj, 0)
+    return ddi, ddj, di, dj
+
+def get_top_2d_gaussian_batch(C, top=np.array([])):
+    """ find location of highest score using 2D Gaussian, for a stack of
+    similarity surfaces
+
+    Parameters
+    ----------
+    C : numpy.array, size=(k,m,n)
+        stack of similarity surfaces
+    top : numpy.array, size=(k,2), dtype=integer
+        location of the maximum score of each surface
+
+    Returns
+    -------
+    ddi, ddj : numpy.array, size=(k,), dtype=float
+        estimated subpixel location of the peaks
+    i_int, j_int : numpy.array, size=(k,), dtype=integer
+        location of highest score
+
+    See Also
+    --------
+    get_top_2d_gaussian : the same for a single surface
+    """
+    if top.size == 0:  # find highest score
+        di, dj, _, _ = get_integer_peak_location_batch(C)
+    else:
+        di, dj = top[:, 0].astype(int), top[:, 1].astype(int)
+    IN = is_estimate_away_from_border_batch(C, di, dj)
+
+    (Jsub, Isub) = np.meshgrid(np.linspace(-1, +1, 3), np.linspace(-1, +1, 3))
+    Isub, Jsub = Isub.ravel(), Jsub.ravel()
+    Clog = np.log(get_peak_neighbourhood_batch(C, di, dj).reshape(di.size, -1))
+
+    # estimate sub-pixel per axis, all at once
+    c_10 = (1/6)*(Clog @ Isub)
+    c_01 = (1/6)*(Clog @ Jsub)
+    c_11 = (1/4)*(Clog @ (Isub*Jsub))
+    c_20 = (1/6)*(Clog @ ((3*Isub**2) - 2))
+    c_02 = (1/6)*(Clog @ ((3*Jsub**2) - 2))
+
+    ddj = ((c_11*c_10)-(2*c_01*c_20))/((4*c_20*c_02)-(c_11**2))
+    ddi = ((c_11*c_01)-(2*c_10*c_02))/((4*c_20*c_02)-(c_11**2))
+    ddi, ddj = np.where(IN, ddi, 0), np.where(IN, ddj, 0)
+    return ddi, ddj, di, dj
+
+def get_top_paraboloid_batch(C, top=np.array([])):
+    """ find location of highest score using paraboloid, for a stack of
+    similarity surfaces
+
+    Parameters
+    ----------
+    C : numpy.array, size=(k,m,n)
+        stack of similarity surfaces
+    top : numpy.array, size=(k,2), dtype=integer
+        location of the maximum score of each surface
+
+    Returns
+    -------
+    ddi, ddj : numpy.array, size=(k,), dtype=float
+        estimated subpixel location of the peaks
+    i_int, j_int : numpy.array, size=(k,), dtype=integer
+        location of highest score
+
+    See Also
+    --------
+    get_top_paraboloid : the same for a single surface
+    """
+    if top.size == 0:  # find highest score
+        di, dj, _, _ = get_integer_peak_location_batch(C)
+    else:
+        di, dj = top[:, 0].astype(int), top[:, 1].astype(int)
+    IN = is_estimate_away_from_border_batch(C, di, dj)
+    Csub = get_peak_neighbourhood_batch(C, di, dj)
+
+    a_1 = Csub[:, 1, 1]
+    a_2, a_3 = Csub[:, 2, 1], Csub[:, 0, 1]
+    a_4, a_5 = Csub[:, 1, 2], Csub[:, 1, 0]
+
+    # highest diagonal neighbour
+    s_i, s_j = np.array([+1, -1, +1, -1]), np.array([+1, +1, -1, -1])
+    idx = np.argmax(Csub[:, 1+s_i, 1+s_j], axis=1)
+    a_6 = Csub[np.arange(di.size), 1+s_i[idx], 1+s_j[idx]]
+    s_i, s_j = s_i[idx], s_j[idx]
+
+    b_i, b_j = (a_2-a_3)/2, (a_4-a_5)/2
+    c_ii, c_jj = (a_2+a_3)/2 - a_1, (a_4+a_5)/2 - a_1
+    c_ij = (a_6 - a_1 - b_i*s_i - b_j*s_j - c_ii - c_jj) * s_i*s_j
+
+    ddi = ((c_ij*b_j) - (2*c_jj*b_i)) / ((4*c_ii*c_jj) - (c_ij**2))
+    ddj = ((c_ij*b_i) - (2*c_ii*b_j)) / ((4*c_ii*c_jj) - (c_ij**2))
+    ddi, ddj = np.where(IN, ddi, 0), np.where(IN, ddj, 0)
+    return ddi, ddj, di, dj